@@ -1,3 +1,7 @@
 from makros.makros import Makros
 from makros.parser import MakroParser
+from makros.report import BuildReport
 from makros.functions import *
+from makros.importer import install_import_hook, uninstall_import_hook
+from makros.runner import run_file
+from makros.registration.archive import build_archive
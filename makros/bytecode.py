@@ -0,0 +1,75 @@
+import importlib.util
+import marshal
+import sys
+from types import CodeType
+from typing import Optional
+
+# The flags of a hash based pyc (PEP 552). The first bit marks the file as hash
+# based and the second tells python to check the hash against the source
+_HASH_BASED = 0b01
+_CHECK_SOURCE = 0b10
+
+_HEADER_SIZE = 16
+
+
+def code_to_hash_pyc(code: CodeType,
+                     source_hash: bytes,
+                     checked: bool = True) -> bytes:
+    """Serializes a code object into a hash based pyc file (PEP 552), which is
+    only valid for as long as the source has the same hash
+
+    Args:
+        code (CodeType): The compiled module
+        source_hash (bytes): The hash of the source, from ``importlib.util.source_hash``
+        checked (bool, optional): If python should check the hash every time the module is imported. Defaults to True.
+
+    Returns:
+        bytes: The contents of the pyc file
+    """
+
+    flags = _HASH_BASED | (_CHECK_SOURCE if checked else 0)
+
+    return (importlib.util.MAGIC_NUMBER + flags.to_bytes(4, 'little') +
+            source_hash + marshal.dumps(code))
+
+
+def hash_pyc_to_code(data: bytes, source_hash: bytes) -> Optional[CodeType]:
+    """Reads a code object from a hash based pyc file, as long as it was
+    written by this version of python for a source with the provided hash
+
+    Args:
+        data (bytes): The contents of the pyc file
+        source_hash (bytes): The hash of the source as it is now
+
+    Returns:
+        Optional[CodeType]: The compiled module, or None if the file is out of date or is not a hash based pyc
+    """
+
+    if len(data) < _HEADER_SIZE or data[:4] != importlib.util.MAGIC_NUMBER:
+        return None
+
+    flags = int.from_bytes(data[4:8], 'little')
+    if not flags & _HASH_BASED or data[8:16] != source_hash:
+        return None
+
+    try:
+        code = marshal.loads(data[_HEADER_SIZE:])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+    return code if isinstance(code, CodeType) else None
+
+
+def optimization_tag(prefix: str = '') -> str:
+    """The optimization tag that is part of the name of a pyc file, which
+    changes with the ``-O`` flag. See ``importlib.util.cache_from_source``
+
+    Args:
+        prefix (str, optional): Something to mark the file as different from a normal pyc, e.g. 'makros'. Defaults to ''.
+
+    Returns:
+        str: The tag, which may be empty
+    """
+
+    optimize = sys.flags.optimize
+    return prefix + (str(optimize) if optimize else '')
@@ -0,0 +1,248 @@
+import hashlib
+import os
+import sys
+import warnings
+from pathlib import Path
+from typing import Iterable, Optional
+
+from makros.registration.macro_def import MacroDef
+from makros.utils import file_fingerprint, write_atomic
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+"""The default size limit of the cache, in bytes
+"""
+
+# The files that decide what the output of a translation looks like. Their
+# contents are part of every key, so a development checkout of makros will
+# never be handed output from a different version of the parser. The helpers
+# that built-in macros generate code with count as well, as only the macros'
+# own files are part of the key
+_CORE_FILES = [
+    'emitter.py', 'parser.py', 'scope.py', 'splice.py', 'tokens.py',
+    'macros/pyast.py', 'macros/pyx.py'
+]
+
+_makros_version: Optional[str] = None
+
+
+def makros_version() -> str:
+    """The version of makros, combined with a hash of the files that produce its
+    output
+
+    Returns:
+        str: A string that changes whenever the output of makros might change
+    """
+
+    global _makros_version
+
+    if _makros_version is None:
+        try:
+            from importlib.metadata import version
+            _makros_version = version('makros')
+        except Exception:
+            _makros_version = 'unknown'
+
+        root = Path(__file__).parent
+        _makros_version += '+' + '.'.join(
+            file_fingerprint(str(root.joinpath(file))) for file in _CORE_FILES)
+
+    return _makros_version
+
+
+def default_cache_dir() -> Path:
+    """Finds the folder that the cache should be stored in. This can be set with
+    the ``MAKROS_CACHE_DIR`` environment variable, otherwise it will be in the
+    user's cache folder for their platform
+
+    Returns:
+        Path: The cache folder, which may not exist yet
+    """
+
+    if 'MAKROS_CACHE_DIR' in os.environ:
+        return Path(os.environ['MAKROS_CACHE_DIR'])
+
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA', Path.home().joinpath('AppData', 'Local'))
+        return Path(base).joinpath('makros', 'Cache')
+
+    if sys.platform == 'darwin':
+        return Path.home().joinpath('Library', 'Caches', 'makros')
+
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home().joinpath('.cache')
+    return Path(base).joinpath('makros')
+
+
+class TranslationCache:
+    """
+    A cache of translated files that is shared between every project on the
+    machine. Entries are stored under a hash of the source file, the macros it
+    imports and the version of makros, so identical files in different
+    checkouts share the same entry.
+
+    Entries are evicted least recently used first once the cache grows past its
+    size limit. Reading an entry updates its modification time, which is what
+    is used to decide which entries are the oldest.
+    """
+
+    def __init__(self, directory: Path, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = Path(directory)
+        self.max_size = max_size
+
+        # Scanning the cache is expensive, so it is only done on the first write
+        # and then whenever a fraction of the size limit has been written since
+        self._written = 0
+        self._next_eviction = 0
+
+    @staticmethod
+    def from_environment() -> Optional['TranslationCache']:
+        """Creates the cache that is configured by the environment. The cache
+        can be disabled by setting ``MAKROS_NO_CACHE`` and the size limit (in
+        bytes) can be set with ``MAKROS_CACHE_SIZE``. An invalid size is warned
+        about and the default is used instead
+
+        Returns:
+            Optional[TranslationCache]: The cache, or None if it is disabled
+        """
+
+        if os.environ.get('MAKROS_NO_CACHE'):
+            return None
+
+        max_size = DEFAULT_MAX_SIZE
+
+        if 'MAKROS_CACHE_SIZE' in os.environ:
+            size = os.environ['MAKROS_CACHE_SIZE']
+
+            try:
+                max_size = int(size)
+                if max_size < 0:
+                    raise ValueError()
+            except ValueError:
+                # A bad setting shouldn't stop makros from starting up
+                warnings.warn(
+                    f'MAKROS_CACHE_SIZE must be a number of bytes, not {size!r}. '
+                    f'Using the default of {DEFAULT_MAX_SIZE} instead')
+                max_size = DEFAULT_MAX_SIZE
+
+        return TranslationCache(default_cache_dir(), max_size)
+
+    def key(self, source: bytes, macros: Iterable[MacroDef],
+            variant: str = '') -> str:
+        """Builds the key for a file
+
+        Args:
+            source (bytes): The contents of the file
+            macros (Iterable[MacroDef]): The macros that the file imports
+            variant (str, optional): Anything else that changes the output, e.g. parser options. Defaults to ''.
+
+        Returns:
+            str: The key
+        """
+
+        key = hashlib.sha256()
+        key.update(makros_version().encode())
+        key.update(variant.encode())
+
+        for macro in macros:
+            key.update(b'\0' + macro.macro_name.encode() + b'\0')
+            key.update(file_fingerprint(macro.parser_file_location).encode())
+
+        key.update(b'\0')
+        key.update(source)
+
+        return key.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        # Entries are split into folders so no one folder gets too large
+        return self.directory.joinpath(key[:2], key[2:])
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Reads an entry from the cache
+
+        Args:
+            key (str): The key from ``key``
+
+        Returns:
+            Optional[bytes]: The translated file, or None if it is not cached
+        """
+
+        path = self._path(key)
+
+        try:
+            with open(path, 'rb') as file:
+                contents = file.read()
+        except OSError:
+            return None
+
+        # Mark the entry as recently used. The cache may be read only, in which
+        # case the entry is still usable, it just may be evicted sooner
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return contents
+
+    def put(self, key: str, contents: bytes) -> None:
+        """Stores an entry in the cache, evicting old entries if the cache has
+        grown too large. Failing to write to the cache is not an error
+
+        Args:
+            key (str): The key from ``key``
+            contents (bytes): The translated file
+        """
+
+        path = self._path(key)
+
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(str(path), [contents], binary=True)
+        except OSError:
+            return
+
+        self._written += len(contents)
+
+        if self._written >= self._next_eviction:
+            self.evict()
+            self._next_eviction = self._written + self.max_size // 8
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache is within
+        its size limit
+        """
+
+        entries = []
+        size = 0
+
+        try:
+            folders = list(os.scandir(self.directory))
+        except OSError:
+            return
+
+        for folder in folders:
+            if not folder.is_dir():
+                continue
+
+            for entry in os.scandir(folder.path):
+                # Skip any temporary files that are still being written
+                if entry.name.startswith('.'):
+                    continue
+
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                size += stat.st_size
+
+        if size <= self.max_size:
+            return
+
+        entries.sort()
+
+        for _, entry_size, path in entries:
+            try:
+                os.unlink(path)
+            except OSError:
+                # Another process may have evicted it first
+                pass
+
+            size -= entry_size
+            if size <= self.max_size:
+                break
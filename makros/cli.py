@@ -1,8 +1,9 @@
 import argparse
 import pathlib
+import runpy
 import sys
 
-from makros import translate_folder
+from makros import Makros, run_file, translate_folder, translate_imports
 from makros.tokens import TokenException
 
 # Poetry will bind the CLI to a function rather than a file and pass the
@@ -16,6 +17,12 @@ def cli(args=None):
         "--coverage", help="Starts up coverage.py internally", action="store_true"
     )
     cli_parser.add_argument('--convert', help="Will only convert the specified python file", action="store_true")
+    cli_parser.add_argument('--in-memory', help="Runs the file without translating anything to disk. Imported .mpy files are compiled on import and cached in __pycache__", action="store_true")
+    cli_parser.add_argument('--whole-folder', help="Translates every file in the folder, rather than only the files that are imported by the file being run", action="store_true")
+    cli_parser.add_argument('--report', help="Prints a summary of the files that were translated", action="store_true")
+    cli_parser.add_argument('--rebuild', help="Translates every file, even if it has not changed since the last run", action="store_true")
+    cli_parser.add_argument('--emit', help="What to write for each file: python source (py), bytecode instead of source (pyc) or both", choices=['py', 'pyc', 'both'], default='py')
+    cli_parser.add_argument('--no-cache', help="Translates every file instead of using the shared translation cache", action="store_true")
     args = cli_parser.parse_args(args)
 
     # To ensure that test coverage is correctly supported, we need to run a
@@ -42,8 +49,35 @@ def cli(args=None):
     current_file = pathlib.Path(args_path).absolute()
     current_folder = pathlib.Path(current_file).parent.absolute()
 
+    # Prefer the macro file over anything that was translated from it, e.g. a
+    # __main__.mpy next to the __main__.py
+    source_file = current_file
+    if current_file.with_suffix('.mpy').is_file():
+        source_file = current_file.with_suffix('.mpy')
+
+    if args.no_cache:
+        Makros.get().cache = None
+
+    if args.in_memory:
+        try:
+            run_file(source_file)
+        except TokenException:
+            sys.exit(1)
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+        return
+
     try:
-        translate_folder(current_folder)
+        # Only the files that the program could import need to be translated
+        if args.whole_folder:
+            report = translate_folder(current_folder,
+                                      incremental=not args.rebuild,
+                                      emit=args.emit)
+        else:
+            report = translate_imports(source_file,
+                                       incremental=not args.rebuild,
+                                       emit=args.emit)
     except TokenException:
         # This is only going to provie helpful errors for parser developers, so
         # we can mostly ignore it
@@ -53,9 +87,14 @@ def cli(args=None):
         # kill the program if one is thrown
         sys.exit(0)
 
+    if args.report:
+        print(report)
+
     # Stackoverflow theft! Runs the file specified in the python interpreter,
     # replacing .mpy with .py
-    if not args.convert:
+    if not args.convert and args.emit == 'pyc':
+        runpy.run_path(str(current_file.with_suffix('.pyc')), run_name='__main__')
+    elif not args.convert:
         exec(open(str(current_file).replace(".mpy", ".py")).read())
 
 
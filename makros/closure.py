@@ -0,0 +1,135 @@
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from makros.utils import decode_source
+
+_IMPORT = re.compile(r'^[ \t]*import[ \t]+([^#\n;]+)', re.MULTILINE)
+
+# The names after the import may be in brackets (which can span lines) or
+# continued with a backslash
+_FROM_IMPORT = re.compile(
+    r'^[ \t]*from[ \t]+(\.*)[ \t]*([\w.]*)[ \t]+import[ \t]*'
+    r'(\([^)]*\)|(?:[^#\n;\\]|\\\n)*)', re.MULTILINE)
+
+_SUFFIXES = ['.mpy', '.py']
+
+
+def find_imports(source: str) -> List[Tuple[int, str]]:
+    """Finds every module that a file might import without parsing it. Like
+    ``find_macro_imports`` this is only a quick check, anything that looks like
+    an import is included, even if it is inside a string
+
+    Names imported with ``from x import y`` are included as both ``x`` and
+    ``x.y``, as ``y`` may be a submodule.
+
+    Args:
+        source (str): The contents of the file
+
+    Returns:
+        List[Tuple[int, str]]: The number of leading dots (0 for absolute imports) and the dotted name of each module
+    """
+
+    imports = []
+
+    for names in _IMPORT.findall(source):
+        for name in names.split(','):
+            # Drop any "as ..."
+            name = name.split()[0] if name.split() else ''
+
+            if name:
+                imports.append((0, name))
+
+    for dots, module, names in _FROM_IMPORT.findall(source):
+        if module:
+            imports.append((len(dots), module))
+
+        for name in names.replace('\\\n', ' ').strip('() \t\n').split(','):
+            name = name.split()[0] if name.split() else ''
+
+            if name and name != '*':
+                imports.append(
+                    (len(dots), f'{module}.{name}' if module else name))
+
+    return imports
+
+
+def _find_file(stem: Path) -> Optional[Path]:
+    for suffix in _SUFFIXES:
+        path = Path(str(stem) + suffix)
+
+        if path.is_file():
+            return path
+
+    return None
+
+
+def _module_files(base: Path, name: str) -> List[Path]:
+    # Importing a.b.c runs a/__init__ and a/b/__init__ before a/b/c
+    files = []
+    parts = name.split('.')
+    folder = base
+
+    for part in parts[:-1]:
+        folder = folder.joinpath(part)
+        init = _find_file(folder.joinpath('__init__'))
+
+        if init is not None:
+            files.append(init)
+
+    module = folder.joinpath(parts[-1])
+    found = _find_file(module) or _find_file(module.joinpath('__init__'))
+
+    if found is not None:
+        files.append(found)
+
+    return files
+
+
+def import_closure(entry: Path, root: Optional[Path] = None) -> List[Path]:
+    """Follows the imports of a file, and the imports of those modules, to find
+    every module within a folder that running the file might import. Modules
+    are looked for as ``.mpy`` files first, so a module that has already been
+    translated is still followed through its macro file
+
+    Args:
+        entry (Path): The file that is run
+        root (Optional[Path], optional): The folder that absolute imports are relative to. Modules outside of it are ignored. Defaults to the folder containing the entry file.
+
+    Returns:
+        List[Path]: The entry file followed by every module found, both ``.mpy`` and ``.py`` files
+    """
+
+    entry = Path(entry).absolute()
+    root = Path(root).absolute() if root is not None else entry.parent
+
+    found = [entry]
+    seen = {entry}
+    index = 0
+
+    while index < len(found):
+        file = found[index]
+        index += 1
+
+        with open(file, 'rb') as source:
+            imports = find_imports(decode_source(source.read()))
+
+        for level, name in imports:
+            base = root
+
+            if level:
+                base = file.parent
+                for _ in range(level - 1):
+                    base = base.parent
+
+            for module in _module_files(base, name):
+                try:
+                    module.relative_to(root)
+                except ValueError:
+                    continue
+
+                if module not in seen:
+                    seen.add(module)
+                    found.append(module)
+
+    return found
@@ -0,0 +1,253 @@
+import ast
+import tokenize
+from typing import Iterable, List, Optional, Tuple, Union
+
+MacroOutput = Union[str, ast.stmt, Iterable[Union[tokenize.TokenInfo,
+                                                  Tuple[int, str], ast.stmt]]]
+"""What a translator may return: either python source code, a list of tokens
+that will be converted into source code by the emitter, or python ast
+statements
+"""
+
+PLACEHOLDER = '__makros_expansion__'
+"""The function that is "called" in place of ast statements when a file is
+being compiled. See ``render``
+"""
+
+
+def ast_statements(output: MacroOutput) -> Optional[List[ast.stmt]]:
+    """Checks if the output of a macro is made up of ast nodes
+
+    Args:
+        output (MacroOutput): The output of the macro
+
+    Returns:
+        Optional[List[ast.stmt]]: The statements, or None if the output is not ast nodes
+    """
+
+    if isinstance(output, ast.AST):
+        return [output]
+
+    if isinstance(output, list) and output and isinstance(output[0], ast.AST):
+        return output
+
+    return None
+
+
+def render(output: MacroOutput,
+           indentation: str = '',
+           expansions: Optional[List[List[ast.stmt]]] = None) -> str:
+    """Converts the output of a macro into source code that can be placed into
+    the file at the provided indentation
+
+    Args:
+        output (MacroOutput): The output of the macro, either a string, a list of tokens or ast statements
+        indentation (str, optional): The indentation of the line the macro was triggered on. Defaults to ''.
+        expansions (Optional[List[List[ast.stmt]]], optional): When provided, ast statements are stored in this list and a placeholder call is output instead of their code. Defaults to None.
+
+    Returns:
+        str: The source code, starting and ending with a new line
+    """
+
+    statements = ast_statements(output)
+
+    if statements is not None:
+        if expansions is not None:
+            expansions.append(statements)
+            return f"\n{indentation}{PLACEHOLDER}({len(expansions) - 1})\n"
+
+        # Compiling in memory works on any version, but turning ast back into
+        # code needs python 3.9
+        if not hasattr(ast, 'unparse'):
+            raise RuntimeError(
+                'Macros that return ast statements can only be translated to '
+                'source code on python 3.9 or newer. They can still be compiled '
+                'in memory, e.g. with run_file or the import hook')
+
+        # Unlike the strings that macros return, this doesn't start with a new
+        # line, so the first line needs to be indented as well
+        output = indentation + ast.unparse(
+            ast.Module(body=statements, type_ignores=[]))
+
+    if not isinstance(output, str):
+        return "\n" + _untokenize(output, indentation)
+
+    # Don't trust the developer (probably me) to provide leading and trailing
+    # new lines
+    return "\n" + output.replace('\n', '\n' + indentation) + "\n"
+
+
+def _untokenize(tokens: Iterable[Union[tokenize.TokenInfo, Tuple[int, str]]],
+                indentation: str) -> str:
+    # Positions from tokens that macros return mean nothing in the output file,
+    # so only the type and string are kept, which tells untokenize to work out
+    # the spacing itself
+    source = tokenize.untokenize((token[0], token[1]) for token in tokens)
+
+    # Every line then needs to be shifted to where the macro is, not just the
+    # first one and the ones that were indented
+    lines = source.splitlines(True)
+    source = ''.join(indentation + line if line.strip() else line
+                     for line in lines)
+
+    if not source.endswith('\n'):
+        source += '\n'
+
+    return source
+
+
+class Emitter:
+    """
+    Builds the output of a file from the tokens that the parser passes through
+    untouched and the output of any macros. Untouched tokens are emitted as the
+    source lines they came from, and nothing is joined together until the
+    parser asks for a chunk, so files with few macros are mostly copied in bulk.
+
+    The emitter also keeps track of the indentation of the file, so macros can
+    be placed at the same indentation as the line they were triggered on.
+
+    If a list of expansions is provided, any ast statements that macros return
+    are stored there rather than converted into code. See ``render``.
+    """
+
+    def __init__(self, expansions: Optional[List[List[ast.stmt]]] = None):
+        self.expansions = expansions
+        self._chunks: List[str] = []
+        self._indents: List[str] = ['']
+
+        # The last row in the source file that has been written to the output
+        self._row = 0
+
+    @property
+    def indentation(self) -> str:
+        """The indentation of the current block
+        """
+
+        return self._indents[-1]
+
+    @property
+    def pending(self) -> int:
+        """The number of chunks that are waiting to be flushed
+        """
+
+        return len(self._chunks)
+
+    def token(self, token: tokenize.TokenInfo) -> None:
+        """Passes a token through to the output. The first token on each line
+        emits the entire line, every other token on that line is ignored
+
+        Args:
+            token (tokenize.TokenInfo): The token that was not used by a macro
+        """
+
+        if token.type == tokenize.INDENT:
+            # Indent tokens contain the entire indentation of the line, not
+            # just the amount that was added
+            self._indents.append(token.string)
+            return
+
+        if token.type == tokenize.DEDENT:
+            if len(self._indents) > 1:
+                self._indents.pop()
+            return
+
+        if token.end[0] <= self._row:
+            return
+
+        if token.start[0] > self._row:
+            self._chunks.append(token.line)
+        else:
+            # A multi-line token (e.g. a docstring) that starts on a line that
+            # has already been written. Its line includes every row it is on,
+            # so only the new ones are needed
+            skip = self._row - token.start[0] + 1
+            self._chunks.append(''.join(token.line.splitlines(True)[skip:]))
+
+        self._row = token.end[0]
+
+    def consumed(self, token: tokenize.TokenInfo) -> None:
+        """Marks every line up to the provided token as used by a macro, so it
+        will not be passed through
+
+        Args:
+            token (tokenize.TokenInfo): The last token the macro used
+        """
+
+        # Dedents and the end marker are positioned at the start of the next
+        # statement, which the macro has not touched
+        if token.type in (tokenize.DEDENT, tokenize.ENDMARKER):
+            return
+
+        self._row = max(self._row, token.end[0])
+
+    def expansion(self, output: MacroOutput) -> None:
+        """Adds the output of a macro at the current indentation
+
+        Args:
+            output (MacroOutput): The string or tokens returned by the macro
+        """
+
+        self._chunks.append(render(output, self.indentation, self.expansions))
+
+    def text(self, text: str) -> None:
+        """Adds some text to the output exactly as it is
+
+        Args:
+            text (str): The text, which should end in a new line
+        """
+
+        self._chunks.append(text)
+
+    def flush(self) -> str:
+        """Returns everything that has been emitted since the last flush
+
+        Returns:
+            str: The output, which may be empty
+        """
+
+        output = ''.join(self._chunks)
+        self._chunks.clear()
+        return output
+
+
+class _ExpansionInliner(ast.NodeTransformer):
+    def __init__(self, expansions: List[List[ast.stmt]]):
+        self.expansions = expansions
+
+    def visit_Expr(self, node: ast.Expr):
+        call = node.value
+
+        if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Name)
+                and call.func.id == PLACEHOLDER):
+            return node
+
+        statements = self.expansions[call.args[0].value]
+
+        # Every node gets the position of the placeholder, which is where the
+        # macro was in the file
+        for statement in statements:
+            for child in ast.walk(statement):
+                if 'lineno' in child._attributes:
+                    ast.copy_location(child, node)
+
+        return statements
+
+
+def inline_expansions(module: ast.Module,
+                      expansions: List[List[ast.stmt]]) -> ast.Module:
+    """Replaces the placeholders that ``render`` outputs with the ast
+    statements they stand in for
+
+    Args:
+        module (ast.Module): The parsed output of the parser
+        expansions (List[List[ast.stmt]]): The statements that were stored by render
+
+    Returns:
+        ast.Module: The module, with all of the placeholders replaced
+    """
+
+    if not expansions:
+        return module
+
+    return ast.fix_missing_locations(
+        _ExpansionInliner(expansions).visit(module))
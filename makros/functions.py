@@ -1,8 +1,14 @@
+from typing import Optional
+from makros.closure import import_closure
 from makros.makros import Makros
+from makros.report import BuildReport
+from makros.state import BuildState
 from pathlib import Path
 
 
-def translate_file(path: Path):
+def translate_file(path: Path,
+                   report: Optional[BuildReport] = None,
+                   emit: str = 'py') -> BuildReport:
     """Parses a file and writes its output to disk at the same location with ".mpy" replaced with ".py"
 
     .. code-block:: python
@@ -13,29 +19,155 @@ def translate_file(path: Path):
 
     Args:
         path: The path to the file you want to parse
+        report: A report to count the file in. Defaults to a new report
+        emit: Write a ".py" file ("py"), a ".pyc" file instead ("pyc") or a ".py" file and its bytecode in "__pycache__" ("both"). Defaults to "py"
+
+    Returns:
+        BuildReport: The report the file was counted in
     """
 
-    parser = Makros.get().get_parser(path)
+    parser = Makros.get().get_parser(path, report)
+    parser.emit = emit
     parser.parse()
 
+    return parser.report
+
 
-def translate_folder(folder_path: Path):
+def translate_folder(folder_path: Path,
+                     report: Optional[BuildReport] = None,
+                     incremental: bool = True,
+                     emit: str = 'py') -> BuildReport:
     """Will parse all ".mpy" files within a folder and write their contents to disk
 
     .. code-block:: python
 
         from makros import translate_folder
 
-        translate_folder(Path('./my_folder'))
+        report = translate_folder(Path('./my_folder'))
+        print(report)
+
+    By default, what each file was built from is stored in the folder, and
+    files whose source, output and macros have not changed since the last build
+    are skipped.
 
     Args:
         folder_path (Path): The path to the folder you want to parse
+        report (Optional[BuildReport]): A report to count the files in. Defaults to a new report
+        incremental (bool): Skip files that are already up to date. Defaults to True
+        emit (str): What to write for each file, see ``translate_file``. Defaults to "py"
+
+    Returns:
+        BuildReport: The report the files were counted in
     """
 
+    if report is None:
+        report = BuildReport()
+
+    # Every file in the folder will look for local packages, so they can all
+    # share one index of it
+    Makros.get()._resolver.add_local_root(folder_path)
+
+    if not incremental:
+        _translate_folder(folder_path, report, None, emit)
+        return report
+
+    state = BuildState(folder_path, _variant(folder_path, emit))
+
+    # Files that were built before an error still get recorded, so they will
+    # not be built again next time
+    try:
+        _translate_folder(folder_path, report, state, emit)
+    finally:
+        state.save()
+
+    return report
+
+
+def _translate_folder(folder_path: Path, report: BuildReport,
+                      state: Optional[BuildState], emit: str) -> None:
     for file in folder_path.iterdir():
         if file.is_dir():
-            translate_folder(file)
+            _translate_folder(file, report, state, emit)
             continue
 
-        if file.suffix == '.mpy':
-            translate_file(file)
+        if file.suffix != '.mpy':
+            continue
+
+        if state is None:
+            translate_file(file, report, emit)
+            continue
+
+        _translate_incremental(file, report, state, emit)
+
+
+def _translate_incremental(file: Path, report: BuildReport, state: BuildState,
+                           emit: str) -> None:
+    parser = Makros.get().get_parser(file, report)
+    parser.emit = emit
+    output = parser.output_path(file)
+
+    if state.is_fresh(file, output):
+        report.skipped += 1
+        return
+
+    parser.parse()
+
+    state.record(file, output, parser.imported)
+
+
+def translate_imports(entry: Path,
+                      report: Optional[BuildReport] = None,
+                      incremental: bool = True,
+                      emit: str = 'py') -> BuildReport:
+    """Translates a file and every ".mpy" file in its folder that it imports,
+    directly or through other modules. Files that are never imported are left
+    alone. Imports are found without running anything, see ``import_closure``
+
+    .. code-block:: python
+
+        from makros import translate_imports
+
+        report = translate_imports(Path('./my_folder/__main__.mpy'))
+
+    Args:
+        entry (Path): The file that is going to be run
+        report (Optional[BuildReport]): A report to count the files in. Defaults to a new report
+        incremental (bool): Skip files that are already up to date. Defaults to True
+        emit (str): What to write for each file, see ``translate_file``. Defaults to "py"
+
+    Returns:
+        BuildReport: The report the files were counted in
+    """
+
+    if report is None:
+        report = BuildReport()
+
+    files = [file for file in import_closure(entry) if file.suffix == '.mpy']
+
+    if not incremental:
+        for file in files:
+            translate_file(file, report, emit)
+
+        return report
+
+    # The state is shared with translate_folder, so the files that were not
+    # imported this time are kept
+    folder = Path(entry).absolute().parent
+    state = BuildState(folder, _variant(folder, emit))
+
+    try:
+        for file in files:
+            _translate_incremental(file, report, state, emit)
+    finally:
+        state.save(prune=False)
+
+    return report
+
+
+def _variant(folder: Path, emit: str) -> str:
+    # Switching what is emitted means every file has to be written again
+    variant = Makros.get().get_parser(folder).output_variant
+    if emit != 'py':
+        variant += f'+{emit}'
+
+    return variant
@@ -0,0 +1,163 @@
+import importlib.machinery
+import importlib.util
+import os
+import sys
+from pathlib import Path
+from types import CodeType
+from typing import Callable, Optional
+
+from makros.bytecode import code_to_hash_pyc, hash_pyc_to_code, optimization_tag
+from makros.cache import makros_version
+from makros.makros import Makros
+from makros.utils import file_fingerprint, find_macro_imports, write_atomic
+
+MPY_SUFFIXES = ['.mpy']
+"""The file extensions that the import hook will translate
+"""
+
+BYTECODE_TAG = 'makros'
+"""Marks the bytecode of ``.mpy`` files in ``__pycache__``, so that it never
+collides with the bytecode of a ``.py`` file with the same name
+"""
+
+
+def _bytecode_path(source_path: str) -> str:
+    return importlib.util.cache_from_source(
+        source_path, optimization=optimization_tag(BYTECODE_TAG))
+
+
+class MakrosLoader(importlib.machinery.SourceFileLoader):
+    """
+    Loads ``.mpy`` modules, expanding their macros on the first import.
+
+    The compiled module is cached in ``__pycache__`` as a hash based pyc (PEP
+    552). The hash covers the ``.mpy`` file, the macros it imports and the
+    version of makros, so the bytecode is thrown away whenever any of them
+    change. Nothing is ever written next to the source file.
+    """
+
+    def _source_hash(self, source: bytes) -> bytes:
+        # Modules without macros only depend on themselves, which keeps them
+        # as cheap to check as a normal module
+        imports = find_macro_imports(source)
+        if not imports:
+            return importlib.util.source_hash(source)
+
+        parser = Makros.get().get_parser(Path(self.path))
+        dependencies = [makros_version().encode()]
+
+        # Imports that can't be resolved may just be inside a string. If they
+        # are real, translating the module will fail anyway
+        for macro in parser.resolve_imports(imports, strict=False):
+            dependencies.append(macro.macro_name.encode())
+            dependencies.append(
+                file_fingerprint(macro.parser_file_location).encode())
+
+        return importlib.util.source_hash(b'\0'.join(dependencies) + b'\0' +
+                                          source)
+
+    def source_to_code(self, data, path, *, _optimize=-1) -> CodeType:
+        """Expands any macros in a module and compiles it
+
+        Args:
+            data (bytes): The contents of the module
+            path (str): The path the contents were read from
+
+        Returns:
+            CodeType: The compiled module
+        """
+
+        return Makros.get().get_parser(Path(path)).compile_bytes(
+            data, Path(path))
+
+    def get_code(self, fullname: str) -> CodeType:
+        """Returns the compiled module, from ``__pycache__`` if it is up to date
+
+        Args:
+            fullname (str): The name of the module
+
+        Returns:
+            CodeType: The compiled module
+        """
+
+        source_path = self.get_filename(fullname)
+        source = self.get_data(source_path)
+        source_hash = self._source_hash(source)
+        bytecode_path = _bytecode_path(source_path)
+
+        try:
+            code = hash_pyc_to_code(self.get_data(bytecode_path), source_hash)
+        except OSError:
+            code = None
+
+        if code is not None:
+            return code
+
+        code = self.source_to_code(source, source_path)
+
+        if not sys.dont_write_bytecode:
+            try:
+                os.makedirs(os.path.dirname(bytecode_path), exist_ok=True)
+                write_atomic(bytecode_path,
+                             [code_to_hash_pyc(code, source_hash)],
+                             binary=True)
+            except OSError:
+                # The module will just be translated again next time
+                pass
+
+        return code
+
+
+def _path_hook() -> Callable[[str], importlib.machinery.FileFinder]:
+    # The same loaders that python uses by default, with .mpy files first so
+    # they win over any .py file that was translated from them
+    return importlib.machinery.FileFinder.path_hook(
+        (MakrosLoader, MPY_SUFFIXES),
+        (importlib.machinery.ExtensionFileLoader,
+         importlib.machinery.EXTENSION_SUFFIXES),
+        (importlib.machinery.SourceFileLoader,
+         importlib.machinery.SOURCE_SUFFIXES),
+        (importlib.machinery.SourcelessFileLoader,
+         importlib.machinery.BYTECODE_SUFFIXES))
+
+
+_hook: Optional[Callable[[str], importlib.machinery.FileFinder]] = None
+
+
+def install_import_hook() -> None:
+    """Allows ``.mpy`` files to be imported like any other python module. Their
+    macros are expanded on the first import and the compiled module is cached
+    in ``__pycache__``, so later imports cost the same as a normal module.
+    Calling this more than once has no effect
+    """
+
+    global _hook
+
+    if _hook is not None:
+        return
+
+    _hook = _path_hook()
+    sys.path_hooks.insert(0, _hook)
+
+    # Finders for every folder that has already been imported from were created
+    # without the hook
+    sys.path_importer_cache.clear()
+    importlib.invalidate_caches()
+
+
+def uninstall_import_hook() -> None:
+    """Removes the hook added by ``install_import_hook``. Modules that have
+    already been imported are left alone
+    """
+
+    global _hook
+
+    if _hook is None:
+        return
+
+    if _hook in sys.path_hooks:
+        sys.path_hooks.remove(_hook)
+
+    _hook = None
+    sys.path_importer_cache.clear()
+    importlib.invalidate_caches()
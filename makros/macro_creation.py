@@ -1,7 +1,8 @@
 # This file defines the exports at 'makros.macro_creation.*', just so everything
 # is clean and in one place.
 
-from makros.tokens import Tokens, TokenCase
+from makros.tokens import Tokens, BufferedTokens, CompactTokens, TokenCase
 from makros.macros.types import MacroParser, MacroTranslator
 
 import makros.macros.pyx as pyx
+import makros.macros.pyast as pyast
@@ -1,9 +1,11 @@
+import ast as py_ast
 import tokenize
 from typing import List, Optional
 from makros.macros.types import MacroParser, MacroTranslator
 from makros.macros.utils import camel_to_snake
 from makros.tokens import TokenCase, Tokens
 
+import makros.macros.pyast as pyast
 import makros.macros.pyx as pyx
 
 
@@ -79,11 +81,28 @@ class EnumTupleItem(ASTBase):
 ASTBase.__assign_enum_types__(Enum, EnumBody)
 
 
+#
+# Token cases are immutable, so they are only built once
+#
+
+NAME = TokenCase.name()
+STRING = TokenCase(tokenize.STRING)
+NEWLINE = TokenCase.newline()
+DEDENT = TokenCase.dedent()
+BLOCK_START = (TokenCase.op(), TokenCase.newline(), TokenCase.indent())
+
+DOT = TokenCase.op(".")
+COLON = TokenCase.op(":")
+COMMA = TokenCase.op(",")
+OPEN_PAREN = TokenCase.op("(")
+CLOSE_PAREN = TokenCase.op(")")
+OPEN_BRACKET = TokenCase.op("[")
+CLOSE_BRACKET = TokenCase.op("]")
+
+
 class Parser(MacroParser):
     def is_complex_args(self, tokens: Tokens): 
-        return tokens.match(TokenCase().type(tokenize.OP).string("."),
-                            TokenCase().type(tokenize.OP).string("["),
-                            TokenCase().type(tokenize.OP).string("]"))
+        return tokens.match(DOT, OPEN_BRACKET, CLOSE_BRACKET)
 
     def arg_definition(self, tokens: Tokens):
         # <arg_definition> ::= <tuple_args>
@@ -98,14 +117,14 @@ class Parser(MacroParser):
         while still_arguments:
             # <tuple_arg> ::= <identifier> [':' <type_specifier>]
 
-            identifier = tokens.consume(TokenCase().type(tokenize.NAME),
+            identifier = tokens.consume(NAME,
                                         "checking for enum item identifier")
             type = ''
 
             # Types are optional, so we should only include them if the user has
             # specified them
-            if tokens.match(TokenCase().type(tokenize.OP).string(":")):
-                type = tokens.consume(TokenCase().type(tokenize.NAME),
+            if tokens.match(COLON):
+                type = tokens.consume(NAME,
                                       "checking for enum item type").string
 
                 # Sometimes types have a dot in them or takes in parameters, so
@@ -116,10 +135,10 @@ class Parser(MacroParser):
 
                     # Jank, if there is an end token, we want to jump out of the
                     # loop, because why not
-                    if tokens.check(TokenCase().type(tokenize.OP).string(")")):
+                    if tokens.check(CLOSE_PAREN):
                         break
                         
-                    if tokens.match(TokenCase().type(tokenize.NAME)):
+                    if tokens.match(NAME):
                         type += tokens.previous().string
 
                 # type += tokens.consume(TokenCase().type(
@@ -128,9 +147,9 @@ class Parser(MacroParser):
             args.append(EnumTupleArg(identifier, type))
 
             # If there are still arguments, we want to continue the loop    
-            still_arguments = tokens.match(TokenCase().type(tokenize.OP).string(","))
+            still_arguments = tokens.match(COMMA)
 
-        tokens.consume(TokenCase().type(tokenize.OP).string(')'),
+        tokens.consume(CLOSE_PAREN,
                        "checking for closing of a tuple enum ')'")
 
         return args
@@ -138,16 +157,16 @@ class Parser(MacroParser):
     def get_enum_item(self, tokens: Tokens) -> ASTBase:
         # <enum_body> ::= <identifier> [<arg_definition>] '\n'
 
-        identifier = tokens.consume(TokenCase().type(tokenize.NAME),
+        identifier = tokens.consume(NAME,
                                     "checking for enum item identifier")
         args = None
 
         # If there is an opening token, the enum will take in arguments, so we
         # have to parse those arguments and specify them
-        if tokens.match(TokenCase().type(tokenize.OP).string("(")):
+        if tokens.match(OPEN_PAREN):
             args = self.arg_definition(tokens)
 
-        tokens.consume(TokenCase().type(tokenize.NEWLINE),
+        tokens.consume(NEWLINE,
                        "checking for newline")
 
         # If there are no arguments, return basic enum item, otherwise return a
@@ -165,13 +184,12 @@ class Parser(MacroParser):
         # {<enum_body>}
         while True:
             # Tokens to ignore. We don't care about newlines or docstrings
-            if tokens.match(TokenCase().type(tokenize.NEWLINE), 
-                TokenCase().type(tokenize.STRING)):
+            if tokens.match(NEWLINE, STRING):
                 continue
 
             # The enum body ends on a dedent. We can just keep looping until we
             # find one
-            if tokens.match(TokenCase().type(tokenize.DEDENT)):
+            if tokens.match(DEDENT):
                 break
 
             enum_item = self.get_enum_item(tokens)
@@ -181,26 +199,29 @@ class Parser(MacroParser):
 
     def enum(self, tokens: Tokens) -> EnumBody:
         # These are tokens that start the body
-        tokens.consume(TokenCase().type(tokenize.OP), "Expected ':'")
-        tokens.consume(TokenCase().type(tokenize.NEWLINE), "Expected newline")
-        tokens.consume(TokenCase().type(tokenize.INDENT), "Expected indent")
+        tokens.consume_seq(BLOCK_START,
+                           "Expected ':' followed by an indented block")
 
         body = self.enum_body(tokens)
 
         return body
 
     def parse(self, tokens: Tokens) -> any:
-        identifier = tokens.consume(TokenCase().type(tokenize.NAME),
+        identifier = tokens.consume(NAME,
                                     "Expected the enum name")
 
         # If it extends a class (or multiple), store them
-        extends_a_class = tokens.match(TokenCase().type(tokenize.OP).string("("))
-        extends = '' if extends_a_class else None
+        extends = None
+
+        if tokens.check(OPEN_PAREN):
+            _, closing = tokens.bracket_span()
+            tokens.advance()
 
-        while extends_a_class:
-            extends += tokens.advance().string  # type: ignore
-            extends_a_class = not tokens.match(TokenCase().type(
-                tokenize.OP).string(")"))
+            extends = ''
+            while tokens.index < closing:
+                extends += tokens.advance().string
+
+            tokens.advance()
 
         enum = self.enum(tokens)
 
@@ -361,6 +382,114 @@ class Translator(MacroTranslator):
             extends=self.parent_name
         )
 
+    def translate_ast(self, ast: Enum) -> List[py_ast.stmt]:
+        """Builds the same code as ``translate``, but as python ast nodes, so it
+        can be compiled without being converted to a string and parsed again
+        """
+
+        parent = ast.name.string
+        items = ast.body.identifiers
+
+        def assign(target: py_ast.expr, value: py_ast.expr) -> py_ast.Assign:
+            return pyast.node(py_ast.Assign, targets=[target], value=value)
+
+        def returns(value: py_ast.expr) -> py_ast.Return:
+            return py_ast.Return(value=value)
+
+        def call(function: str, *args: py_ast.expr) -> py_ast.Call:
+            return pyast.node(py_ast.Call, func=pyast.name(function), args=list(args))
+
+        def attribute(value: str, attr: str, store: bool = False) -> py_ast.Attribute:
+            return py_ast.Attribute(value=pyast.name(value), attr=attr,
+                                    ctx=py_ast.Store() if store else py_ast.Load())
+
+        # See translate for an explanation of what these are for
+        assign_enum_types = pyast.create_func(
+            '__assign_enum_types__',
+            pyast.arguments(parent, *[camel_to_snake(item.name.string) for item in items]),
+            [
+                assign(attribute(parent, item.name.string, True),
+                       pyast.name(camel_to_snake(item.name.string)))
+                for item in items
+            ] or [py_ast.Pass()])
+
+        eq = pyast.create_func('__eq__', pyast.arguments('self', 'other'), [
+            pyast.node(py_ast.Try,
+                       body=[returns(call('isinstance', pyast.name('self'), pyast.name('other')))],
+                       handlers=[
+                           pyast.node(py_ast.ExceptHandler, body=[
+                               returns(pyast.node(py_ast.Compare,
+                                                  left=call('type', pyast.name('self')),
+                                                  ops=[py_ast.Is()],
+                                                  comparators=[call('type', pyast.name('other'))]))
+                           ])
+                       ])
+        ])
+
+        statements = [pyast.create_class(parent, [assign_enum_types, eq], ast.extends)]
+
+        for item in items:
+            statements.append(pyast.create_class(
+                item.name.string, self._item_body_ast(item), parent))
+
+        statements.append(py_ast.Expr(value=pyast.node(
+            py_ast.Call,
+            func=attribute(parent, '__assign_enum_types__'),
+            args=[pyast.name(parent), *[pyast.name(item.name.string) for item in items]])))
+
+        statements.extend(
+            pyast.node(py_ast.Delete,
+                       targets=[py_ast.Name(id=item.name.string, ctx=py_ast.Del())])
+            for item in items)
+
+        # Nothing in here has a position, it will be given the position of the
+        # macro when it is inserted into the file
+        return statements
+
+    def _item_body_ast(self, item: ASTBase) -> List[py_ast.stmt]:
+        """The methods of an enum item class, as ast nodes
+        """
+
+        name = item.name.string
+
+        def self_attribute(attr: str, store: bool = False) -> py_ast.Attribute:
+            return py_ast.Attribute(value=pyast.name('self'), attr=attr,
+                                    ctx=py_ast.Store() if store else py_ast.Load())
+
+        if isinstance(item, EnumBasicItem):
+            return [
+                pyast.create_func('__str__', pyast.arguments('self'),
+                                  [py_ast.Return(value=py_ast.Constant(value=name))])
+            ]
+
+        args = pyast.arguments('self', *[arg.name.string for arg in item.args])
+        for arg, definition in zip(item.args, args.args[1:]):
+            if arg.item_type:
+                definition.annotation = pyast.expression(arg.item_type)
+
+        # f'Name(a: {self.a}, b: {self.b})'
+        values = []
+        text = f'{name}('
+        for index, arg in enumerate(item.args):
+            text += f"{', ' if index else ''}{arg.name.string}: "
+            values.append(py_ast.Constant(value=text))
+            values.append(py_ast.FormattedValue(value=self_attribute(arg.name.string),
+                                                conversion=-1,
+                                                format_spec=None))
+            text = ''
+        values.append(py_ast.Constant(value=text + ')'))
+
+        return [
+            pyast.create_func('__init__', args, [
+                pyast.node(py_ast.Assign,
+                           targets=[self_attribute(arg.name.string, True)],
+                           value=pyast.name(arg.name.string))
+                for arg in item.args
+            ] or [py_ast.Pass()]),
+            pyast.create_func('__str__', pyast.arguments('self'),
+                              [py_ast.Return(value=py_ast.JoinedStr(values=values))])
+        ]
+
     def translate(self, ast: Enum) -> str:
         # Macro translation uses the Visitor Pattern for a structure. Structure
         # based off my memory of the Crafting Interpreters section on this
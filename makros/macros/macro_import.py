@@ -1,5 +1,4 @@
 import tokenize
-import token
 from typing import Optional
 
 from makros.macros.types import MacroParser
@@ -17,17 +16,19 @@ class Import(MacroAST):
         self.macro = macro
 
 
+IMPORT = TokenCase.name("import")
+NAME = TokenCase.name()
+DOT = TokenCase.op('.')
+
+
 class Parser(MacroParser):
     def parse(self, tokens: Tokens) -> Import:
-        tokens.consume(TokenCase().type(token.NAME).string("import"),
-                       "Expected the keyword 'import'")
+        tokens.consume(IMPORT, "Expected the keyword 'import'")
 
-        module = tokens.consume(TokenCase().type(token.NAME),
-                                "Expected the name of your module")
+        module = tokens.consume(NAME, "Expected the name of your module")
         macro = None
 
-        if tokens.match(TokenCase().type(token.OP).string('.')):
-            macro = tokens.consume(TokenCase().type(token.NAME),
-                                   "Expected the name of the macro file")
+        if tokens.match(DOT):
+            macro = tokens.consume(NAME, "Expected the name of the macro file")
 
         return Import(module, macro)
@@ -0,0 +1,117 @@
+import ast
+from typing import List, Optional, Type
+
+# Fields that hold lists of nodes. Newer versions of python add more of these
+# (e.g. type_params in 3.12), which need to be filled in for compile to accept
+# the node
+_LIST_FIELDS = {
+    'args', 'bases', 'body', 'decorator_list', 'defaults', 'elts',
+    'finalbody', 'handlers', 'keywords', 'kw_defaults', 'kwonlyargs', 'names',
+    'orelse', 'posonlyargs', 'targets', 'type_ignores', 'type_params',
+    'values'
+}
+
+
+def node(node_type: Type[ast.AST], **fields) -> ast.AST:
+    """Creates an ast node, filling in any fields that were not provided so the
+    node works on every supported version of python.
+
+    Args:
+        node_type (Type[ast.AST]): The node class, e.g. ``ast.ClassDef``
+
+    Returns:
+        ast.AST: The node
+    """
+
+    for field in node_type._fields:
+        if field not in fields:
+            fields[field] = [] if field in _LIST_FIELDS else None
+
+    return node_type(**fields)
+
+
+def name(identifier: str, store: bool = False) -> ast.Name:
+    """Creates a reference to a variable
+
+    Args:
+        identifier (str): The name of the variable
+        store (bool, optional): If the variable is being assigned to. Defaults to False.
+
+    Returns:
+        ast.Name: The name node
+    """
+
+    return ast.Name(id=identifier, ctx=ast.Store() if store else ast.Load())
+
+
+def arguments(*names: str) -> ast.arguments:
+    """Creates the arguments for a function that only takes positional
+    arguments without defaults
+
+    Returns:
+        ast.arguments: The arguments node
+    """
+
+    return node(ast.arguments, args=[node(ast.arg, arg=arg) for arg in names])
+
+
+def create_func(function_name: str, args: ast.arguments,
+                body: List[ast.stmt]) -> ast.FunctionDef:
+    """Creates a function definition. This is the ast equivalent of
+    ``pyx.create_func``
+
+    Args:
+        function_name (str): The name of the function
+        args (ast.arguments): The arguments of the function, usually created by arguments()
+        body (List[ast.stmt]): The statements in the function
+
+    Returns:
+        ast.FunctionDef: The function definition
+    """
+
+    return node(ast.FunctionDef, name=function_name, args=args, body=body)
+
+
+def create_class(class_name: str,
+                 body: List[ast.stmt],
+                 extends: Optional[str] = None) -> ast.ClassDef:
+    """Creates a class definition. This is the ast equivalent of
+    ``pyx.create_class``
+
+    Args:
+        class_name (str): The name of the class
+        body (List[ast.stmt]): The statements in the class
+        extends (Optional[str], optional): The source code of the classes that this class extends. Defaults to None.
+
+    Returns:
+        ast.ClassDef: The class definition
+    """
+
+    bases, keywords = [], []
+
+    # The easiest way of handling everything that can go in the brackets (e.g.
+    # metaclass=...) is to let python parse it
+    if extends and extends.isidentifier():
+        bases = [name(extends)]
+    elif extends:
+        parsed = ast.parse(f'class _({extends}): pass').body[0]
+        bases, keywords = parsed.bases, parsed.keywords
+
+    return node(ast.ClassDef,
+                name=class_name,
+                bases=bases,
+                keywords=keywords,
+                body=body)
+
+
+def expression(source: str) -> ast.expr:
+    """Parses a single python expression, e.g. a type annotation
+
+    Args:
+        source (str): The source code of the expression
+
+    Returns:
+        ast.expr: The expression
+    """
+
+    return ast.parse(source.strip(), mode='eval').body
@@ -1,5 +1,8 @@
 from abc import ABC, abstractmethod
+import ast
+from typing import Any, Callable, List, Optional, Union
 
+from makros.emitter import MacroOutput
 from makros.tokens import Tokens
 
 
@@ -39,16 +42,38 @@ class MacroTranslator(ABC):
     visitor pattern. For more information, `crafting interpreters has great documentation <https://craftinginterpreters.com/evaluating-expressions.html>`_.
     """
 
+    cacheable: bool = True
+    """Makros remembers the output of recent invocations and reuses it when the
+    same invocation is seen again, without running the parser or translator.
+    Set this to False if your translator can produce different output for
+    identical code, e.g. if it generates unique names
+    """
+
+    translate_ast: Optional[Callable[[Any], Union[ast.stmt, List[ast.stmt]]]] = None
+    """Translators may optionally provide this method, which takes the same AST
+    as ``translate`` but returns python ``ast`` statements. When makros
+    compiles a file in memory, it will use this instead of ``translate``, so the
+    generated code never has to be converted to a string and parsed again. The
+    nodes do not need positions, they are given the position of the macro.
+    """
+
     @abstractmethod
-    def translate(self, ast: any) -> str:  # type: ignore
+    def translate(self, ast: any) -> MacroOutput:  # type: ignore
         """
         This method is called to translate the AST that is returned by the parse
         method on your parser.
 
+        Instead of a string, you can return a list of tokens (either
+        ``tokenize.TokenInfo`` or ``(type, string)`` tuples), which will be
+        converted back into code with ``tokenize.untokenize``. Indents should
+        be relative to the macro, makros will move them to wherever the macro
+        was used. You can also return python ``ast`` statements, which will be
+        converted to code with ``ast.unparse`` (python 3.9+).
+
         Args:
             ast (any): The AST generated by your parser method
 
         Returns:
-            str: The python code generated by your macro
+            MacroOutput: The python code generated by your macro
         """
         pass
@@ -1,11 +1,14 @@
-import json
 from os import listdir
 from pathlib import Path
+from typing import Optional
 from os.path import isfile, join
+from makros.cache import TranslationCache
 from makros.parser import MakroParser
 
 from makros.registration.resolver import Resolver
-from makros.utils import sha256sum
+from makros.scope import ExpansionCache
+from makros.report import BuildReport
+from makros.state import BootstrapState
 
 BOOTSTRAP_FOLDERS = ['macros', 'registration']
 HASH_FILE = str(Path(__file__).parent.joinpath('macros')) + '.json'
@@ -20,6 +23,7 @@ class Makros:
 
     - Boostrapping the library
     - Keeping a copy of the resolver (requires bootstrapping)
+    - Keeping a copy of the translation cache and recent macro expansions
 
     It also should be used for instantiating subclasses that depend on any of
     the above features. These include:
@@ -31,10 +35,23 @@ class Makros:
     """Globally responsible for locating makros within the file system.
     """
 
+    cache: Optional[TranslationCache]
+    """The cache that translated files are stored in and read from. Set this to
+    None to always translate files
+    """
+
+    expansions: Optional[ExpansionCache]
+    """Recent macro invocations and their output, shared between every file
+    that is parsed. Set this to None to always run macros
+    """
+
     def __init__(self):
         """Constructs the Makros class, AVOID USING, USE ``.get()`` INSTEAD!
         """
 
+        self.cache = TranslationCache.from_environment()
+        self.expansions = ExpansionCache()
+
         self._bootstrap()
         self._resolver.add_lib(self)
 
@@ -44,78 +61,69 @@ class Makros:
         write
         """
 
-        # Define a fallback dictionary in case the HASH_FILE has not yet been
-        # created
-        macro_hash = {}
-
-        if isfile(HASH_FILE):
-            macro_hash = json.loads(open(HASH_FILE).read())
+        # Every process that uses makros runs this, so in the common case of
+        # nothing having changed, it should only cost a stat per file
+        state = BootstrapState(HASH_FILE)
 
         for folder in BOOTSTRAP_FOLDERS:
             folder_path = str(Path(__file__).parent.joinpath(folder))
 
-            # For all of the files in this folder, run bootstrap then update the
-            # macro hash if it has changed to avoid future recompiles
             for file in listdir(folder_path):
-                new_hash = self._bootstrap_file(folder_path, file, macro_hash)
-
-                if new_hash:
-                    macro_hash[folder_path + file] = new_hash
+                self._bootstrap_file(folder_path, file, state)
 
-        # Write the hash file back to disk
-        with open(HASH_FILE, 'w') as file:
-            file.write(json.dumps(macro_hash))
+        # The hash file is only written if something was bootstrapped
+        state.save()
 
-    def _bootstrap_file(self, folder_path, file, macro_hash):
+    def _bootstrap_file(self, folder_path: str, file: str,
+                        state: Optional[BootstrapState]) -> bool:
         """Will bootstrap a specific file if a similar version of that file has
         not already been boostraped
 
         Args:
             folder_path (str): THe folder the file will be contained in
             file (str): The file name and extension to be transpiled
-            macro_hash (dict): A dictionary containing the hashes of all of the already transpiled files
+            state (Optional[BootstrapState]): The files that have already been bootstrapped. If None, the file will always be bootstrapped
 
         Returns:
-            str: (Optional) the hash of the newly created file, if any
+            bool: If the file was bootstrapped
         """
 
-        # If the file doesn't exist or doesn't end with .mpy, we do not want to
-        # attempt to parse it
-        if not isfile(join(folder_path, file)) or not file.endswith('.mpy'):
-            return
+        # If the file doesn't end with .mpy, we do not want to attempt to parse
+        # it. This is checked first, as it doesn't need to touch the disk
+        if not file.endswith('.mpy'):
+            return False
 
-        # The sha256 checksum of the file, used to determine if the file has been
-        # chanced since the last time it was parsed
-        file_hash = sha256sum(join(folder_path, file))
+        path = join(folder_path, file)
+        if not isfile(path):
+            return False
 
-        # Will will skip if all of the following conditions are true
-        #  - The macro_hash object has been defined
-        #  - The macro_hash object contains this file
-        #  - The file hash matches the macro_hash of this file
-        is_in_hash = macro_hash is not None and folder_path + file in macro_hash
-        hash_matches = is_in_hash and file_hash == macro_hash[folder_path + file]
+        if state is not None and state.is_fresh(path,
+                                                path.replace('.mpy', '.py')):
+            return False
 
-        if hash_matches:
-            return
-
-        parser = self.get_parser(Path(join(folder_path, file)))
+        parser = self.get_parser(Path(path))
         parser.parse()
 
-        # Return the new macro hash so it can be updated
-        return file_hash
+        if state is not None:
+            state.record(path)
+
+        return True
 
-    def get_parser(self, path: Path) -> MakroParser:
+    def get_parser(self,
+                   path: Path,
+                   report: Optional[BuildReport] = None) -> MakroParser:
         """Returns a parser that is instanciated with access to the global
         resolver instance.
 
         Args:
             path (Path): The file you plan to be parsing. You can provide a fake path if you plan on parsing a string or a token list
+            report (Optional[BuildReport], optional): The report the parser should count files in. Defaults to a new report.
 
         Returns:
             MakroParser: The parser that you should use for parsing the file
         """
 
-        return MakroParser(path, self)
+        return MakroParser(path, self, report)
 
     @staticmethod
     def get() -> "Makros":
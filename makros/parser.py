@@ -1,12 +1,28 @@
+import ast
+import importlib.util
+import os
 from pathlib import Path
 import tokenize
-from typing import Generator, List, Tuple
+import re
+from types import CodeType
+from typing import AnyStr, Generator, Iterable, List, Optional, Pattern, Tuple
 
+from makros.bytecode import code_to_hash_pyc
+from makros.emitter import Emitter, MacroOutput, inline_expansions, render
 from makros.registration.macro_def import MacroDef
-from makros.tokens import Tokens
-from makros.utils import get_tokens_from_file, get_tokens_from_string, tokens_to_list
+from makros.registration.resolver import ResolutionError
+from makros.report import BuildReport
+from makros.scope import MacroScope
+from makros.splice import LogicalLines, leading_whitespace, region_tokens
+from makros.tokens import BufferedTokens, CompactTokens, Tokens
+from makros.utils import decode_source, find_macro_imports, get_tokens_from_bytes, get_tokens_from_string, tokens_to_list, write_atomic
 import makros.macros.macro_import as macro_import
 
+EMIT_MODES = ('py', 'pyc', 'both')
+"""What ``MakroParser.parse_path`` can write: a ``.py`` file, a ``.pyc`` file
+on its own, or a ``.py`` file with its bytecode in ``__pycache__``
+"""
+
 
 class MakroParser:
     """
@@ -18,36 +34,100 @@ class MakroParser:
     - parse_path: Parses the file at the provided path and writes content to disk
     - parse_string: Parses the string provided to the method and returns the output as a string
     - parse_tokens: Parses the tokens provided to the method and returns the output as a string
+    - stream_tokens: Parses the tokens provided to the method and yields the output in chunks
+    - stream_source: Splices macro expansions into the source provided to the method, yielding the output in chunks
+    - compile_path: Parses the file at the provided path and compiles it to a code object, without writing anything
+    - compile_string: Parses the string provided to the method and compiles it to a code object
+    - compile_bytes: Parses the file contents provided to the method and compiles them to a code object
 
     Internally, the following state is maintained, it is generally good to avoid
     changing it:
 
-    - available_macros
+    - scope
     - current_indentation
 
-    Because internal state is maintained, it is generally a good idea to create
-    a new parser instance for each file that is being parsed.
+    This state is reset every time a new set of tokens is parsed, but it is
+    still generally a good idea to create a new parser instance for each file
+    that is being parsed.
     """
 
-    available_macros: List[MacroDef] = []
-    """The macros that have been imported into the file
+    scope: MacroScope
+    """The macros that have been imported into the file, keyed by their trigger
     """
 
     current_indentation: str = ''
     """The current indentation level of the macro file
     """
 
-    def __init__(self, file_path: Path,
-                 global_controller: "makros.makros.Makros"):
+    lookahead: Optional[int] = None
+    """When set, tokens are read lazily from the tokenizer instead of being
+    loaded into a list first. Macros will only be able to look this many tokens
+    ahead of the current one, but memory usage no longer grows with the size of
+    the file
+    """
+
+    compact_tokens: bool = False
+    """When set, tokens are stored in a ``CompactTokens`` instance, which uses a
+    fraction of the memory of a list of tokens. This is ignored if
+    ``lookahead`` has been set
+    """
+
+    chunk_lines: int = 1024
+    """How many lines are collected before they are yielded by
+    ``stream_tokens``
+    """
+
+    splice: bool = False
+    """When set, files are not tokenized as a whole. Instead, only the lines
+    that start a statement with a macro trigger are tokenized, and everything
+    else is copied across untouched. Note that in this mode macros can only be
+    triggered at the start of a statement
+    """
+
+    emit: str = 'py'
+    """What is written by ``parse_path``, one of ``EMIT_MODES``. When bytecode
+    is emitted, it is compiled in memory and written as a hash based pyc (PEP
+    552). Bytecode on its own is written next to the source, where python will
+    import it without a ``.py`` file
+    """
+
+    def __init__(self,
+                 file_path: Path,
+                 global_controller: "makros.makros.Makros",
+                 report: Optional[BuildReport] = None):
         self.file_path = file_path
         self.global_controller = global_controller
+        self.report = report if report is not None else BuildReport()
+
+        self.scope = MacroScope()
+
+        # The macros that were used by the last call to parse_path
+        self.imported: List[MacroDef] = []
+
+        # When compiling, macros that produce ast nodes have them stored here
+        # instead of being converted into code
+        self._expansions: Optional[List[List[ast.stmt]]] = None
+
+    @property
+    def output_variant(self) -> str:
+        """A string that describes any options that change the output of the
+        parser. Files translated with different variants will not match
+        """
+
+        return 'splice' if self.splice else ''
+
+    @property
+    def available_macros(self) -> List[MacroDef]:
+        """The macros that have been imported into the file
+        """
+
+        return self.scope.macros
 
     def parse_tokens(
             self, raw_tokens: Generator[tokenize.TokenInfo, None,
                                         None]) -> str:
         """
-        This is the base parsing method, which will convert a number of 
-        tokens into a valid python file.
+        Converts a number of tokens into a valid python file.
 
         Args:
             raw_tokens (Generator[tokenize.TokenInfo, None, None]): The tokens that will be used by the parser
@@ -56,93 +136,134 @@ class MakroParser:
             str: The python file generated from expanding any containing macros
         """
 
-        tokens = Tokens(tokens_to_list(raw_tokens), str(self.file_path))
+        return ''.join(self.stream_tokens(raw_tokens))
+
+    def stream_tokens(
+        self, raw_tokens: Generator[tokenize.TokenInfo, None, None]
+    ) -> Generator[str, None, None]:
+        """
+        This is the base parsing method, which will convert a number of 
+        tokens into a valid python file. The output is yielded in chunks as it
+        is generated, so it never has to be held in memory all at once.
+
+        Args:
+            raw_tokens (Generator[tokenize.TokenInfo, None, None]): The tokens that will be used by the parser
+
+        Yields:
+            str: The next chunk of the python file generated from expanding any containing macros
+        """
+
+        if self.lookahead is not None:
+            tokens = BufferedTokens(raw_tokens, str(self.file_path),
+                                    self.lookahead)
+        elif self.compact_tokens:
+            tokens = CompactTokens(raw_tokens, str(self.file_path))
+        else:
+            tokens = Tokens(tokens_to_list(raw_tokens), str(self.file_path))
+
+        # Each file gets its own set of macros, so macros imported into one file
+        # do not leak into the next one that is parsed
+        self.scope = MacroScope()
+        self.current_indentation = ''
 
         # Note that we set this when parsing as some users may wish to parse
         # different files at different times
         self.global_controller._resolver.cwd = self.file_path.parent
 
-        current_line = -1  # We are starting at -1 to make sure we include the first line of the file
-        output = ""
+        emitter = Emitter(self._expansions)
 
         for token in tokens:
-            # We need to keep track of by how much each line is indented, so if
-            # a macro is inside of an indented block (e.g. a function), the
-            # code that is outputted will still correctly execute.
-            if token.type == tokenize.INDENT:
-                self.current_indentation += token.string
-
-                # Indentation tokens are done before macro parsing, so they can
-                # lead to the macro value being passed through to the output
-                continue
-            
-            if  token.type == tokenize.DEDENT:
-                self.current_indentation = self.current_indentation[:-len(token.string)]
-            
-            # End of indentation correction
-
             # If the token is of type name, we need to check if the token will
             # trigger a macro and, if it will, pass it over to that macro to
             # handle
             if token.type == tokenize.NAME:
                 # This handles the import macro, which has been hard coded to
                 # because it requires some more complex logic than a standard
-                # macro, i.e. access to the available_macros List
+                # macro, i.e. access to the macro scope
                 if token.string == 'macro':
-                    # Grab a copy of the parser
-                    parser = macro_import.Parser()
-
-                    # Parse the macro. Note that we will not be using the
-                    # translate module of the macro, as we have to handle custom
-                    # state within this class regarding it
-                    macro_ast = parser.parse(tokens)
-                    macro_string = macro_ast.module.string
-
-                    # If the macro attribute is specified, it means that it is
-                    # an external macro, which needs to have a different path
-                    if macro_ast.macro:
-                        macro_string += "."
-                        macro_string += macro_ast.macro.string
-
-                    # Add the macro to the list of available macros after the
-                    # resolver method has found it
-                    self.available_macros.append(
-                        self.global_controller._resolver.resolve(macro_string))
-
-                    # Provide a reference comment to the developer
-                    output += f"# Macro imported: {macro_string}\n"
-                    
+                    emitter.text(self._import_macro(tokens))
+                    emitter.consumed(tokens.previous())
+
                     # Don't let anything else touch this macro
                     continue
 
+                # Macros that are inside of an indented block (e.g. a function)
+                # need to be output at the same indentation to still execute
+                self.current_indentation = emitter.indentation
+
                 # Check if the macro is actually a macro. If it is, enabled will
                 # be set to true. The logic is not here, because it is messy
                 enabled, returned = self._parse_macro(tokens, token)
 
-                # The returned value will be empty if the macro is not enabled
-                output += returned
-
                 # Enabled will only be true if parse_macro has found a macro. So
                 # we should only skip the token if it has found a macro,
                 # otherwise, we want other like-based token logic to run
                 if enabled:
+                    emitter.expansion(returned)
+                    emitter.consumed(tokens.previous())
                     continue
 
-            # We want to only keep one of each line, and only lines without
-            # a macro on them. This is my current solution, but if you have
-            # a better one, feel free to create a PR
-            #
-            # NOTE: Might it be a good idea to use the untokenise part of the
-            # python tokeniser and just get the macros to return a list of tokens
-            # rather than a string? That might reduce the number of bugs with
-            # string handling and simplify this kind of code.
-            if token.start[
-                    0] > current_line and token.type != tokenize.DEDENT and token.type != tokenize.NEWLINE:
-                output += token.line
-                current_line = token.start[0]
-
-        # Write the macro to the disk
-        return output
+            # Everything else is passed through as the lines it came from. They
+            # are only joined together every so often, rather than for each
+            # line
+            emitter.token(token)
+
+            if emitter.pending >= self.chunk_lines:
+                yield emitter.flush()
+
+        output = emitter.flush()
+        if output:
+            yield output
+
+    def stream_source(self, source: str) -> Generator[str, None, None]:
+        """
+        Expands the macros in the provided source without tokenizing all of it.
+        A cheap scan looks for statements that start with a macro trigger, and
+        only those regions are tokenized and handed to the macro. Everything
+        between them is yielded exactly as it was written.
+
+        Args:
+            source (str): The source code of the file
+
+        Yields:
+            str: The next chunk of the python file generated from expanding any containing macros
+        """
+
+        lines = source.splitlines(keepends=True)
+
+        self.scope = MacroScope()
+        self.current_indentation = ''
+        self.global_controller._resolver.cwd = self.file_path.parent
+
+        scanner = LogicalLines()
+        triggers = self._trigger_pattern()
+
+        # The first line that has not been yielded yet. Lines are only yielded
+        # when a macro is found, so untouched code is copied in large slices
+        copied_from = 0
+        index = 0
+
+        while index < len(lines):
+            if scanner.at_statement and triggers.match(lines[index]):
+                if copied_from < index:
+                    yield ''.join(lines[copied_from:index])
+
+                index, expansion = self._splice_region(lines, index)
+                yield expansion
+
+                copied_from = index
+                scanner.reset()
+
+                # The region may have been a macro import, which adds another
+                # trigger
+                triggers = self._trigger_pattern()
+                continue
+
+            scanner.feed(lines[index])
+            index += 1
+
+        if copied_from < len(lines):
+            yield ''.join(lines[copied_from:])
 
     def parse_string(self, string: str) -> str:
         """Expand any macros used in the inputted string
@@ -154,11 +275,110 @@ class MakroParser:
             str: The python generated from expanding the containing macros.
         """
 
+        if self.splice:
+            return ''.join(self.stream_source(string))
+
         # Take advantage of pythons tokenizer to tokenise the file and build a
         # helper object around it
         raw_tokens = get_tokens_from_string(string)
         return self.parse_tokens(raw_tokens)
 
+    def compile_string(self, string: str) -> CodeType:
+        """Expands any macros used in the string and compiles the result. Macros
+        whose translators provide ``translate_ast`` are compiled straight from
+        their ast nodes, without being converted into code first.
+
+        Args:
+            string (str): The string that contains macros to be expanded
+
+        Returns:
+            CodeType: The compiled module, which can be run with ``exec``
+        """
+
+        return self._compile(string, str(self.file_path))
+
+    def compile_path(self, path: Path) -> CodeType:
+        """Reads the provided path, expands any macros in it and compiles the
+        result. Nothing is written to the disk
+
+        Args:
+            path (Path): The path you wish to compile
+
+        Returns:
+            CodeType: The compiled module, which can be run with ``exec``
+        """
+
+        with open(path, 'rb') as file:
+            source = file.read()
+
+        return self.compile_bytes(source, path)
+
+    def compile_bytes(self, source: bytes, path: Path) -> CodeType:
+        """Expands any macros in the contents of a file that has already been
+        read and compiles the result
+
+        Args:
+            source (bytes): The contents of the file
+            path (Path): The path the contents were read from, which is used as the filename of the code
+
+        Returns:
+            CodeType: The compiled module, which can be run with ``exec``
+        """
+
+        if not find_macro_imports(source):
+            return compile(source, str(path), 'exec', dont_inherit=True)
+
+        return self._compile(decode_source(source), str(path))
+
+    def resolve_imports(self, imports: List[str],
+                        strict: bool = True) -> List[MacroDef]:
+        """Finds the macros that are imported by this file, e.g. from the output
+        of ``find_macro_imports``
+
+        ``find_macro_imports`` also finds imports inside of strings, which may
+        not exist. When building a cache key they can be skipped by turning off
+        ``strict``: any import that is real will fail again when the file is
+        parsed, and the file's contents are part of the key anyway
+
+        Args:
+            imports (List[str]): The import strings, e.g. ['enum', 'local.hello']
+            strict (bool, optional): Raise an error for imports that cannot be resolved, rather than skipping them. Defaults to True.
+
+        Raises:
+            ResolutionError: If ``strict`` is set and an import cannot be resolved
+
+        Returns:
+            List[MacroDef]: The macros
+        """
+
+        resolver = self.global_controller._resolver
+        resolver.cwd = self.file_path.parent
+
+        if strict:
+            return [resolver.resolve(name) for name in imports]
+
+        macros = []
+
+        for name in imports:
+            try:
+                macros.append(resolver.resolve(name))
+            except ResolutionError:
+                continue
+
+        return macros
+
+    def _compile(self, string: str, filename: str) -> CodeType:
+        self._expansions = []
+
+        try:
+            source = self.parse_string(string)
+            expansions = self._expansions
+        finally:
+            self._expansions = None
+
+        module = inline_expansions(ast.parse(source, filename), expansions)
+        return compile(module, filename, 'exec', dont_inherit=True)
+
     def parse(self) -> None:
         """Reads the file provided in the Parser constructor, expands any of the
         containing macros and outputs them back to the disk. 
@@ -166,26 +386,220 @@ class MakroParser:
 
         self.parse_path(self.file_path)
 
+    def output_path(self, path: Path) -> Path:
+        """The file that ``parse_path`` writes the provided file to. This is a
+        ``.pyc`` file when only bytecode is emitted, otherwise a ``.py`` file
+
+        Args:
+            path (Path): The ``.mpy`` file
+
+        Returns:
+            Path: The output file
+        """
+
+        if self.emit == 'pyc':
+            return Path(path).with_suffix('.pyc')
+
+        return Path(str(path).replace('.mpy', '.py'))
+
     def parse_path(self, path: Path) -> None:
-        """Parses the provided path and writes the contents to disk
+        """Parses the provided path and writes the contents to disk. What is
+        written depends on ``emit``
 
         Args:
             path (Path): The path you wish to parse
         """
 
-        # Take advantage of pythons tokenizer to tokenise the file and build a
-        # helper object around it
-        raw_tokens = get_tokens_from_file(str(path))
+        if self.emit not in EMIT_MODES:
+            raise ValueError(
+                f'Cannot emit "{self.emit}", expected one of {EMIT_MODES}')
+
+        out_path = str(self.output_path(path))
+
+        with open(path, 'rb') as file:
+            source = file.read()
+
+        self.imported = []
+        imports = find_macro_imports(source)
+
+        # Bytecode on its own can be compiled straight from the source, there is
+        # no need to produce any text for it
+        if self.emit == 'pyc':
+            code = self.compile_bytes(source, path)
+            self._write_bytecode(out_path, code,
+                                 importlib.util.source_hash(source))
+
+            if imports:
+                self.imported = self.scope.macros
+                self.report.translated += 1
+            else:
+                self.report.copied += 1
+
+            return
+
+        # Plenty of files do not use any macros. There is no point tokenizing
+        # them, they can just be copied across
+        if not imports:
+            self._write_source(out_path, [source], binary=True)
+            self.report.copied += 1
+            return
+
+        # Files are looked up in the cache by their contents and the macros
+        # they import, so the macros need to be found before anything else
+        cache = self.global_controller.cache
+        if cache is not None:
+            macros = self.resolve_imports(imports, strict=False)
+            key = cache.key(source, macros, self.output_variant)
+            cached = cache.get(key)
+
+            if cached is not None:
+                self._write_source(out_path, [cached], binary=True)
+                self.imported = macros
+                self.report.cached += 1
+                return
+
+        if self.splice:
+            chunks = self.stream_source(decode_source(source))
+        else:
+            # Take advantage of pythons tokenizer to tokenise the file and build
+            # a helper object around it
+            chunks = self.stream_tokens(get_tokens_from_bytes(source))
+
+        # Stream the macro to the disk. The output is only moved over the
+        # target once it is complete, so nothing will ever see half a file
+        output = self._write_source(out_path, chunks)
+        self.imported = self.scope.macros
+        self.report.translated += 1
+
+        if cache is not None:
+            if output is None:
+                with open(out_path, 'rb') as file:
+                    output = file.read()
+
+            cache.put(key, output)
+
+    def _write_source(self, path: str, chunks: Iterable[AnyStr],
+                      binary: bool = False) -> Optional[bytes]:
+        if self.emit == 'py':
+            self._write_output(path, chunks, binary)
+            return None
+
+        # The bytecode has to match the bytes on disk exactly, so the output is
+        # collected in memory and compiled from there rather than read back
+        if binary:
+            output = b''.join(chunks)
+        else:
+            output = ''.join(chunks).encode('utf-8')
+
+        self._write_output(path, [output], binary=True)
+
+        code = compile(output, path, 'exec', dont_inherit=True)
+        self._write_bytecode(importlib.util.cache_from_source(path), code,
+                             importlib.util.source_hash(output))
+
+        return output
+
+    def _write_bytecode(self, path: str, code: CodeType,
+                        source_hash: bytes) -> None:
+        # Bytecode next to a .py file is checked against it whenever it is
+        # imported. Bytecode on its own has nothing to be checked against
+        checked = self.emit != 'pyc'
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._write_output(path, [code_to_hash_pyc(code, source_hash, checked)],
+                           binary=True)
+
+    def _write_output(self, path: str, chunks: Iterable[AnyStr],
+                      binary: bool = False) -> None:
+        # Rewriting a file that has not changed would change its modification
+        # time, which makes python throw away its cached bytecode
+        if write_atomic(path, chunks, binary, only_if_changed=True):
+            self.report.rewritten += 1
+        else:
+            self.report.unchanged += 1
+
+    def _import_macro(self, tokens: Tokens) -> str:
+        """Handles a ``macro import`` statement, adding the macro to the scope of
+        this file
+
+        Args:
+            tokens (Tokens): The tokens, positioned just after the ``macro`` token
+
+        Returns:
+            str: A comment to put in place of the import
+        """
+
+        # Grab a copy of the parser
+        parser = macro_import.Parser()
+
+        # Parse the macro. Note that we will not be using the translate module
+        # of the macro, as we have to handle custom state within this class
+        # regarding it
+        macro_ast = parser.parse(tokens)
+        macro_string = macro_ast.module.string
+
+        # If the macro attribute is specified, it means that it is an external
+        # macro, which needs to have a different path
+        if macro_ast.macro:
+            macro_string += "."
+            macro_string += macro_ast.macro.string
+
+        # Add the macro to the scope of this file after the resolver method has
+        # found it
+        self.scope.add(self.global_controller._resolver.resolve(macro_string))
 
-        output = self.parse_tokens(raw_tokens)
+        # Provide a reference comment to the developer
+        return f"# Macro imported: {macro_string}\n"
 
-        # Write the macro to the disk
-        out_path = str(path).replace('.mpy', '.py')
-        with open(out_path, 'w') as file:
-            file.write(output)
+    def _trigger_pattern(self) -> Pattern[str]:
+        """Builds a regex that matches lines starting with ``macro`` or any of
+        the triggers that are currently in scope
+        """
+
+        names = ['macro', *self.scope.triggers]
+        return re.compile(r'[ \t]*(?:' + '|'.join(map(re.escape, names)) +
+                          r')\b')
+
+    def _splice_region(self, lines: List[str], start: int) -> Tuple[int, str]:
+        """Tokenizes the file from the provided line onwards and hands it to the
+        macro that the line starts with. Tokenizing stops as soon as the macro
+        has finished with the tokens.
+
+        Args:
+            lines (List[str]): All of the lines in the file
+            start (int): The index of the line that starts with a trigger
+
+        Returns:
+            Tuple[int, str]: The index of the first line after the macro, and the output of the macro
+        """
+
+        self.current_indentation = leading_whitespace(lines[start])
+
+        tokens = BufferedTokens(
+            region_tokens(lines, start, self.current_indentation),
+            str(self.file_path),
+            16 if self.lookahead is None else self.lookahead)
+        token = tokens.advance()
+
+        if token.string == 'macro':
+            expansion = self._import_macro(tokens)
+        else:
+            expansion = render(self._parse_macro(tokens, token)[1],
+                               self.current_indentation, self._expansions)
+
+        # A dedent (or the end of the file) belongs to the next statement, so
+        # that line has not been used by the macro. Anything else finished on
+        # the last line that was used
+        last = tokens.previous()
+        if last.type in (tokenize.DEDENT, tokenize.ENDMARKER):
+            end = start + last.start[0] - 1
+        else:
+            end = start + last.end[0]
+
+        return min(end, len(lines)), expansion
 
     def _parse_macro(self, tokens: Tokens,
-                    token: tokenize.TokenInfo) -> Tuple[bool, str]:
+                    token: tokenize.TokenInfo) -> Tuple[bool, MacroOutput]:
         """This function is called on every name token to see if it matches one
         of the custom imported macros.
 
@@ -194,37 +608,16 @@ class MakroParser:
             token (tokenize.Token): The trigger token
 
         Returns:
-            Tuple[bool, str]: The status of the macro, the first one is if a macro was found and the second one is its output
-        """
-
-        # Search through the macros that have been imported into this file and
-        # see if the trigger token of any of them matches the current token
-        for macro in self.available_macros:
-            if macro.trigger_token.string == token.string:
-                # The parser class is imported when the macro is imported. Here
-                # we just retrieve the parser class
-                Parser = macro.parser_module.Parser
-                parser = Parser()
-
-                # Parsers **MUST** always have a parse function, otherwise they
-                # are not a parser. This is layed out in the implementation docs
-                macro_ast = parser.parse(tokens)
-
-                # If there is a linter, we should run it. There is not
-                # currently any linters, and the code is not tested, but may as 
-                # well add the infrastructure.
-                if hasattr(macro.parser_module, 'Linter'):
-                    Linter = macro.parser_module.Linter
-                    linter = Linter()
-                    linter.lint(macro_ast)
-
-                # Passes the AST into a translator module. Responsible
-                # for creating python string from the AST.
-                Translator = macro.parser_module.Translator
-                translator = Translator()
-
-                # Don't trust the developer (probably me) to provide leading and
-                # trailing new lines
-                return (True, "\n" + f'\n{self.current_indentation}'.join(translator.translate(macro_ast).split('\n')) + "\n")
-
-        return (False, "")
+            Tuple[bool, MacroOutput]: The status of the macro, the first one is if a macro was found and the second one is its output
+        """
+
+        # Macros are stored by their trigger, so most name tokens will only
+        # cost a single failed lookup
+        macro = self.scope.get(token.string)
+
+        if macro is None:
+            return (False, "")
+
+        return (True,
+                macro.expand(tokens, self._expansions is not None,
+                             self.global_controller.expansions))
@@ -0,0 +1,196 @@
+import copy
+import importlib.util
+import io
+import json
+import zipfile
+import zipimport
+from pathlib import Path
+from types import CodeType
+from typing import Dict, Optional
+
+from makros.bytecode import code_to_hash_pyc
+from makros.utils import decode_source, file_fingerprint, write_atomic
+
+ARCHIVE_SUFFIX = '.makros'
+"""The file extension of a macro package archive, see ``build_archive``
+"""
+
+MANIFEST_NAME = 'macros.json'
+
+# Every file gets the same timestamp, so building the same package twice
+# produces the same archive
+_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def is_archive(path: Path) -> bool:
+    """Checks if a macro package is an archive rather than a folder
+
+    Args:
+        path (Path): The path to the package
+
+    Returns:
+        bool: True if the package is an archive
+    """
+
+    return str(path).endswith(ARCHIVE_SUFFIX)
+
+
+def archive_module(file: str) -> str:
+    """The name that the module for a macro file is stored under in an archive
+
+    Args:
+        file (str): The file of the macro, from the package's manifest
+
+    Returns:
+        str: The module name, e.g. ``hello`` for ``hello.mpy``
+    """
+
+    return Path(file).with_suffix('').as_posix().replace('/', '.')
+
+
+# The fingerprint of every archive when zipimport last read its directory
+_fingerprints: Dict[str, str] = {}
+
+
+def _importer(path: str, folder: str = '') -> zipimport.zipimporter:
+    # zipimport keeps the directory of every archive it has opened, keyed by
+    # its path. Reading a rebuilt archive through an old directory fails, so
+    # it is read again whenever the archive changes
+    path = str(path)
+    fingerprint = file_fingerprint(path)
+
+    if _fingerprints.get(path) != fingerprint:
+        if hasattr(zipimport.zipimporter, 'invalidate_caches'):
+            zipimport.zipimporter(path).invalidate_caches()
+        else:
+            zipimport._zip_directory_cache.pop(path, None)
+
+        _fingerprints[path] = fingerprint
+
+    return zipimport.zipimporter(path + '/' + folder if folder else path)
+
+
+def read_archive_file(path: str, name: str) -> bytes:
+    """Reads a file out of an archive. zipimport keeps the contents of every
+    archive it has opened, so this does not open the archive again unless it
+    has changed
+
+    Args:
+        path (str): The archive
+        name (str): The file within the archive, e.g. ``macros.json``
+
+    Returns:
+        bytes: The contents of the file
+    """
+
+    return _importer(path).get_data(name)
+
+
+def load_archive_code(path: str, module: str) -> CodeType:
+    """Loads the compiled code of a module from an archive
+
+    Args:
+        path (str): The archive
+        module (str): The name of the module, see ``archive_module``
+
+    Returns:
+        CodeType: The code of the module
+    """
+
+    # zipimport only looks for the last part of a dotted name, within the
+    # folder that the importer was created for
+    folder, _, name = module.rpartition('.')
+    if folder:
+        folder = folder.replace('.', '/') + '/'
+
+    return _importer(path, folder).get_code(name)
+
+
+def build_archive(folder: Path, output: Optional[Path] = None) -> Path:
+    """Packages a macro package into a single archive. Every macro is
+    translated and compiled ahead of time, so loading a macro from the archive
+    does not need to bootstrap anything or look at any other file. Archives are
+    found in the same places as package folders, and are used the same way.
+
+    The compiled code only works on the version of python that built it. The
+    translated source is also stored, which other versions fall back to.
+
+    .. code-block:: python
+
+        from makros import build_archive
+
+        build_archive(Path('./greet'))  # Creates ./greet.makros
+
+    Args:
+        folder (Path): The folder containing the package's ``macros.json``
+        output (Optional[Path], optional): Where to write the archive. Defaults to the folder's path with ``.makros`` added.
+
+    Returns:
+        Path: The archive
+    """
+
+    # The manifest loader is bootstrapped from a .mpy file, so makros has to
+    # be set up before it can be imported
+    from makros.makros import Makros
+    Makros.get()
+
+    from makros.registration.manifest import PackageManifest
+
+    folder = Path(folder)
+    output = Path(output) if output is not None else Path(
+        str(folder) + ARCHIVE_SUFFIX)
+
+    manifest = PackageManifest.load(folder.joinpath(MANIFEST_NAME))
+    contents = copy.deepcopy(manifest.contents)
+
+    # Everything is translated now, so there is nothing left to bootstrap
+    contents['bootstrap'] = []
+
+    buffer = io.BytesIO()
+
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        written = set()
+
+        for original, macro in zip(manifest.macros, contents['macros']):
+            module = archive_module(original['file'])
+            macro['file'] = module.replace('.', '/') + '.py'
+
+            if module in written:
+                continue
+
+            written.add(module)
+
+            # Manifests list the .py file that a bootstrapped .mpy file turns
+            # into, which may be out of date or not exist yet
+            source_path = folder.joinpath(original['file'])
+            if source_path.with_suffix('.mpy').is_file():
+                source_path = source_path.with_suffix('.mpy')
+
+            with open(source_path, 'rb') as file:
+                source = file.read()
+
+            if source_path.suffix == '.mpy':
+                source = Makros.get().get_parser(source_path).parse_string(
+                    decode_source(source)).encode('utf-8')
+
+            filename = f'{folder.name}/{macro["file"]}'
+            code = compile(source, filename, 'exec', dont_inherit=True)
+
+            _write_member(archive, macro['file'], source)
+            _write_member(
+                archive, macro['file'] + 'c',
+                code_to_hash_pyc(code,
+                                 importlib.util.source_hash(source),
+                                 checked=False))
+
+        _write_member(archive, MANIFEST_NAME,
+                      json.dumps(contents, indent=4).encode('utf-8'))
+
+    write_atomic(str(output), [buffer.getvalue()], binary=True)
+    return output
+
+
+def _write_member(archive: zipfile.ZipFile, name: str, contents: bytes):
+    info = zipfile.ZipInfo(name, _DATE_TIME)
+    info.external_attr = 0o644 << 16
+    archive.writestr(info, contents)
@@ -1,6 +1,60 @@
 from tokenize import TokenInfo
+from types import ModuleType
+from typing import Dict, Optional, Tuple
 import importlib.util as _importlib_util
 
+from makros.registration.archive import load_archive_code
+from makros.utils import file_fingerprint
+
+# Every macro module that has been loaded, keyed by its path, along with the
+# fingerprint of the file it was loaded from
+_modules: Dict[str, Tuple[str, ModuleType]] = {}
+
+
+def load_macro_module(macro_name: str,
+                      path: str,
+                      archive_module: Optional[str] = None) -> ModuleType:
+    """Loads the module that contains a macro's parser and translator. Modules
+    are only executed once per process, unless the file changes
+
+    Args:
+        macro_name (str): The name of the macro, used as the name of the module
+        path (str): The python file containing the macro, or the archive it is in
+        archive_module (Optional[str], optional): The name of the module within the archive, if the macro is in one. Defaults to None.
+
+    Returns:
+        ModuleType: The executed module
+    """
+
+    key = path if archive_module is None else f'{path}:{archive_module}'
+    fingerprint = file_fingerprint(path)
+    cached = _modules.get(key)
+
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    # Archives contain compiled code, so there is no need for a loader
+    if archive_module is not None:
+        module = ModuleType(macro_name)
+        module.__file__ = f'{path}/{archive_module.replace(".", "/")}.pyc'
+
+        exec(load_archive_code(path, archive_module), module.__dict__)
+        _modules[key] = (fingerprint, module)
+
+        return module
+
+    # Stolen from stack overflow: https://stackoverflow.com/questions/41861427/python-3-5-how-to-dynamically-import-a-module-given-the-full-file-path-in-the
+    spec = _importlib_util.spec_from_file_location(macro_name, path)
+    module = _importlib_util.module_from_spec(spec)
+
+    if module is None:
+        raise Exception("Module is None")
+
+    spec.loader.exec_module(module)
+    _modules[key] = (fingerprint, module)
+
+    return module
+
 
 class MacroDef:
     macro_name: str
@@ -8,19 +62,31 @@ class MacroDef:
     trigger_token: TokenInfo
     parser_file_location: str
 
-    def __init__(self, macro_name: str, trigger_token: TokenInfo,
-                 parser_file_location: str) -> None:
+    def __init__(self,
+                 macro_name: str,
+                 trigger_token: TokenInfo,
+                 parser_file_location: str,
+                 archive_module: Optional[str] = None) -> None:
         self.macro_name = macro_name
         self.trigger_token = trigger_token
         self.parser_file_location = parser_file_location
-        
-        # Stolen from stack overflow: https://stackoverflow.com/questions/41861427/python-3-5-how-to-dynamically-import-a-module-given-the-full-file-path-in-the
-        spec = _importlib_util.spec_from_file_location(
-            macro_name, parser_file_location)
-        module = _importlib_util.module_from_spec(spec)
 
-        if module is None:
-            raise Exception("Module is None")
+        # Macros from an archive are located at the archive, and this is the
+        # module within it
+        self.archive_module = archive_module
+
+        self._parser_module: Optional[ModuleType] = None
+
+    @property
+    def parser_module(self) -> ModuleType:
+        """The module containing the macro's parser and translator. This is
+        loaded the first time the macro is used, so importing a macro that is
+        never triggered is free
+        """
+
+        if self._parser_module is None:
+            self._parser_module = load_macro_module(self.macro_name,
+                                                    self.parser_file_location,
+                                                    self.archive_module)
 
-        spec.loader.exec_module(module)
-        self.parser_module = module
+        return self._parser_module
@@ -1,15 +1,15 @@
-from genericpath import isdir
-from os import listdir, walk
-from os.path import join
-import sysconfig
+import importlib.util
+from os import stat, walk
+from os.path import basename, isfile, join
+import sys
 from pathlib import Path
 import token
 from tokenize import TokenInfo
-from typing import Optional
+from typing import Dict, List, Optional, Set, Tuple
 
+from makros.registration.archive import ARCHIVE_SUFFIX, archive_module, is_archive
 from makros.registration.macro_def import MacroDef
-
-SITE_PACKAGES = sysconfig.get_path('purelib')
+from makros.state import BootstrapState, bootstrap_state_path
 
 PackageManifest = None
 
@@ -18,6 +18,273 @@ class ResolutionError(Exception):
     pass
 
 
+PRUNED_FOLDERS = {'__pycache__', 'node_modules', 'site-packages'}
+"""Folders that are never searched for local macro packages. Hidden folders
+(e.g. ``.git``) and virtual environments are also skipped
+"""
+
+
+def _pruned(parent: str, folder: str) -> bool:
+    return (folder.startswith('.') or folder in PRUNED_FOLDERS
+            or isfile(join(parent, folder, 'pyvenv.cfg')))
+
+
+def _is_package(path: Path) -> bool:
+    if is_archive(path):
+        return path.is_file()
+
+    return path.joinpath('macros.json').is_file()
+
+
+class LocalIndex:
+    """
+    An index of the macro packages (folders containing a ``macros.json`` and
+    ``.makros`` archives) within a folder, keyed by the name of the package. The folder is
+    only walked once, after which finding a package is a dictionary lookup.
+    Packages can be looked for within any folder that was walked, so one index
+    can be shared by every folder within its root.
+
+    The modification time of every folder that was walked is remembered.
+    Adding or removing a folder changes the modification time of its parent,
+    so the index is rebuilt if any of them change. Names that could not be
+    found are remembered, and are only looked for again once the index has
+    been rebuilt.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root).absolute()
+
+        # Every package with each name, closest to the root first
+        self.packages: Dict[str, List[Path]] = {}
+        self.missing: Set[Tuple[str, str]] = set()
+        self._mtimes: Dict[str, int] = {}
+
+        self._build()
+
+    def _build(self) -> None:
+        self.packages = {}
+        self.missing = set()
+        self._mtimes = {}
+
+        for folder, folders, files in walk(str(self.root)):
+            try:
+                self._mtimes[folder] = stat(folder).st_mtime_ns
+            except OSError:
+                continue
+
+            folders[:] = sorted(
+                child for child in folders if not _pruned(folder, child))
+
+            if 'macros.json' in files:
+                self.packages.setdefault(basename(folder),
+                                         []).append(Path(folder))
+
+            for file in sorted(files):
+                if is_archive(file):
+                    self.packages.setdefault(file[:-len(ARCHIVE_SUFFIX)],
+                                             []).append(Path(folder, file))
+
+        # The walk goes all of the way down one folder before moving on to the
+        # next, so the packages are sorted to put the closest first. Packages
+        # at the same depth stay in the order of their names
+        for paths in self.packages.values():
+            paths.sort(key=lambda path: len(path.parts))
+
+    def covers(self, folder: Path) -> bool:
+        """Checks if a folder was walked when the index was built, which means
+        packages can be looked for within it
+
+        Args:
+            folder (Path): An absolute path to the folder
+
+        Returns:
+            bool: True if ``find`` can be used for the folder
+        """
+
+        folder = str(folder)
+
+        # The folder may have been created since the index was built
+        if folder not in self._mtimes and self.stale():
+            self._build()
+
+        return folder in self._mtimes
+
+    def stale(self) -> bool:
+        """Checks if any of the folders in the index have changed since it was
+        built. This only costs a stat of each folder
+
+        Returns:
+            bool: True if the index needs to be rebuilt
+        """
+
+        for folder, mtime in self._mtimes.items():
+            try:
+                if stat(folder).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+
+        return False
+
+    def _closest(self, name: str, folder: Path) -> Optional[Path]:
+        for path in self.packages.get(name, []):
+            if path == folder or folder in path.parents:
+                return path
+
+        return None
+
+    def find(self, name: str, folder: Optional[Path] = None) -> Optional[Path]:
+        """Finds the macro package with the provided name. If there are
+        multiple, the one closest to the folder is used
+
+        Args:
+            name (str): The name of the package's folder
+            folder (Optional[Path], optional): An absolute path to the folder to look within, see ``covers``. Defaults to the root.
+
+        Returns:
+            Optional[Path]: The package's folder, if there is one
+        """
+
+        folder = self.root if folder is None else Path(folder)
+        path = self._closest(name, folder)
+
+        if path is not None and _is_package(path):
+            return path
+
+        if (name, str(folder)) in self.missing and not self.stale():
+            return None
+
+        # Either the package has been moved or this is the first time it has
+        # been looked for, so make sure the index is up to date
+        if path is not None or self.stale():
+            self._build()
+            path = self._closest(name, folder)
+
+            if path is not None:
+                return path
+
+        self.missing.add((name, str(folder)))
+        return None
+
+
+ENTRY_POINT_GROUP = 'makros.packages'
+"""The entry point group that installed macro packages are registered under.
+The name of each entry point is the name of the package, used in
+``macro import <name>.<macro>``, and its value is the python package containing
+the ``macros.json``
+"""
+
+
+def _entry_points(group: str) -> list:
+    try:
+        from importlib import metadata
+    except ImportError:
+        return []
+
+    points = metadata.entry_points()
+
+    # Python 3.10 changed entry_points to return a filterable collection
+    if hasattr(points, 'select'):
+        return list(points.select(group=group))
+
+    return list(points.get(group, []))
+
+
+def _package_folder(module: str) -> Optional[Path]:
+    try:
+        spec = importlib.util.find_spec(module)
+    except (ImportError, ValueError):
+        return None
+
+    if spec is None or not spec.submodule_search_locations:
+        return None
+
+    folder = Path(list(spec.submodule_search_locations)[0])
+    return folder if folder.joinpath('macros.json').is_file() else None
+
+
+def _package_archive(name: str) -> Optional[Path]:
+    for entry in sys.path:
+        archive = Path(entry or '.').joinpath(name + ARCHIVE_SUFFIX)
+
+        if archive.is_file():
+            return archive.absolute()
+
+    return None
+
+
+class PackageRegistry:
+    """
+    Finds installed macro packages. Packages register themselves with an entry
+    point in the ``makros.packages`` group, and any python package on
+    ``sys.path`` with a ``macros.json`` is also found, even if it does not. So
+    are ``.makros`` archives in any of the folders on ``sys.path``.
+
+    Entry points are only read the first time a package is looked for, and
+    every result is remembered. Installing or removing a distribution changes
+    the modification time of the folder on ``sys.path`` it is in, so everything
+    is looked up again when any of them change.
+    """
+
+    def __init__(self):
+        self._entry_points: Optional[Dict[str, str]] = None
+        self._folders: Dict[str, Optional[Path]] = {}
+        self._signature: Optional[tuple] = None
+
+    def _current_signature(self) -> tuple:
+        signature = []
+
+        for entry in sys.path:
+            try:
+                signature.append((entry, stat(entry or '.').st_mtime_ns))
+            except OSError:
+                signature.append((entry, None))
+
+        return tuple(signature)
+
+    def find(self, name: str) -> Optional[Path]:
+        """Finds the installed macro package with the provided name
+
+        Args:
+            name (str): The name of the package
+
+        Returns:
+            Optional[Path]: The folder containing the package's ``macros.json`` or the package's archive, if it is installed
+        """
+
+        signature = self._current_signature()
+
+        if signature != self._signature:
+            self._entry_points = None
+            self._folders = {}
+            self._signature = signature
+
+        if name in self._folders:
+            return self._folders[name]
+
+        if self._entry_points is None:
+            self._entry_points = {
+                point.name: point.value
+                for point in _entry_points(ENTRY_POINT_GROUP)
+            }
+
+        folder = None
+
+        # Entry points may point at an attribute, which is not needed here
+        if name in self._entry_points:
+            folder = _package_folder(
+                self._entry_points[name].split(':')[0].strip())
+
+        if folder is None:
+            folder = _package_folder(name)
+
+        if folder is None:
+            folder = _package_archive(name)
+
+        self._folders[name] = folder
+        return folder
+
+
 class Resolver:
     """Is responsible for resolving errors
 
@@ -27,6 +294,9 @@ class Resolver:
 
     discovered = {}
     bootstrapped_folders = []
+    local_indexes: Dict[str, LocalIndex] = {}
+    local_roots: Set[str] = set()
+    installed = PackageRegistry()
     cwd = Path('')
 
     def __init__(self):
@@ -102,36 +372,90 @@ class Resolver:
 
         self.ensure_manifest_loader()
 
-        # Load the package manifest
+        # Load the package manifest. This is only read from disk the first time
+        # and whenever it changes
         manifest_path = path.joinpath('macros.json')
-        manifest = PackageManifest(manifest_path)
+        manifest = PackageManifest.load(manifest_path)
 
         # We want to allow the user to write mpy code to take advantage of macros
         # like enums which are very helpful for writing AST
+        #
+        # What has been bootstrapped is stored with the package, so each file
+        # is only bootstrapped once per change, not once per process
         if path not in self.bootstrapped_folders:
+            state = BootstrapState(bootstrap_state_path(path))
+
             for to_bootstrap in manifest.bootstrap:
                 self.lib._bootstrap_file(path.__str__(),
                                         to_bootstrap,
-                                        None)
+                                        state)
 
+            state.save()
             self.bootstrapped_folders.append(path)
 
         # If the macro is not specified within the macro definition file, throw
         # an error
-        if macro not in [macro['keyword'] for macro in manifest.macros]:
+        macro_dict = manifest.macros_by_keyword.get(macro)
+        if macro_dict is None:
             raise ResolutionError(
                 f'The macro at "{path}" does not contain the macro "{macro}"')
 
-        # Collect the information specified in the file for this macro
-        macro_index = [macro['keyword']
-                       for macro in manifest.macros].index(macro)
-        macro_dict = manifest.macros[macro_index]
-
         return MacroDef(macro, registration_token,
                         str(path.joinpath(macro_dict['file'])).replace('.mpy', '.py'))
 
+    def load_macro_from_archive(self, path: Path, macro: str,
+                                registration_token: TokenInfo) -> MacroDef:
+        """Loads a specific macro from a package archive. Archives are already
+        translated, so nothing needs to be bootstrapped
+
+        Args:
+            path (Path): The archive
+            macro (str): The name of the macro to be loaded
+            registration_token (TokenInfo): The token that will be used to trigger the macro
+
+        Raises:
+            ResolutionError: If the manifest file doesn't specify a macro with this name
+
+        Returns:
+            MacroDef: The final loaded macro for this archive
+        """
+
+        self.ensure_manifest_loader()
+
+        manifest = PackageManifest.load(path)
+        macro_dict = manifest.macros_by_keyword.get(macro)
+
+        if macro_dict is None:
+            raise ResolutionError(
+                f'The macro at "{path}" does not contain the macro "{macro}"')
+
+        return MacroDef(macro, registration_token, str(path),
+                        archive_module(macro_dict['file']))
+
+    def load_macro_from_package(self, path: Path, macro: str,
+                                registration_token: TokenInfo) -> MacroDef:
+        """Loads a specific macro from a package, which is either a folder or
+        an archive
+
+        Args:
+            path (Path): The folder or archive
+            macro (str): The name of the macro to be loaded
+            registration_token (TokenInfo): The token that will be used to trigger the macro
+
+        Returns:
+            MacroDef: The final loaded macro for this package
+        """
+
+        if is_archive(path):
+            return self.load_macro_from_archive(path, macro,
+                                                registration_token)
+
+        return self.load_macro_from_folder(path, macro, registration_token)
+
     def find_folder_recursive(self, resolution_string: str) -> Optional[Path]:
-        """Finds a folder with a specific name in the current working directory recursively
+        """Finds a macro package with a specific name in the current working
+        directory recursively. The directory is indexed the first time it is
+        searched, see ``LocalIndex``
 
         Args:
             resolution_string (str): The string we are looking for
@@ -140,31 +464,61 @@ class Resolver:
             Path: The path to this string, if any
         """
 
-        for file in walk(str(self.cwd)):
-            path = file[0]
-            if isdir(path) and path.split('/')[-1] == resolution_string:
-                return Path(path)
+        folder = Path(self.cwd).absolute()
+        index = self.local_indexes.get(str(folder))
+
+        if index is None:
+            index = self._local_index(folder)
+            self.local_indexes[str(folder)] = index
+
+        return index.find(resolution_string, folder)
+
+    def add_local_root(self, folder: Path) -> None:
+        """Marks a folder whose files are all going to be translated. The first
+        time a package is looked for from within it, the whole folder is
+        indexed, rather than just the folder that the file is in
+
+        Args:
+            folder (Path): The folder, e.g. the one passed to ``translate_folder``
+        """
+
+        self.local_roots.add(str(Path(folder).absolute()))
+
+    def _local_index(self, folder: Path) -> LocalIndex:
+        # Indexes of the folders above this one already contain it, unless it
+        # was skipped (e.g. inside of a virtual environment)
+        for parent in folder.parents:
+            index = self.local_indexes.get(str(parent))
+
+            if index is not None and index.covers(folder):
+                return index
+
+        for parent in [folder, *folder.parents]:
+            if str(parent) not in self.local_roots:
+                continue
+
+            if str(parent) not in self.local_indexes:
+                index = self.local_indexes[str(parent)] = LocalIndex(parent)
+
+                if index.covers(folder):
+                    return index
+
+            break
+
+        return LocalIndex(folder)
 
     def find_folder_pip(self, resolution_string: str) -> Optional[Path]:
-        """Will attempt to find a file within the pip packages folder
+        """Will attempt to find an installed macro package, see
+        ``PackageRegistry``
 
         Args:
             resolution_string (str): The string that is being searched for
 
         Returns:
-            Path: The path to the string within the pip packages folder
+            Path: The path to the package's folder
         """
 
-        dirs = [
-            d for d in listdir(SITE_PACKAGES)
-            if isdir(join(SITE_PACKAGES, d))
-        ]
-
-        for package_directory in dirs:
-            if package_directory == resolution_string:
-                return Path(join(SITE_PACKAGES, package_directory))
-
-        return None
+        return self.installed.find(resolution_string)
 
     def resolve(self, resolution_string: str) -> MacroDef:
         """Call this function to resolve an import string, for example 'enum' or 'lib/something'
@@ -206,13 +560,13 @@ class Resolver:
 
         local_folder = self.find_folder_recursive(package_name)
         if local_folder is not None:
-            return self.load_macro_from_folder(local_folder, token_name,
-                                               registration_token)
+            return self.load_macro_from_package(local_folder, token_name,
+                                                registration_token)
 
         pip_folder = self.find_folder_pip(package_name)
         if pip_folder is not None:
-            macro = self.load_macro_from_folder(pip_folder, token_name,
-                                                registration_token)
+            macro = self.load_macro_from_package(pip_folder, token_name,
+                                                 registration_token)
             self.discovered[resolution_string] = macro
             return macro
 
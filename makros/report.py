@@ -0,0 +1,52 @@
+class BuildReport:
+    """
+    Keeps count of what happened to each file during a build. A report is
+    returned by ``translate_file`` and ``translate_folder``, and can be passed
+    back into them to keep counting across multiple calls.
+    """
+
+    translated: int
+    """Files that were tokenized and had their macros expanded
+    """
+
+    cached: int
+    """Files whose translation was read from the translation cache
+    """
+
+    copied: int
+    """Files that did not import any macros, so were copied to their output
+    without being tokenized
+    """
+
+    skipped: int
+    """Files that had not changed since the last build of their folder, so
+    were left alone
+    """
+
+    rewritten: int
+    """Outputs that were written because their contents changed
+    """
+
+    unchanged: int
+    """Outputs that already had the right contents, so were not written. These
+    keep their modification time, so python will keep using their cached
+    bytecode
+    """
+
+    def __init__(self):
+        self.translated = 0
+        self.cached = 0
+        self.copied = 0
+        self.skipped = 0
+        self.rewritten = 0
+        self.unchanged = 0
+
+    @property
+    def total(self) -> int:
+        """The total number of files that were processed
+        """
+
+        return self.translated + self.cached + self.copied + self.skipped
+
+    def __str__(self) -> str:
+        return f'{self.total} files: {self.translated} translated, {self.cached} from cache, {self.copied} copied without macros, {self.skipped} up to date ({self.rewritten} outputs rewritten, {self.unchanged} unchanged)'
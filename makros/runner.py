@@ -0,0 +1,125 @@
+import builtins
+import importlib.util
+import sys
+import types
+from pathlib import Path
+from types import CodeType
+from typing import Any, Dict, List, Optional
+
+from makros.bytecode import code_to_hash_pyc, hash_pyc_to_code, optimization_tag
+from makros.importer import MakrosLoader, install_import_hook
+from makros.makros import Makros
+from makros.utils import find_macro_imports
+
+
+def compile_entry(path: Path) -> CodeType:
+    """Compiles a file that is going to be run as a script. The code object is
+    stored in the shared translation cache (see ``Makros.cache``) rather than
+    next to the file, so running a script never writes to its folder
+
+    Args:
+        path (Path): The file, which will be the filename of the code object
+
+    Returns:
+        CodeType: The compiled file
+    """
+
+    with open(path, 'rb') as file:
+        source = file.read()
+
+    imports = find_macro_imports(source)
+    if not imports:
+        return compile(source, str(path), 'exec', dont_inherit=True)
+
+    makros = Makros.get()
+    parser = makros.get_parser(path)
+    cache = makros.cache
+
+    if cache is None:
+        return parser.compile_bytes(source, path)
+
+    # Code objects remember the file they were compiled from and depend on the
+    # version of python, so both are part of the key
+    variant = '+'.join([
+        'code', sys.implementation.cache_tag,
+        optimization_tag(), parser.output_variant,
+        str(path)
+    ])
+    # Imports that can't be resolved may just be inside a string, see
+    # ``MakroParser.resolve_imports``
+    key = cache.key(source, parser.resolve_imports(imports, strict=False),
+                    variant)
+    source_hash = importlib.util.source_hash(source)
+
+    cached = cache.get(key)
+    if cached is not None:
+        code = hash_pyc_to_code(cached, source_hash)
+
+        if code is not None:
+            return code
+
+    code = parser.compile_bytes(source, path)
+    cache.put(key, code_to_hash_pyc(code, source_hash))
+
+    return code
+
+
+def run_file(path: Path, argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Runs a ``.mpy`` (or ``.py``) file as ``__main__``, the same way that
+    ``python file.py`` would, without translating anything to disk. Any ``.mpy``
+    modules that it imports are handled by the import hook, see
+    ``install_import_hook``
+
+    .. code-block:: python
+
+        from makros import run_file
+
+        run_file(Path('./my_script.mpy'))
+
+    Args:
+        path (Path): The file to run
+        argv (Optional[List[str]], optional): The arguments to run the file with, not including the file itself. Defaults to no arguments.
+
+    Returns:
+        Dict[str, Any]: The globals of the file once it has finished
+    """
+
+    path = Path(path).absolute()
+
+    install_import_hook()
+    code = compile_entry(path)
+
+    module = types.ModuleType('__main__')
+    module.__dict__.update({
+        '__file__': str(path),
+        '__cached__': None,
+        '__loader__': MakrosLoader('__main__', str(path)),
+        '__package__': None,
+        '__spec__': None,
+        '__builtins__': builtins
+    })
+
+    # Put everything back afterwards, like runpy does, so this can be called
+    # from within another program
+    main = sys.modules.get('__main__')
+    old_argv = sys.argv
+    folder = str(path.parent)
+
+    sys.modules['__main__'] = module
+    sys.argv = [str(path), *(argv or [])]
+    sys.path.insert(0, folder)
+
+    try:
+        exec(code, module.__dict__)
+    finally:
+        sys.argv = old_argv
+
+        if folder in sys.path:
+            sys.path.remove(folder)
+
+        if main is not None:
+            sys.modules['__main__'] = main
+        else:
+            del sys.modules['__main__']
+
+    return module.__dict__
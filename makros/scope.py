@@ -0,0 +1,276 @@
+from collections import OrderedDict
+import copy
+import textwrap
+import tokenize
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from makros.emitter import MacroOutput, ast_statements
+from makros.registration.macro_def import MacroDef
+from makros.tokens import TokenException, Tokens
+from makros.utils import file_fingerprint
+
+
+class MacroInstance:
+    """
+    A macro that has been imported into a scope. The parser, linter and
+    translator instances are created the first time the macro is triggered and
+    are then reused for every other invocation within the same scope.
+    """
+
+    def __init__(self, macro: MacroDef):
+        self.macro = macro
+
+        self._parser = None
+        self._linter = None
+        self._translator = None
+
+    def _ensure_instances(self) -> None:
+        """Creates the parser, linter and translator for this macro if they have
+        not already been created
+        """
+
+        if self._parser is not None:
+            return
+
+        module = self.macro.parser_module
+
+        # Parsers **MUST** always have a parse function and translators a
+        # translate function. This is layed out in the implementation docs
+        self._parser = module.Parser()
+        self._translator = module.Translator()
+
+        # There is not currently any linters, and the code is not tested, but
+        # may as well add the infrastructure.
+        if hasattr(module, 'Linter'):
+            self._linter = module.Linter()
+
+    def expand(self,
+               tokens: Tokens,
+               prefer_ast: bool = False,
+               expansions: Optional['ExpansionCache'] = None) -> MacroOutput:
+        """Parses the macro invocation at the current position of the tokens and
+        translates it into python
+
+        Args:
+            tokens (Tokens): The tokens, positioned just after the trigger token
+            prefer_ast (bool, optional): Use the translator's ``translate_ast`` method if it has one. Defaults to False.
+            expansions (Optional[ExpansionCache], optional): A cache of earlier expansions to check first. Defaults to None.
+
+        Returns:
+            MacroOutput: The output of the macro's translator
+        """
+
+        if expansions is None:
+            return self._expand(tokens, prefer_ast)
+
+        try:
+            start, end = tokens.statement_span()
+        except TokenException:
+            # Not every kind of tokens can find the end of the statement
+            return self._expand(tokens, prefer_ast)
+
+        key = expansions.key(self.macro, tokens, start, end, prefer_ast)
+        cached = expansions.get(key)
+
+        if cached is not None:
+            output, consumed = cached
+            tokens.seek(start + consumed)
+            return output
+
+        output = self._expand(tokens, prefer_ast)
+
+        # Token lists may be generators, which can only be read once
+        if not isinstance(output, str) and ast_statements(output) is None:
+            output = list(output)
+
+        # Macros that read past the end of the statement depend on more than
+        # the key, so they cannot be cached
+        if tokens.index <= end + 1 and getattr(self._translator, 'cacheable',
+                                               True):
+            expansions.put(key, output, tokens.index - start)
+
+        return output
+
+    def _expand(self, tokens: Tokens, prefer_ast: bool) -> MacroOutput:
+        self._ensure_instances()
+
+        macro_ast = self._parser.parse(tokens)
+
+        if self._linter is not None:
+            self._linter.lint(macro_ast)
+
+        # Not every translator extends MacroTranslator, so this cannot be
+        # assumed to exist
+        translate_ast = getattr(self._translator, 'translate_ast', None)
+        if prefer_ast and translate_ast is not None:
+            return translate_ast(macro_ast)
+
+        return self._translator.translate(macro_ast)
+
+
+class MacroScope:
+    """
+    The macros that are available within a single file. Macros are stored in a
+    dispatch table keyed by their trigger string, so checking if a name token
+    triggers a macro is a single dictionary lookup.
+    """
+
+    def __init__(self):
+        self._triggers: Dict[str, MacroInstance] = {}
+        self._macros: List[MacroDef] = []
+
+    @property
+    def macros(self) -> List[MacroDef]:
+        """The macros that have been imported into this scope, in the order that
+        they were imported
+        """
+
+        return list(self._macros)
+
+    @property
+    def triggers(self) -> List[str]:
+        """The trigger strings of every macro in this scope
+        """
+
+        return list(self._triggers)
+
+    def add(self, macro: MacroDef) -> None:
+        """Imports a macro into this scope. If another macro with the same
+        trigger has already been imported, the first one will be kept
+
+        Args:
+            macro (MacroDef): The resolved macro
+        """
+
+        self._macros.append(macro)
+        self._triggers.setdefault(macro.trigger_token.string,
+                                  MacroInstance(macro))
+
+    def get(self, trigger: str) -> Optional[MacroInstance]:
+        """Returns the macro that is triggered by the provided string, if any
+
+        Args:
+            trigger (str): The string of the name token
+
+        Returns:
+            Optional[MacroInstance]: The macro, or None if it is not a trigger
+        """
+
+        return self._triggers.get(trigger)
+
+    def __contains__(self, trigger: str) -> bool:
+        return trigger in self._triggers
+
+    def __len__(self) -> int:
+        return len(self._macros)
+
+
+class ExpansionCache:
+    """
+    Remembers the output of recent macro invocations, so that an identical
+    invocation (e.g. the same enum in many files) is not parsed and translated
+    again. Invocations are identified by the macro's file and the text of the
+    statement that invokes it, ignoring how far it is indented.
+
+    Translators whose output can change for the same invocation should set
+    ``cacheable`` to False.
+    """
+
+    hits: int
+    """The number of invocations that were found in the cache
+    """
+
+    misses: int
+    """The number of invocations that had to be expanded
+    """
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: 'OrderedDict[Hashable, Tuple[MacroOutput, int]]' = OrderedDict()
+
+    def key(self, macro: MacroDef, tokens: Tokens, start: int, end: int,
+            prefer_ast: bool) -> Hashable:
+        """Builds the key for an invocation
+
+        Args:
+            macro (MacroDef): The macro being invoked
+            tokens (Tokens): The tokens of the file
+            start (int): The index of the first token after the trigger
+            end (int): The index of the last token in the statement
+
+        Returns:
+            Hashable: The key
+        """
+
+        # Macros can use the lines of the tokens (e.g. namespace) as well as
+        # the tokens themselves. Indents are left out of the tokens, as they
+        # contain the indentation of the whole line
+        text = textwrap.dedent(''.join(tokens.lines(start, end + 1)))
+        strings = '\x1f'.join(
+            tokens.peek(index - tokens.index).string
+            for index in range(start, end + 1)
+            if tokens.peek(index - tokens.index).type != tokenize.INDENT)
+
+        return (macro.macro_name, macro.parser_file_location,
+                file_fingerprint(macro.parser_file_location), prefer_ast,
+                text, strings)
+
+    def get(self, key: Hashable) -> Optional[Tuple[MacroOutput, int]]:
+        """Finds the output of an earlier invocation
+
+        Args:
+            key (Hashable): The key from ``key``
+
+        Returns:
+            Optional[Tuple[MacroOutput, int]]: The output and the number of tokens the macro used, if it is cached
+        """
+
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+
+        output, consumed = entry
+
+        # Ast nodes are modified when they are placed into a file, so each file
+        # needs its own copy
+        if ast_statements(output) is not None:
+            output = copy.deepcopy(output)
+
+        return (output, consumed)
+
+    def put(self, key: Hashable, output: MacroOutput, consumed: int) -> None:
+        """Stores the output of an invocation
+
+        Args:
+            key (Hashable): The key from ``key``
+            output (MacroOutput): The output of the macro
+            consumed (int): The number of tokens the macro used
+        """
+
+        if ast_statements(output) is not None:
+            output = copy.deepcopy(output)
+
+        self._entries[key] = (output, consumed)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Removes every entry and resets the counters
+        """
+
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,145 @@
+import re
+import tokenize
+from typing import Generator, List, Optional
+
+# Every character that can change if the next line starts a new statement.
+# Triple quotes come first so they win over a single quote character
+_INTERESTING = re.compile(r'"""|\'\'\'|["\'#\\()\[\]{}]')
+
+# Within a string we only care about escapes (which may hide a quote or a new
+# line) and the quote that closes the string
+_STRING_ENDS = {
+    quote: re.compile(r'\\.|' + re.escape(quote), re.DOTALL)
+    for quote in ('"', "'", '"""', "'''")
+}
+
+
+class LogicalLines:
+    """
+    A very small scanner that follows a python file line by line and keeps track
+    of whether the next physical line starts a new statement. Lines that are
+    inside of brackets, multi-line strings or that follow a backslash cannot
+    start a statement, so they can never be a macro invocation.
+
+    This is far cheaper than tokenizing, as most lines only cost a single regex
+    search, but it does not validate anything. The tokenizer will still catch
+    any syntax errors in the regions that are handed to macros.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.quote: Optional[str] = None
+        self.continued = False
+
+    @property
+    def at_statement(self) -> bool:
+        """If the next line that is fed in will start a new statement
+        """
+
+        return not self.depth and self.quote is None and not self.continued
+
+    def reset(self) -> None:
+        """Forget the current state, for example after a macro has consumed a
+        region of the file
+        """
+
+        self.depth = 0
+        self.quote = None
+        self.continued = False
+
+    def feed(self, line: str) -> None:
+        """Updates the state of the scanner to after the provided line
+
+        Args:
+            line (str): A single physical line, including its line ending
+        """
+
+        self.continued = False
+        index = 0
+
+        while True:
+            if self.quote is not None:
+                match = _STRING_ENDS[self.quote].search(line, index)
+
+                while match is not None and match.group().startswith('\\'):
+                    match = _STRING_ENDS[self.quote].search(line, match.end())
+
+                if match is None:
+                    # Single quoted strings cannot span lines unless the new
+                    # line is escaped, which the regex above would have consumed
+                    if len(self.quote) == 1 and not line.endswith('\\\n'):
+                        self.quote = None
+
+                    return
+
+                self.quote = None
+                index = match.end()
+                continue
+
+            match = _INTERESTING.search(line, index)
+
+            if match is None:
+                return
+
+            found = match.group()
+            index = match.end()
+
+            if found == '#':
+                return
+            elif found == '\\':
+                # Outside of a string, a backslash can only be a line
+                # continuation
+                self.continued = True
+                return
+            elif found in _STRING_ENDS:
+                self.quote = found
+            elif found in '([{':
+                self.depth += 1
+            else:
+                self.depth = max(0, self.depth - 1)
+
+
+def leading_whitespace(line: str) -> str:
+    """Returns the indentation at the start of the line
+
+    Args:
+        line (str): The line to check
+
+    Returns:
+        str: Any spaces and tabs at the start of the line
+    """
+
+    return line[:len(line) - len(line.lstrip(' \t'))]
+
+
+def region_tokens(lines: List[str], start: int,
+                  indentation: str) -> Generator[tokenize.TokenInfo, None, None]:
+    """Lazily tokenizes the file from the provided line onwards, as if the line
+    was not indented. Rows in the tokens are relative to ``start``, with the
+    first line being row 1.
+
+    Args:
+        lines (List[str]): All of the lines in the file
+        start (int): The index of the first line that should be tokenized
+        indentation (str): The indentation of the first line, which is removed from it and every line after it
+
+    Yields:
+        tokenize.TokenInfo: Tokens for the region, stopping whenever the consumer stops asking
+    """
+
+    width = len(indentation)
+
+    def readline() -> str:
+        nonlocal start
+
+        if start >= len(lines):
+            return ''
+
+        line = lines[start]
+        start += 1
+
+        # Lines that are less indented than the region (e.g. a blank line) have
+        # all of their indentation removed instead
+        return line[min(width, len(leading_whitespace(line))):]
+
+    return tokenize.generate_tokens(readline)
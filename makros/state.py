@@ -0,0 +1,379 @@
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from makros.cache import default_cache_dir, makros_version
+from makros.registration.macro_def import MacroDef
+from makros.utils import file_fingerprint, sha256sum, write_atomic
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+STATE_FILE = '.makros_state.json'
+"""The name of the file that ``BuildState`` is stored in, inside of the folder
+that was built
+"""
+
+BOOTSTRAP_FILE = '.makros_bootstrap.json'
+"""The name of the file that a macro package's ``BootstrapState`` is stored in,
+inside of the package
+"""
+
+
+def _stat(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def macro_dependencies(macro: MacroDef) -> List[str]:
+    """The files that decide how a macro behaves. This is the file that the
+    macro is loaded from, the ``.mpy`` file it is bootstrapped from (if any) and
+    the manifest of the package it is part of (if any). For a macro from an
+    archive, this is just the archive
+
+    Args:
+        macro (MacroDef): The macro
+
+    Returns:
+        List[str]: The paths to the files that exist
+    """
+
+    # Archives contain everything that the macro needs
+    if macro.archive_module is not None:
+        return [macro.parser_file_location]
+
+    location = Path(macro.parser_file_location)
+    candidates = [
+        location,
+        location.with_suffix('.mpy'),
+        location.parent.joinpath('macros.json')
+    ]
+
+    return [str(path) for path in candidates if path.is_file()]
+
+
+class BuildState:
+    """
+    Remembers what every file in a folder was built from, so that a later build
+    of the same folder can skip files that would come out the same. A file is
+    rebuilt if its source or output has been changed, or if any of the files
+    that make up the macros it imports have changed.
+
+    Checking a file that is up to date only requires a stat of the file and its
+    output. Macro files are shared between many files, so each is only checked
+    once per build, and is only hashed if its modification time or size have
+    changed.
+    """
+
+    def __init__(self, folder: Path, variant: str = ''):
+        self.path = Path(folder).joinpath(STATE_FILE)
+        self.folder = Path(folder)
+
+        # The state from the last build
+        self._files: Dict[str, dict] = {}
+        self._dependencies: Dict[str, list] = {}
+
+        # The state of this build, which will replace the last one when saved
+        self._new_files: Dict[str, dict] = {}
+        self._checked: Dict[str, bool] = {}
+        self._changed = False
+
+        self._version = makros_version()
+        self._variant = variant
+
+        try:
+            with open(self.path) as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            state = {}
+
+        # Builds from a different version of makros, or with different options,
+        # cannot be trusted
+        if state.get('version') == self._version and state.get(
+                'variant') == variant:
+            self._files = state.get('files', {})
+            self._dependencies = state.get('dependencies', {})
+
+    def _key(self, source: Path) -> str:
+        return Path(source).relative_to(self.folder).as_posix()
+
+    def _dependency_unchanged(self, path: str) -> bool:
+        if path in self._checked:
+            return self._checked[path]
+
+        recorded = self._dependencies.get(path)
+        stat = _stat(path)
+
+        if recorded is None or stat is None:
+            unchanged = False
+        elif tuple(recorded[:2]) == stat:
+            unchanged = True
+        else:
+            # Plenty of things touch a file without changing it, e.g. checking
+            # out a branch, so fall back to the contents of the file
+            unchanged = file_fingerprint(path) == recorded[2]
+
+            if unchanged:
+                self._dependencies[path] = [*stat, recorded[2]]
+                self._changed = True
+
+        self._checked[path] = unchanged
+        return unchanged
+
+    def is_fresh(self, source: Path, output: Path) -> bool:
+        """Checks if a file needs to be rebuilt. Files that are up to date are
+        kept in the state for the next build
+
+        Args:
+            source (Path): The ``.mpy`` file
+            output (Path): The file that it is translated into
+
+        Returns:
+            bool: True if the output is up to date
+        """
+
+        key = self._key(source)
+        entry = self._files.get(key)
+
+        if entry is None:
+            return False
+
+        if _stat(str(output)) != tuple(entry['output']):
+            return False
+
+        stat = _stat(str(source))
+        if stat is None:
+            return False
+
+        if stat != tuple(entry['source'][:2]):
+            if file_fingerprint(str(source)) != entry['source'][2]:
+                return False
+
+            entry['source'] = [*stat, entry['source'][2]]
+            self._changed = True
+
+        if not all(
+                self._dependency_unchanged(dependency)
+                for dependency in entry['dependencies']):
+            return False
+
+        self._new_files[key] = entry
+        return True
+
+    def record(self, source: Path, output: Path,
+               macros: Iterable[MacroDef]) -> None:
+        """Remembers what a file was just built from
+
+        Args:
+            source (Path): The ``.mpy`` file
+            output (Path): The file that it was translated into
+            macros (Iterable[MacroDef]): The macros that the file imported
+        """
+
+        dependencies = []
+
+        for macro in macros:
+            for dependency in macro_dependencies(macro):
+                if dependency in dependencies:
+                    continue
+
+                dependencies.append(dependency)
+
+                # The file was built with whatever is on disk now
+                stat = _stat(dependency)
+                self._dependencies[dependency] = [
+                    *stat, file_fingerprint(dependency)
+                ]
+                self._checked[dependency] = True
+
+        self._new_files[self._key(source)] = {
+            'source': [*_stat(str(source)), file_fingerprint(str(source))],
+            'output': _stat(str(output)),
+            'dependencies': dependencies
+        }
+        self._changed = True
+
+    def save(self, prune: bool = True) -> None:
+        """Writes the state to disk, replacing the state of the last build. The
+        file is only written if something has changed
+
+        Args:
+            prune (bool, optional): Forget files that were not part of this build. This should be disabled when only some of the files in the folder were built. Defaults to True.
+        """
+
+        if prune:
+            files = self._new_files
+        else:
+            files = {**self._files, **self._new_files}
+
+        if not self._changed and files.keys() == self._files.keys():
+            return
+
+        used = {
+            dependency
+            for entry in files.values()
+            for dependency in entry['dependencies']
+        }
+
+        state = {
+            'version': self._version,
+            'variant': self._variant,
+            'files': files,
+            'dependencies': {
+                path: value
+                for path, value in self._dependencies.items() if path in used
+            }
+        }
+
+        write_atomic(str(self.path), [json.dumps(state)])
+
+
+@contextmanager
+def _locked(path: str):
+    """Holds an advisory lock on a file next to the provided path for as long
+    as the context is open. Platforms without ``fcntl`` are not locked
+    """
+
+    if fcntl is None:
+        yield
+        return
+
+    with open(path + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class BootstrapState:
+    """
+    Remembers which ``.mpy`` files have been bootstrapped into ``.py`` files, so
+    that they are only bootstrapped again when they change. Each file is stored
+    with its modification time, size and hash. A file whose modification time
+    and size have not changed is assumed to be the same, so checking a file
+    only costs a stat of it and its output.
+
+    The state file is only written when something changes, under a lock so that
+    many processes starting at the same time do not overwrite each other's
+    changes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries = self._read()
+        self._updates: Dict[str, list] = {}
+
+    def _read(self) -> Dict[str, list]:
+        try:
+            with open(self.path) as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+        # Older versions only stored the hash of each file, under a different
+        # key, so those entries are dropped
+        return {
+            source: entry
+            for source, entry in entries.items() if isinstance(entry, list)
+        }
+
+    def is_fresh(self, source: str, output: str) -> bool:
+        """Checks if a file has been bootstrapped since it was last changed
+
+        Args:
+            source (str): The ``.mpy`` file
+            output (str): The file that it is bootstrapped into
+
+        Returns:
+            bool: True if the output is up to date
+        """
+
+        entry = self._entries.get(source)
+        stat = _stat(source)
+
+        if entry is None or stat is None or _stat(output) is None:
+            return False
+
+        if tuple(entry[:2]) == stat:
+            return True
+
+        # The file has been touched, but it may not have been changed
+        if sha256sum(source) != entry[2]:
+            return False
+
+        self._entries[source] = self._updates[source] = [*stat, entry[2]]
+        return True
+
+    def record(self, source: str) -> None:
+        """Remembers that a file has just been bootstrapped
+
+        Args:
+            source (str): The ``.mpy`` file
+        """
+
+        stat = _stat(source)
+        if stat is None:
+            return
+
+        self._entries[source] = self._updates[source] = [
+            *stat, sha256sum(source)
+        ]
+
+    def save(self) -> None:
+        """Writes any changes to disk. Other processes may have written their
+        own changes since this state was read, so they are merged together.
+        Failing to write (e.g. when makros is installed somewhere read only) is
+        not an error, the files will just be checked again next time
+        """
+
+        if not self._updates:
+            return
+
+        try:
+            with _locked(self.path):
+                entries = self._read()
+                entries.update(self._updates)
+
+                write_atomic(self.path, [json.dumps(entries)])
+        except OSError:
+            return
+
+        self._updates = {}
+
+
+def bootstrap_state_path(package: Path) -> str:
+    """Finds where the bootstrap state of a macro package should be stored.
+    This is inside of the package, unless the package cannot be written to
+    (e.g. it is installed system wide), in which case it is stored in the user's
+    cache folder
+
+    Args:
+        package (Path): The folder containing the package's ``macros.json``
+
+    Returns:
+        str: The path to the state file
+    """
+
+    if os.access(package, os.W_OK):
+        return str(Path(package).joinpath(BOOTSTRAP_FILE))
+
+    name = hashlib.sha256(str(Path(package).absolute()).encode()).hexdigest()
+    folder = default_cache_dir().joinpath('bootstrap')
+
+    try:
+        folder.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        pass
+
+    return str(folder.joinpath(f'{name}.json'))
@@ -1,38 +1,131 @@
+from array import array
+from collections import deque
 import tokenize
-from typing import List, Optional
+import warnings
+from typing import Callable, Container, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from weakref import WeakValueDictionary
 
 
 class TokenCase:
     """Used to check if a token matches specific details
+
+    Token cases are immutable and interned, so ``TokenCase.op(',')`` will
+    return the same object for as long as it is in use. Where possible, create
+    them once (e.g. as a module level constant) rather than inside of a parsing
+    loop.
     """
 
-    _token_type: Optional[int] = None
-    _token_string: Optional[str] = None
+    __slots__ = ('_token_type', '_token_string', '__weakref__')
+
+    # Cases are only kept while something is using them, so this cannot grow
+    # without limit
+    _interned: 'WeakValueDictionary[Tuple[Optional[int], Optional[str]], TokenCase]' = WeakValueDictionary()
+
+    def __new__(cls,
+                token_type: Optional[int] = None,
+                token_string: Optional[str] = None) -> 'TokenCase':
+        # An empty case used to be modified by type and string. Code that
+        # relies on that still works for now, see _BuilderCase
+        if token_type is None and token_string is None:
+            case = object.__new__(_BuilderCase)
+            object.__setattr__(case, '_token_type', None)
+            object.__setattr__(case, '_token_string', None)
+            object.__setattr__(case, '_warned', False)
+
+            return case
+
+        key = (token_type, token_string)
+        case = TokenCase._interned.get(key)
+
+        if case is None:
+            # Pick the version of check that only does the comparisons this
+            # case needs
+            if token_string is None:
+                case_class = _TypeCase
+            elif token_type is None:
+                case_class = _StringCase
+            else:
+                case_class = _TypeStringCase
+
+            case = object.__new__(case_class)
+            object.__setattr__(case, '_token_type', token_type)
+            object.__setattr__(case, '_token_string', token_string)
+
+            TokenCase._interned[key] = case
+
+        return case
+
+    def __setattr__(self, name, value):
+        raise AttributeError('TokenCase objects are immutable')
+
+    def __repr__(self) -> str:
+        token_type = None if self._token_type is None else tokenize.tok_name[
+            self._token_type]
+        return f'TokenCase({token_type}, {self._token_string!r})'
+
+    @staticmethod
+    def name(new_str: Optional[str] = None) -> 'TokenCase':
+        """A case that matches name tokens
+
+        Args:
+            new_str (Optional[str], optional): The string the name must have. Defaults to any name.
+        """
+
+        return TokenCase(tokenize.NAME, new_str)
+
+    @staticmethod
+    def op(new_str: Optional[str] = None) -> 'TokenCase':
+        """A case that matches operator tokens
+
+        Args:
+            new_str (Optional[str], optional): The operator, e.g. ','. Defaults to any operator.
+        """
+
+        return TokenCase(tokenize.OP, new_str)
+
+    @staticmethod
+    def newline() -> 'TokenCase':
+        """A case that matches the end of a logical line
+        """
+
+        return TokenCase(tokenize.NEWLINE)
+
+    @staticmethod
+    def indent() -> 'TokenCase':
+        """A case that matches the start of an indented block
+        """
+
+        return TokenCase(tokenize.INDENT)
+
+    @staticmethod
+    def dedent() -> 'TokenCase':
+        """A case that matches the end of an indented block
+        """
 
-    def type(self, new_type: int):
+        return TokenCase(tokenize.DEDENT)
+
+    def type(self, new_type: int) -> 'TokenCase':
         """Specifies the token type to check against
 
         Args:
             new_type (int): The token type to check against
 
         Returns:
-            TokenCase: This TokenCase instance, used for checking
+            TokenCase: A TokenCase that also checks the type, used for chaining
         """
-        self._token_type = new_type
-        return self
+        return TokenCase(new_type, self._token_string)
 
-    def string(self, new_str: str):
+    def string(self, new_str: str) -> 'TokenCase':
         """Specifies a string to be checked against to see if it matches
 
         Args:
             new_str (str): The string to check against
 
         Returns:
-            TokenCase: This TokenCase instance, used for chaining
+            TokenCase: A TokenCase that also checks the string, used for chaining
         """
 
-        self._token_string = new_str
-        return self
+        return TokenCase(self._token_type, new_str)
 
     def check(self, token: tokenize.TokenInfo) -> bool:
         """Checks a specific token against the information provided here
@@ -44,17 +137,71 @@ class TokenCase:
             bool: If it matches or not
         """
 
-        if self._token_type is not None and self._token_type != token.type:
-            return False
+        return True
 
-        if self._token_string is not None and self._token_string != token.string:
-            return False
 
-        return True
+class _BuilderCase(TokenCase):
+    """
+    The case returned by ``TokenCase()``, which matches every token. ``type``
+    and ``string`` return a new case, but they also modify this one, like they
+    did before cases were interned. A modified case is only ever checked by
+    code that ignores what they return, which is deprecated.
+    """
+
+    __slots__ = ('_warned', )
+
+    def type(self, new_type: int) -> 'TokenCase':
+        object.__setattr__(self, '_token_type', new_type)
+        return super().type(new_type)
+
+    def string(self, new_str: str) -> 'TokenCase':
+        object.__setattr__(self, '_token_string', new_str)
+        return super().string(new_str)
+
+    def check(self, token: tokenize.TokenInfo) -> bool:
+        if self._token_type is None and self._token_string is None:
+            return True
+
+        if not self._warned:
+            object.__setattr__(self, '_warned', True)
+            warnings.warn(
+                'TokenCase.type and TokenCase.string return a new case rather '
+                'than modifying the one they are called on. Use the case that '
+                'they return, as this will stop working in a future release',
+                DeprecationWarning,
+                stacklevel=3)
+
+        return TokenCase(self._token_type, self._token_string).check(token)
+
+
+class _TypeCase(TokenCase):
+    __slots__ = ()
+
+    def check(self, token: tokenize.TokenInfo) -> bool:
+        return token.type == self._token_type
+
+
+class _StringCase(TokenCase):
+    __slots__ = ()
+
+    def check(self, token: tokenize.TokenInfo) -> bool:
+        return token.string == self._token_string
+
+
+class _TypeStringCase(TokenCase):
+    __slots__ = ()
+
+    def check(self, token: tokenize.TokenInfo) -> bool:
+        return token.type == self._token_type and token.string == self._token_string
+
 
 class TokenException(Exception):
     pass
 
+
+# Opening brackets and their matching closing bracket
+BRACKETS = {'(': ')', '[': ']', '{': '}'}
+
 class Tokens:
     """
     A helper class that wraps around a list of tokens, providing common methods
@@ -63,6 +210,11 @@ class Tokens:
 
     _current_token_index: int = 0
 
+    # The structural index, built the first time it is needed. See _build_index
+    _block_ends: Optional[Dict[int, int]] = None
+    _bracket_ends: Optional[Dict[int, int]] = None
+    _row_tokens: Optional[List[int]] = None
+
     def __init__(self, tokens: List[tokenize.TokenInfo], filename: str):
         self.filename = filename
 
@@ -105,12 +257,21 @@ class Tokens:
         # build system
         raise TokenException()
 
-    def peek(self) -> tokenize.TokenInfo:
+    def peek(self, offset: int = 0) -> tokenize.TokenInfo:
         """
         Returns what the next token will be without modifying the current toke
         in the buffer
+
+        Args:
+            offset (int, optional): How many tokens past the next one to look. Defaults to 0.
         """
-        return self.internal_token[self._current_token_index]
+        index = self._current_token_index + offset
+
+        # Looking past the end of the file will always give you the end marker
+        if index >= len(self.internal_token):
+            return self.internal_token[-1]
+
+        return self.internal_token[index]
 
     def previous(self) -> tokenize.TokenInfo:
         """Returns the token before the current one
@@ -179,14 +340,223 @@ class Tokens:
         Returns:
             bool: If it has found a match to any of the different checkers
         """
-        
+
+        next_token = self.peek()
+
         for checker in types:
-            if checker.check(self.peek()):
+            if checker.check(next_token):
                 self.advance()
                 return True
 
         return False
 
+    def match_seq(self, *cases: TokenCase) -> bool:
+        """Matches a sequence of cases against the next tokens, in order.
+        Advances past all of them if every case matches, otherwise nothing is
+        consumed
+
+        Returns:
+            bool: If every case matched
+        """
+
+        for offset, checker in enumerate(cases):
+            if not checker.check(self.peek(offset)):
+                return False
+
+        for _ in cases:
+            self.advance()
+
+        return True
+
+    def consume_seq(self, cases: Sequence[TokenCase],
+                    failure_message: str) -> List[tokenize.TokenInfo]:
+        """Will consume a sequence of tokens that match the cases, in order,
+        otherwise it will raise an error at the first token that doesn't match
+
+        Args:
+            cases (Sequence[TokenCase]): The cases that will be checked against
+            failure_message (str): The error message that you want to provide to the user
+
+        Returns:
+            List[tokenize.TokenInfo]: The consumed tokens
+        """
+
+        return [self.consume(checker, failure_message) for checker in cases]
+
+    # Structural methods. These use an index that maps each INDENT to its
+    # DEDENT and each opening bracket to its closing bracket, which is built in
+    # a single pass the first time one of them is called
+
+    @property
+    def index(self) -> int:
+        """The index of the next token, ignoring newlines and comments
+        """
+
+        return self._current_token_index
+
+    def _row_of(self, index: int) -> int:
+        return self.internal_token[index].start[0]
+
+    def _line_of(self, index: int) -> str:
+        return self.internal_token[index].line
+
+    def _structure(self) -> Iterator[Tuple[int, int, str, int]]:
+        """Yields the index, type, string and row of every token, for building
+        the structural index
+        """
+
+        for index, token in enumerate(self.internal_token):
+            yield index, token.type, token.string, token.start[0]
+
+    def _build_index(self) -> None:
+        if self._block_ends is not None:
+            return
+
+        block_ends: Dict[int, int] = {}
+        bracket_ends: Dict[int, int] = {}
+        row_tokens: List[int] = []
+
+        open_blocks: List[int] = []
+        open_brackets: List[int] = []
+
+        for index, token_type, string, row in self._structure():
+            # Keep track of the first token on each row, so the lines between
+            # two tokens can be found without walking over them
+            while len(row_tokens) <= row:
+                row_tokens.append(-1)
+
+            if row_tokens[row] == -1:
+                row_tokens[row] = index
+
+            if token_type == tokenize.INDENT:
+                open_blocks.append(index)
+            elif token_type == tokenize.DEDENT:
+                if open_blocks:
+                    block_ends[open_blocks.pop()] = index
+            elif token_type == tokenize.OP:
+                if string in BRACKETS:
+                    open_brackets.append(index)
+                elif string in BRACKETS.values() and open_brackets:
+                    bracket_ends[open_brackets.pop()] = index
+
+        self._block_ends = block_ends
+        self._bracket_ends = bracket_ends
+        self._row_tokens = row_tokens
+
+    def _span(self, ends: Dict[int, int], index: Optional[int],
+              message: str) -> Tuple[int, int]:
+        if index is None:
+            index = self._current_token_index
+
+        if index not in ends:
+            self.error(self._token_at_index(index), message)
+
+        return (index, ends[index])
+
+    def _token_at_index(self, index: int) -> tokenize.TokenInfo:
+        return self.peek(index - self._current_token_index)
+
+    def block_span(self, index: Optional[int] = None) -> Tuple[int, int]:
+        """Finds the indented block that starts at an INDENT token
+
+        Args:
+            index (Optional[int], optional): The index of the INDENT token. Defaults to the next token.
+
+        Returns:
+            Tuple[int, int]: The indexes of the INDENT and its matching DEDENT
+        """
+
+        self._build_index()
+        return self._span(self._block_ends, index, "Expected indent")
+
+    def bracket_span(self, index: Optional[int] = None) -> Tuple[int, int]:
+        """Finds the brackets that start at an opening bracket token
+
+        Args:
+            index (Optional[int], optional): The index of the opening bracket. Defaults to the next token.
+
+        Returns:
+            Tuple[int, int]: The indexes of the opening bracket and its closing bracket
+        """
+
+        self._build_index()
+        return self._span(self._bracket_ends, index, "Expected an opening bracket")
+
+    def statement_span(self, index: Optional[int] = None) -> Tuple[int, int]:
+        """Finds the statement that starts at a token. The statement ends at the
+        first NEWLINE that is not inside of brackets, or if that NEWLINE starts
+        an indented block, at the DEDENT that ends the block
+
+        Args:
+            index (Optional[int], optional): The index of the first token in the statement. Defaults to the next token.
+
+        Returns:
+            Tuple[int, int]: The indexes of the first and last token of the statement
+        """
+
+        self._build_index()
+
+        start = self._current_token_index if index is None else index
+        current = start
+
+        while True:
+            token = self._token_at_index(current)
+
+            if token.type == tokenize.ENDMARKER:
+                return (start, max(start, current - 1))
+
+            if current in self._bracket_ends:
+                current = self._bracket_ends[current] + 1
+                continue
+
+            if token.type == tokenize.NEWLINE:
+                if self._token_at_index(current + 1).type == tokenize.INDENT:
+                    return (start, self._block_ends.get(current + 1, current + 1))
+
+                return (start, current)
+
+            current += 1
+
+    def seek(self, index: int) -> None:
+        """Moves to a different token, e.g. one found with ``statement_span``
+
+        Args:
+            index (int): The index of the token that will be next
+        """
+
+        self._current_token_index = index
+
+    def lines(self, start: int, end: int) -> List[str]:
+        """Returns the lines from the row of one token up to, but not including,
+        the row of another. Only rows that contain a token are included, and
+        each is the line of the first token on that row
+
+        Args:
+            start (int): The index of the first token
+            end (int): The index of the token to stop at
+
+        Returns:
+            List[str]: The lines, including their line endings
+        """
+
+        self._build_index()
+        rows = self._row_tokens[self._row_of(start):self._row_of(end)]
+
+        return [self._line_of(index) for index in rows if index != -1]
+
+    def skip_block(self) -> List[str]:
+        """Skips over the indented block that starts at the next token, leaving
+        the tokens after its DEDENT
+
+        Returns:
+            List[str]: The lines of the block, see ``lines``
+        """
+
+        start, end = self.block_span()
+        self._current_token_index = end + 1
+
+        return self.lines(start, end)
+
     # Iterator methods are used by the for loop in MakroParser
 
     def __iter__(self):
@@ -202,3 +572,428 @@ class Tokens:
             raise StopIteration
 
         return self.advance()
+
+
+class BufferedTokens(Tokens):
+    """
+    A version of ``Tokens`` that reads from the tokenizer lazily, rather than
+    loading the entire file into a list first. Only a small window of tokens is
+    kept in memory at any time: the previous token and up to ``lookahead``
+    tokens after the current one. Finding the end of a span (e.g. with
+    ``bracket_span``) grows the window as far as the span goes.
+
+    Macros that only use ``peek``, ``previous``, ``advance`` and the methods
+    built on top of them will work with either version.
+    """
+
+    def __init__(self,
+                 tokens: Iterable[tokenize.TokenInfo],
+                 filename: str,
+                 lookahead: int = 16):
+        self.filename = filename
+        self.lookahead = lookahead
+
+        # Filter logical newlines and comments, as they are not handled well by
+        # the macros that are implemented and provide no good value
+        self._tokens = (token for token in tokens
+                        if token.type not in (tokenize.NL, tokenize.COMMENT))
+
+        # The buffer holds the previous token, the next token and the lookahead
+        # window after it. _buffer_start is the index of the first token
+        # within the buffer
+        self._buffer: Deque[tokenize.TokenInfo] = deque(maxlen=lookahead + 2)
+        self._buffer_start = 0
+
+    def _token_at(self, index: int, grow: bool = False) -> tokenize.TokenInfo:
+        """Returns the token at a specific index in the file, reading more from
+        the tokenizer if it has not been reached yet
+
+        Args:
+            index (int): The index of the token, ignoring newlines and comments
+            grow (bool, optional): Make the window larger if the token is past the lookahead, rather than raising an error. Defaults to False.
+
+        Raises:
+            TokenException: If the token is outside of the buffer's window
+        """
+
+        if index < self._buffer_start:
+            raise TokenException(
+                f"Token {index} is no longer buffered in {self.filename}")
+
+        if grow:
+            # Everything that is buffered has to be kept, as the tokens up to
+            # the index have not been used yet
+            size = index - self._buffer_start + 1
+            if size > self._buffer.maxlen:
+                self._buffer = deque(self._buffer, maxlen=size)
+        elif index - self._current_token_index > self.lookahead:
+            raise TokenException(
+                f"Cannot look more than {self.lookahead} tokens ahead in {self.filename}"
+            )
+
+        while index >= self._buffer_start + len(self._buffer):
+            next_token = next(self._tokens, None)
+
+            # Looking past the end of the file will always give you the end
+            # marker
+            if next_token is None:
+                return self._buffer[-1]
+
+            if len(self._buffer) == self._buffer.maxlen:
+                self._buffer_start += 1
+
+            self._buffer.append(next_token)
+
+        return self._buffer[index - self._buffer_start]
+
+    def peek(self, offset: int = 0) -> tokenize.TokenInfo:
+        """
+        Returns what the next token will be without modifying the current toke
+        in the buffer
+
+        Args:
+            offset (int, optional): How many tokens past the next one to look, up to the lookahead. Defaults to 0.
+        """
+        return self._token_at(self._current_token_index + offset)
+
+    def previous(self) -> tokenize.TokenInfo:
+        """Returns the token before the current one
+
+        Returns:
+            tokenize.TokenInfo: The last token
+        """
+
+        return self._token_at(self._current_token_index - 1)
+
+    def _build_index(self) -> None:
+        raise TokenException(
+            f"The structure of {self.filename} cannot be indexed, as only part of it is buffered"
+        )
+
+    def seek(self, index: int) -> None:
+        """Moves to a different token. Tokens that are no longer buffered cannot
+        be moved back to
+
+        Args:
+            index (int): The index of the token that will be next
+        """
+
+        if index < self._buffer_start:
+            raise TokenException(
+                f"Token {index} is no longer buffered in {self.filename}")
+
+        if index <= self._current_token_index:
+            self._current_token_index = index
+            return
+
+        while self._current_token_index < index and not self.is_at_end():
+            self.advance()
+
+    def lines(self, start: int, end: int) -> List[str]:
+        """Not supported, as the lines may no longer be buffered. Use
+        ``skip_block`` instead
+
+        Raises:
+            TokenException: Always
+        """
+
+        self._build_index()
+
+    def _scan_span(self, index: Optional[int],
+                   opening: Callable[[tokenize.TokenInfo], bool],
+                   closing: Callable[[tokenize.TokenInfo], bool],
+                   message: str) -> Tuple[int, int]:
+        """Finds the end of a span by reading ahead. The window is grown to fit
+        the span, as macros will usually go on to use every token in it
+        """
+
+        if index is None:
+            index = self._current_token_index
+
+        current = index
+        depth = 0
+
+        while True:
+            token = self._token_at(current, grow=True)
+
+            if token.type == tokenize.ENDMARKER:
+                self.error(self._token_at(index), message)
+
+            if opening(token):
+                depth += 1
+            elif closing(token):
+                depth -= 1
+
+            if depth <= 0:
+                if current == index:
+                    self.error(token, message)
+
+                return (index, current)
+
+            current += 1
+
+    def block_span(self, index: Optional[int] = None) -> Tuple[int, int]:
+        """Finds the indented block that starts at an INDENT token
+
+        Args:
+            index (Optional[int], optional): The index of the INDENT token. Defaults to the next token.
+
+        Returns:
+            Tuple[int, int]: The indexes of the INDENT and its matching DEDENT
+        """
+
+        return self._scan_span(index,
+                               lambda token: token.type == tokenize.INDENT,
+                               lambda token: token.type == tokenize.DEDENT,
+                               "Expected indent")
+
+    def bracket_span(self, index: Optional[int] = None) -> Tuple[int, int]:
+        """Finds the brackets that start at an opening bracket token
+
+        Args:
+            index (Optional[int], optional): The index of the opening bracket. Defaults to the next token.
+
+        Returns:
+            Tuple[int, int]: The indexes of the opening bracket and its closing bracket
+        """
+
+        return self._scan_span(
+            index, lambda token: token.type == tokenize.OP and token.string in BRACKETS,
+            lambda token: token.type == tokenize.OP and token.string in BRACKETS.values(),
+            "Expected an opening bracket")
+
+    def skip_block(self) -> List[str]:
+        """Skips over the indented block that starts at the next token, leaving
+        the tokens after its DEDENT
+
+        Returns:
+            List[str]: The lines of the block, see ``Tokens.lines``
+        """
+
+        if self.peek().type != tokenize.INDENT:
+            self.error(self.peek(), "Expected indent")
+
+        lines = []
+        rows = []
+        depth = 0
+
+        while not self.is_at_end():
+            token = self.advance()
+            row = token.start[0]
+
+            if token.type == tokenize.INDENT:
+                depth += 1
+            elif token.type == tokenize.DEDENT:
+                depth -= 1
+
+                if depth == 0:
+                    # Dedents are on the row of the next statement, which may
+                    # be shared by the inner blocks' dedents
+                    while rows and rows[-1] >= row:
+                        rows.pop()
+                        lines.pop()
+
+                    return lines
+
+            if not rows or rows[-1] != row:
+                rows.append(row)
+                lines.append(token.line)
+
+        self.error(self.peek(), "Expected dedent, found end of file")
+
+
+class CompactTokens(Tokens):
+    """
+    A version of ``Tokens`` that stores tokens in parallel arrays rather than
+    as a list of ``TokenInfo`` objects. The token strings and lines are spans
+    into a single copy of the source, and ``TokenInfo`` objects are only built
+    when they are asked for.
+
+    This uses a fraction of the memory of ``Tokens`` and allows for fast scans
+    over the whole file, like ``find_names``.
+    """
+
+    def __init__(self, tokens: Iterable[tokenize.TokenInfo], filename: str):
+        self.filename = filename
+
+        # Columns for each token, ignoring newlines and comments. Offsets are
+        # into self.source
+        self._types = array('B')
+        self._starts = array('q')
+        self._ends = array('q')
+        self._start_rows = array('l')
+        self._end_rows = array('l')
+
+        # Tokens that cannot be described by a span of the source (e.g. the
+        # empty newline that is added to the end of a file without one)
+        self._overrides: Dict[int, tokenize.TokenInfo] = {}
+
+        # The offset of the start of each line within the source
+        self._line_starts = array('q')
+        lines: List[str] = []
+        length = 0
+
+        for token in tokens:
+            end_row = token.end[0]
+
+            # The source is rebuilt from the lines attached to the tokens. The
+            # line of a token always ends on its final row, but may start
+            # earlier if the token spans multiple lines
+            if end_row > len(lines) and token.line:
+                token_lines = token.line.splitlines(True)
+                first_row = end_row - len(token_lines) + 1
+
+                while len(lines) < end_row:
+                    row = len(lines) + 1
+                    line = token_lines[row - first_row] if row >= first_row else ''
+
+                    self._line_starts.append(length)
+                    lines.append(line)
+                    length += len(line)
+
+            if token.type in (tokenize.NL, tokenize.COMMENT):
+                continue
+
+            start = self._offset(token.start, length)
+            end = self._offset(token.end, length)
+
+            if end - start != len(token.string):
+                self._overrides[len(self._types)] = token
+
+            self._types.append(token.type)
+            self._starts.append(start)
+            self._ends.append(end)
+            self._start_rows.append(token.start[0])
+            self._end_rows.append(end_row)
+
+        # A final line start allows the end of the file to be found like any
+        # other line
+        self._line_starts.append(length)
+        self.source = ''.join(lines)
+
+        self._cached_index = -1
+        self._cached_token: Optional[tokenize.TokenInfo] = None
+
+    def _offset(self, position, length: int) -> int:
+        """Converts a (row, column) position into an offset within the source
+        """
+
+        row, column = position
+
+        if row - 1 < len(self._line_starts):
+            return self._line_starts[row - 1] + column
+
+        return length + column
+
+    def __len__(self) -> int:
+        return len(self._types)
+
+    def _token_at(self, index: int) -> tokenize.TokenInfo:
+        """Builds the token at a specific index in the file
+
+        Args:
+            index (int): The index of the token, ignoring newlines and comments
+        """
+
+        # Looking past the end of the file will always give you the end marker
+        if index >= len(self._types):
+            index = len(self._types) - 1
+
+        if index == self._cached_index:
+            return self._cached_token
+
+        if index in self._overrides:
+            token = self._overrides[index]
+        else:
+            line_starts = self._line_starts
+            start = self._starts[index]
+            end = self._ends[index]
+            start_row = self._start_rows[index]
+            end_row = self._end_rows[index]
+
+            token = tokenize.TokenInfo(
+                self._types[index], self.source[start:end],
+                (start_row, start - line_starts[start_row - 1]),
+                (end_row, end - line_starts[end_row - 1]),
+                self._line_of(index))
+
+        self._cached_index = index
+        self._cached_token = token
+
+        return token
+
+    def peek(self, offset: int = 0) -> tokenize.TokenInfo:
+        """
+        Returns what the next token will be without modifying the current toke
+        in the buffer
+
+        Args:
+            offset (int, optional): How many tokens past the next one to look. Defaults to 0.
+        """
+        return self._token_at(self._current_token_index + offset)
+
+    def previous(self) -> tokenize.TokenInfo:
+        """Returns the token before the current one
+
+        Returns:
+            tokenize.TokenInfo: The last token
+        """
+
+        return self._token_at(self._current_token_index - 1)
+
+    def is_at_end(self) -> bool:
+        """
+        Returns true if the next token is an end marker
+        """
+        index = min(self._current_token_index, len(self._types) - 1)
+        return self._types[index] == tokenize.ENDMARKER
+
+    def _row_of(self, index: int) -> int:
+        return self._start_rows[index]
+
+    def _line_of(self, index: int) -> str:
+        if index in self._overrides:
+            return self._overrides[index].line
+
+        # The line is every physical line the token is on
+        line_starts = self._line_starts
+        end_row = self._end_rows[index]
+
+        if end_row >= len(line_starts):
+            return ''
+
+        return self.source[line_starts[self._start_rows[index] - 1]:line_starts[end_row]]
+
+    def _structure(self) -> Iterator[Tuple[int, int, str, int]]:
+        source = self.source
+        starts = self._starts
+
+        for index, token_type in enumerate(self._types):
+            # Only single character operators can be brackets, so there is no
+            # point slicing the source for anything else
+            string = ''
+            if token_type == tokenize.OP and self._ends[index] - starts[index] == 1:
+                string = source[starts[index]]
+
+            yield index, token_type, string, self._start_rows[index]
+
+    def find_names(self, names: Container[str]) -> List[int]:
+        """Finds every name token in the file with one of the provided strings,
+        without building any ``TokenInfo`` objects
+
+        Args:
+            names (Container[str]): The strings to look for, e.g. macro triggers
+
+        Returns:
+            List[int]: The indexes of the matching tokens
+        """
+
+        source = self.source
+        starts = self._starts
+        ends = self._ends
+
+        return [
+            index for index, token_type in enumerate(self._types)
+            if token_type == tokenize.NAME
+            and source[starts[index]:ends[index]] in names
+        ]
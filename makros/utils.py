@@ -1,6 +1,11 @@
+import filecmp
 import hashlib
+import io
+import os
+import re
+import tempfile
 import tokenize
-from typing import Generator, List, TypeVar
+from typing import AnyStr, Dict, Generator, Iterable, List, Optional, Tuple, TypeVar
 
 
 class ReadableString:
@@ -34,6 +39,51 @@ def get_tokens_from_file(file_path: str) -> Generator[tokenize.TokenInfo, None,
             yield token
 
 
+def decode_source(source: bytes) -> str:
+    """Decodes the contents of a python file the same way ``tokenize.open``
+    would, respecting encoding declarations and normalising newlines
+    """
+
+    encoding, _ = tokenize.detect_encoding(io.BytesIO(source).readline)
+    return io.StringIO(source.decode(encoding), newline=None).read()
+
+
+def get_tokens_from_bytes(source: bytes) -> Generator[tokenize.TokenInfo, None, None]:
+    file = io.StringIO(decode_source(source))
+    return _get_tokens(file.readline)
+
+
+_MACRO_IMPORT = re.compile(r'^[ \t]*macro[ \t]+import[ \t]+([\w.]+)',
+                           re.MULTILINE)
+_MACRO_IMPORT_BYTES = re.compile(_MACRO_IMPORT.pattern.encode(),
+                                 re.MULTILINE)
+
+
+def find_macro_imports(source: AnyStr) -> List[str]:
+    """Finds the names of every macro imported by a file without tokenizing
+    it. This is only a quick check, the tokenizer has the final say
+
+    Args:
+        source (AnyStr): The contents of the file, either as a string or as bytes
+
+    Returns:
+        List[str]: The imported macros, e.g. ['enum', 'greet.hello']
+    """
+
+    if isinstance(source, bytes):
+        if b'macro' not in source:
+            return []
+
+        return [
+            name.decode() for name in _MACRO_IMPORT_BYTES.findall(source)
+        ]
+
+    if 'macro' not in source:
+        return []
+
+    return _MACRO_IMPORT.findall(source)
+
+
 T = TypeVar('T')
 
 
@@ -49,3 +99,92 @@ def sha256sum(filename):
         while n := f.readinto(mv):
             h.update(mv[:n])
     return h.hexdigest()
+
+
+_FINGERPRINTS: Dict[str, Tuple[int, int, str]] = {}
+
+
+def file_fingerprint(path: str) -> str:
+    """Returns the sha256 hash of a file. Hashes are remembered for as long as
+    the file's modification time and size stay the same, so asking for the
+    same file again only costs a stat
+
+    Args:
+        path (str): The file to fingerprint
+
+    Returns:
+        str: The hash of the file
+    """
+
+    stat = os.stat(path)
+    remembered = _FINGERPRINTS.get(path)
+
+    if remembered is not None and remembered[:2] == (stat.st_mtime_ns,
+                                                     stat.st_size):
+        return remembered[2]
+
+    fingerprint = sha256sum(path)
+    _FINGERPRINTS[path] = (stat.st_mtime_ns, stat.st_size, fingerprint)
+
+    return fingerprint
+
+
+_FILE_MODE: Optional[int] = None
+
+
+def _default_file_mode() -> int:
+    # Temporary files are only readable by their owner. Files that are moved
+    # into place should get the same permissions that open() would give them,
+    # which means reading the umask (which can only be done by setting it)
+    global _FILE_MODE
+
+    if _FILE_MODE is None:
+        umask = os.umask(0)
+        os.umask(umask)
+        _FILE_MODE = 0o666 & ~umask
+
+    return _FILE_MODE
+
+
+def write_atomic(path: str,
+                 chunks: Iterable[AnyStr],
+                 binary: bool = False,
+                 only_if_changed: bool = False) -> bool:
+    """Writes the chunks to a temporary file next to the path and then renames
+    it over the path, so readers will either see the old file or the new one,
+    never something in between
+
+    Args:
+        path (str): The file that should be written
+        chunks (Iterable[AnyStr]): The contents of the file, in order
+        binary (bool, optional): If the chunks are bytes rather than strings. Defaults to False.
+        only_if_changed (bool, optional): Leave the existing file alone (including its modification time) if it already has the same contents. Defaults to False.
+
+    Returns:
+        bool: If the file was written
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    file = tempfile.NamedTemporaryFile('wb' if binary else 'w',
+                                       dir=directory,
+                                       prefix='.' + os.path.basename(path),
+                                       suffix='.tmp',
+                                       delete=False)
+
+    try:
+        with file:
+            file.writelines(chunks)
+
+        # filecmp checks the sizes before it reads either file
+        if only_if_changed and os.path.isfile(path) and filecmp.cmp(
+                file.name, path, shallow=False):
+            os.unlink(file.name)
+            return False
+
+        os.chmod(file.name, _default_file_mode())
+        os.replace(file.name, path)
+    except BaseException:
+        os.unlink(file.name)
+        raise
+
+    return True
@@ -0,0 +1,22 @@
+import pytest
+
+from makros.cache import TranslationCache
+from makros.makros import Makros
+
+
+@pytest.fixture(autouse=True)
+def translation_cache(monkeypatch, tmp_path_factory) -> TranslationCache:
+    # Tests should not read or write the user's translation cache, as entries
+    # from earlier runs would change what the tests see. Every test gets an
+    # empty cache of its own instead, so the cache is still used like it would
+    # be by default
+    cache = TranslationCache(tmp_path_factory.mktemp('cache'))
+    monkeypatch.setattr(Makros.get(), 'cache', cache)
+
+    return cache
+
+
+@pytest.fixture
+def no_translation_cache(monkeypatch):
+    # For tests that need every file to be translated
+    monkeypatch.setattr(Makros.get(), 'cache', None)
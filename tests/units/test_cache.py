@@ -0,0 +1,160 @@
+import errno
+import os
+from pathlib import Path
+
+import pytest
+
+import makros.cache
+from makros.cache import DEFAULT_MAX_SIZE, TranslationCache, default_cache_dir
+from makros.makros import Makros
+from makros.functions import translate_file
+
+
+class TestTranslationCache:
+    def test_get_and_put(self, tmp_path: Path):
+        cache = TranslationCache(tmp_path)
+        key = cache.key(b"macro import enum\n", [])
+
+        assert cache.get(key) is None
+
+        cache.put(key, b"output")
+        assert cache.get(key) == b"output"
+
+    def test_key(self, tmp_path: Path):
+        cache = TranslationCache(tmp_path)
+        macro = Makros.get()._resolver.resolve('enum')
+
+        assert cache.key(b"a", [macro]) == cache.key(b"a", [macro])
+        assert cache.key(b"a", [macro]) != cache.key(b"b", [macro])
+        assert cache.key(b"a", [macro]) != cache.key(b"a", [])
+        assert cache.key(b"a", [macro]) != cache.key(b"a", [macro], 'splice')
+
+    def test_core_files(self):
+        root = Path(makros.cache.__file__).parent
+
+        # A missing file would stop any key from being built
+        for file in makros.cache._CORE_FILES:
+            assert root.joinpath(file).is_file()
+
+        assert 'macros/pyast.py' in makros.cache._CORE_FILES
+
+    def test_eviction(self, tmp_path: Path):
+        cache = TranslationCache(tmp_path)
+
+        for index, key in enumerate(['aa01', 'aa02', 'aa03']):
+            cache.put(key, b"0123456789")
+
+            # Make sure every entry has a different age
+            os.utime(cache._path(key), ns=(index * 10**9, index * 10**9))
+
+        # Reading the oldest entry makes it the most recently used
+        assert cache.get('aa01') == b"0123456789"
+
+        cache.max_size = 25
+        cache.evict()
+
+        assert cache.get('aa02') is None
+        assert cache.get('aa01') is not None
+        assert cache.get('aa03') is not None
+
+    def test_default_cache_dir(self, monkeypatch, tmp_path: Path):
+        monkeypatch.setenv('MAKROS_CACHE_DIR', str(tmp_path))
+        assert default_cache_dir() == tmp_path
+
+        monkeypatch.setenv('MAKROS_NO_CACHE', '1')
+        assert TranslationCache.from_environment() is None
+
+    def test_cache_size(self, monkeypatch, tmp_path: Path):
+        monkeypatch.setenv('MAKROS_CACHE_DIR', str(tmp_path))
+        monkeypatch.delenv('MAKROS_NO_CACHE', raising=False)
+
+        monkeypatch.setenv('MAKROS_CACHE_SIZE', '1024')
+        assert TranslationCache.from_environment().max_size == 1024
+
+        # A bad size falls back to the default rather than stopping makros
+        monkeypatch.setenv('MAKROS_CACHE_SIZE', '256M')
+        with pytest.warns(UserWarning, match='MAKROS_CACHE_SIZE'):
+            assert TranslationCache.from_environment().max_size == DEFAULT_MAX_SIZE
+
+    def test_read_only(self, monkeypatch, tmp_path: Path):
+        cache = TranslationCache(tmp_path)
+        cache.put('aa01', b"output")
+
+        def utime(*args, **kwargs):
+            raise PermissionError()
+
+        # Entries can still be read when their age can't be updated
+        monkeypatch.setattr(os, 'utime', utime)
+        assert cache.get('aa01') == b"output"
+
+    def test_translate_file(self, monkeypatch, tmp_path: Path):
+        monkeypatch.setattr(Makros.get(), 'cache', TranslationCache(tmp_path.joinpath('cache')))
+
+        source = tmp_path.joinpath('colour.mpy')
+        source.write_text("macro import enum\n\nenum Colour:\n    Red\n    Blue\n")
+
+        assert translate_file(source).translated == 1
+        output = tmp_path.joinpath('colour.py').read_text()
+        tmp_path.joinpath('colour.py').unlink()
+
+        # Another checkout with the same file should get the same output without
+        # translating it again
+        other = tmp_path.joinpath('other')
+        other.mkdir()
+        other.joinpath('colour.mpy').write_text(source.read_text())
+
+        report = translate_file(other.joinpath('colour.mpy'))
+        assert report.cached == 1
+        assert report.translated == 0
+        assert other.joinpath('colour.py').read_text() == output
+
+
+class TestParsePath:
+    # Every test has an empty cache of its own, see conftest.py
+
+    def parse(self, path: Path):
+        parser = Makros.get().get_parser(path)
+        parser.parse()
+
+        return parser.report
+
+    def test_miss_then_hit(self, tmp_path: Path):
+        source = tmp_path.joinpath('colour.mpy')
+        source.write_text("macro import enum\n\nenum Colour:\n    Red\n")
+
+        report = self.parse(source)
+        assert (report.translated, report.cached) == (1, 0)
+        output = tmp_path.joinpath('colour.py').read_text()
+
+        report = self.parse(source)
+        assert (report.translated, report.cached) == (0, 1)
+        assert tmp_path.joinpath('colour.py').read_text() == output
+
+        # A different file is a different entry
+        source.write_text("macro import enum\n\nenum Colour:\n    Blue\n")
+        report = self.parse(source)
+        assert (report.translated, report.cached) == (1, 0)
+        assert 'Blue' in tmp_path.joinpath('colour.py').read_text()
+
+    def test_read_only(self, tmp_path: Path, monkeypatch):
+        source = tmp_path.joinpath('colour.mpy')
+        source.write_text("macro import enum\n\nenum Colour:\n    Red\n")
+        self.parse(source)
+
+        # Permissions don't stop root from writing, so the file system is made
+        # read only instead
+        def read_only(*args, **kwargs):
+            raise OSError(errno.EROFS, 'Read-only file system')
+
+        monkeypatch.setattr(os, 'utime', read_only)
+        monkeypatch.setattr(makros.cache, 'write_atomic', read_only)
+
+        report = self.parse(source)
+        assert (report.translated, report.cached) == (0, 1)
+
+        # Entries that can't be stored are just translated every time
+        source.write_text("macro import enum\n\nenum Colour:\n    Blue\n")
+
+        for _ in range(2):
+            report = self.parse(source)
+            assert (report.translated, report.cached) == (1, 0)
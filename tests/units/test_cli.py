@@ -50,4 +50,16 @@ class TestCli:
             env=env)
         stdout = str(process.stdout)
 
-        assert "Hello, World!" in stdout
\ No newline at end of file
+        assert "Hello, World!" in stdout
+
+    def test_report(self):
+        process = subprocess.run(
+            'makros tests/units/makro_example.mpy --convert --report --coverage',
+            check=True,
+            shell=True,
+            capture_output=True,
+            env=env)
+        stdout = str(process.stdout)
+
+        assert "translated" in stdout
+        assert "Hello, World!" not in stdout
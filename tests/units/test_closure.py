@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from makros.closure import find_imports, import_closure
+
+
+class TestClosure:
+    def test_find_imports(self):
+        source = ("import os, sys as system\n"
+                  "macro import enum\n"
+                  "from . import a, b as c\n"
+                  "from ..shapes.square import (Corner,\n    Side)\n"
+                  "from typing import *\n")
+
+        assert find_imports(source) == [
+            (0, 'os'), (0, 'sys'), (1, 'a'), (1, 'b'), (2, 'shapes.square'),
+            (2, 'shapes.square.Corner'), (2, 'shapes.square.Side'),
+            (0, 'typing')
+        ]
+
+    def test_import_closure(self, tmp_path: Path):
+        package = tmp_path.joinpath('shapes')
+        package.mkdir()
+        package.joinpath('__init__.py').write_text("")
+        package.joinpath('square.mpy').write_text("from .. import outside\n")
+        package.joinpath('square.py').write_text("")
+
+        entry = tmp_path.joinpath('main.mpy')
+        entry.write_text("import shapes.square\nimport main\n")
+
+        # Modules that cannot be found are ignored, and macro files win over
+        # the files they were translated into
+        assert import_closure(entry) == [
+            entry,
+            package.joinpath('__init__.py'),
+            package.joinpath('square.mpy')
+        ]
@@ -0,0 +1,87 @@
+import ast
+import tokenize
+
+import pytest
+
+from makros.emitter import Emitter, inline_expansions, render
+from makros.utils import get_tokens_from_string
+
+
+class TestEmitter:
+    def test_render_string(self):
+        assert render("a = 1\nb = 2", "    ") == "\na = 1\n    b = 2\n"
+
+    def test_render_tokens(self):
+        output = render([
+            (tokenize.NAME, 'if'),
+            (tokenize.NAME, 'x'),
+            (tokenize.OP, ':'),
+            (tokenize.NEWLINE, '\n'),
+            (tokenize.INDENT, '    '),
+            (tokenize.NAME, 'pass'),
+            (tokenize.NEWLINE, '\n'),
+            (tokenize.DEDENT, ''),
+        ], "  ")
+
+        # The indentation of the macro is added to every line, including
+        # indented ones
+        assert [line.strip() for line in output.splitlines()] == ['', 'if x :', 'pass']
+        assert output.splitlines()[1].startswith('  if')
+        assert output.splitlines()[2].startswith('      pass')
+
+    def test_render_token_statements(self):
+        tokens = get_tokens_from_string(
+            "x = 1\nif x:\n    x += 1\ny = x * 2\n")
+
+        # Every statement ends up inside the block, not just the first
+        source = "def f():" + render(list(tokens), "    ") + "    return y\n"
+
+        scope = {}
+        exec(source, scope)
+        assert scope['f']() == 4
+
+    def test_render_ast(self):
+        statement = ast.parse("x = 1").body[0]
+        assert render(statement, "    ") == "\n    x = 1\n"
+
+        scope = {}
+        exec("def f():" + render(statement, "    ") + "    return x\n", scope)
+        assert scope['f']() == 1
+
+        # When compiling, the statements are kept to one side and swapped back
+        # in after the file has been parsed
+        expansions = []
+        source = "def f():" + render([statement], "    ", expansions) + "    return x\n"
+        module = inline_expansions(ast.parse(source), expansions)
+
+        scope = {}
+        exec(compile(module, 'test', 'exec'), scope)
+        assert scope['f']() == 1
+
+    def test_render_ast_without_unparse(self, monkeypatch):
+        statement = ast.parse("x = 1").body[0]
+        monkeypatch.delattr(ast, 'unparse')
+
+        with pytest.raises(RuntimeError, match='python 3.9'):
+            render(statement, "    ")
+
+        # Compiling doesn't need to turn the statements back into code
+        expansions = []
+        source = "def f():" + render([statement], "    ", expansions) + "    return x\n"
+        module = inline_expansions(ast.parse(source), expansions)
+
+        scope = {}
+        exec(compile(module, 'test', 'exec'), scope)
+        assert scope['f']() == 1
+
+    def test_indentation(self):
+        emitter = Emitter()
+        levels = []
+
+        for token in get_tokens_from_string("if a:\n    if b:\n        pass\nc = 1"):
+            emitter.token(token)
+            levels.append(emitter.indentation)
+
+        assert '        ' in levels
+        assert emitter.indentation == ''
+        assert emitter.flush() == "if a:\n    if b:\n        pass\nc = 1\n"
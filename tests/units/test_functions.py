@@ -0,0 +1,155 @@
+import importlib.machinery
+import importlib.util
+import os
+from pathlib import Path
+
+from makros import BuildReport, Makros, translate_file, translate_folder, translate_imports
+from makros.bytecode import hash_pyc_to_code
+
+
+class TestTranslate:
+    def test_copies_files_without_macros(self, tmp_path: Path):
+        source = tmp_path.joinpath('plain.mpy')
+        source.write_text("# A comment that would be removed by the parser\n\nprint('hello')\n")
+
+        report = translate_file(source)
+
+        assert tmp_path.joinpath('plain.py').read_text() == source.read_text()
+        assert report.copied == 1
+        assert report.translated == 0
+
+    def test_translate_folder_report(self, tmp_path: Path):
+        tmp_path.joinpath('nested').mkdir()
+        tmp_path.joinpath('plain.mpy').write_text("print('hello')\n")
+        tmp_path.joinpath('nested', 'enum.mpy').write_text(
+            "macro import enum\n\nenum Colour:\n    Red\n    Blue\n")
+
+        report = BuildReport()
+        assert translate_folder(tmp_path, report) is report
+
+        assert report.copied == 1
+        assert report.translated == 1
+        assert report.total == 2
+        assert "class Colour" in tmp_path.joinpath('nested', 'enum.py').read_text()
+
+    def test_incremental(self, tmp_path: Path, no_translation_cache):
+        local = Path(__file__).parent.parent.joinpath('macros', 'local')
+        package = tmp_path.joinpath('local')
+        package.mkdir()
+
+        for name in ['macros.json', 'hello.mpy']:
+            package.joinpath(name).write_text(local.joinpath(name).read_text())
+
+        tmp_path.joinpath('greet.mpy').write_text("macro import local.hello\n\nhello\n")
+        tmp_path.joinpath('colour.mpy').write_text("macro import enum\n\nenum Colour:\n    Red\n")
+
+        first = translate_folder(tmp_path)
+        assert first.skipped == 0
+
+        # Nothing has changed, so nothing should be built
+        second = translate_folder(tmp_path)
+        assert second.skipped == second.total == 3
+
+        # Touching a macro without changing it is not enough to rebuild
+        os.utime(package.joinpath('hello.mpy'))
+        assert translate_folder(tmp_path).skipped == 3
+
+        # Changing the macro should only rebuild the files that use it
+        hello = package.joinpath('hello.mpy')
+        hello.write_text(hello.read_text().replace('Hello World', 'Hello Macros'))
+
+        # Packages are only bootstrapped once per process, and this would
+        # usually be a new process
+        Makros.get()._resolver.bootstrapped_folders.clear()
+
+        third = translate_folder(tmp_path)
+        assert third.translated == 2
+        assert third.skipped == 1
+        assert 'Hello Macros' in tmp_path.joinpath('greet.py').read_text()
+
+        # Editing the output means it has to be built again
+        tmp_path.joinpath('colour.py').write_text("")
+        assert translate_folder(tmp_path).skipped == 2
+        assert 'class Colour' in tmp_path.joinpath('colour.py').read_text()
+
+        assert translate_folder(tmp_path, incremental=False).skipped == 0
+
+    def test_unchanged_outputs_are_not_rewritten(self, tmp_path: Path):
+        source = tmp_path.joinpath('colour.mpy')
+        source.write_text("macro import enum\n\nenum Colour:\n    Red\n")
+        output = tmp_path.joinpath('colour.py')
+
+        assert translate_file(source).rewritten == 1
+
+        os.utime(output, ns=(10**9, 10**9))
+        report = translate_file(source)
+
+        assert (report.rewritten, report.unchanged) == (0, 1)
+        assert output.stat().st_mtime_ns == 10**9
+
+        source.write_text("macro import enum\n\nenum Colour:\n    Blue\n")
+        assert translate_file(source).rewritten == 1
+        assert 'Blue' in output.read_text()
+
+    def test_emit_pyc(self, tmp_path: Path):
+        tmp_path.joinpath('colour.mpy').write_text(
+            "macro import enum\n\nenum Colour:\n    Red\n")
+        tmp_path.joinpath('plain.mpy').write_text("VALUE = 1\n")
+
+        report = translate_folder(tmp_path, emit='pyc')
+        assert (report.translated, report.copied) == (1, 1)
+
+        assert not tmp_path.joinpath('colour.py').exists()
+        assert not tmp_path.joinpath('__pycache__').exists()
+
+        # Python can import bytecode without a source file next to it
+        spec = importlib.util.spec_from_file_location(
+            'colour', tmp_path.joinpath('colour.pyc'))
+        assert isinstance(spec.loader, importlib.machinery.SourcelessFileLoader)
+
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        assert str(module.Colour.Red()) == 'Red'
+
+        assert translate_folder(tmp_path, emit='pyc').skipped == 2
+
+    def test_emit_both(self, tmp_path: Path):
+        source = tmp_path.joinpath('colour.mpy')
+        source.write_text("macro import enum\n\nenum Colour:\n    Red\n")
+
+        translate_file(source, emit='both')
+
+        output = tmp_path.joinpath('colour.py')
+        bytecode = importlib.util.cache_from_source(str(output))
+
+        with open(bytecode, 'rb') as file:
+            code = hash_pyc_to_code(file.read(),
+                                    importlib.util.source_hash(output.read_bytes()))
+
+        assert code is not None
+        assert code.co_filename == str(output)
+
+    def test_translate_imports(self, tmp_path: Path):
+        package = tmp_path.joinpath('shapes')
+        package.mkdir()
+        package.joinpath('__init__.mpy').write_text("from .square import Corner\n")
+        package.joinpath('square.mpy').write_text(
+            "macro import enum\n\nenum Corner:\n    Top\n")
+        tmp_path.joinpath('helper.py').write_text("import colours\n")
+        tmp_path.joinpath('colours.mpy').write_text("RED = 1\n")
+        tmp_path.joinpath('unused.mpy').write_text("UNUSED = 1\n")
+
+        entry = tmp_path.joinpath('main.mpy')
+        entry.write_text("import os, helper\nfrom shapes import (\n    Corner\n)\n")
+
+        report = translate_imports(entry)
+        assert report.total == 4
+
+        assert tmp_path.joinpath('shapes', 'square.py').exists()
+        assert tmp_path.joinpath('colours.py').exists()
+        assert not tmp_path.joinpath('unused.py').exists()
+
+        # Files outside of the closure keep their state
+        assert translate_folder(tmp_path).skipped == 4
+        assert translate_imports(entry).skipped == 4
+        assert translate_folder(tmp_path).skipped == 5
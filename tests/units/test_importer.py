@@ -0,0 +1,92 @@
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+from makros import install_import_hook, uninstall_import_hook
+from makros.parser import MakroParser
+
+
+@pytest.fixture
+def import_folder(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(sys, 'dont_write_bytecode', False)
+    sys.path.insert(0, str(tmp_path))
+    install_import_hook()
+
+    yield tmp_path
+
+    uninstall_import_hook()
+    sys.path.remove(str(tmp_path))
+
+    for name in list(sys.modules):
+        if name.startswith('colours') or name.startswith('shapes'):
+            del sys.modules[name]
+
+
+def forget(name: str):
+    del sys.modules[name]
+    importlib.invalidate_caches()
+
+
+class TestImportHook:
+    def test_imports_mpy(self, import_folder: Path):
+        import_folder.joinpath('colours.mpy').write_text(
+            "macro import enum\n\nenum Colour:\n    Red\n    Blue\n")
+
+        colours = importlib.import_module('colours')
+
+        assert str(colours.Colour.Blue()) == 'Blue'
+        assert colours.__file__ == str(import_folder.joinpath('colours.mpy'))
+
+        # Nothing is written next to the source, only to __pycache__
+        assert sorted(path.name for path in import_folder.iterdir()) == [
+            '__pycache__', 'colours.mpy'
+        ]
+        assert [path.name for path in import_folder.joinpath('__pycache__').iterdir()
+                ] == [f'colours.{sys.implementation.cache_tag}.opt-makros.pyc']
+
+    def test_import_in_docstring(self, import_folder: Path):
+        import_folder.joinpath('colours.mpy').write_text(
+            '"""Use with:\n\nmacro import mypkg.thing\n"""\nmacro import enum\n\nenum Colour:\n    Red\n')
+
+        colours = importlib.import_module('colours')
+        assert colours.Colour.Red is not None
+
+    def test_packages(self, import_folder: Path):
+        package = import_folder.joinpath('shapes')
+        package.mkdir()
+        package.joinpath('__init__.mpy').write_text("SIDES = 4\n")
+        package.joinpath('square.mpy').write_text(
+            "macro import enum\n\nenum Corner:\n    Top\n    Bottom\n")
+
+        square = importlib.import_module('shapes.square')
+
+        assert square.Corner.Top is not None
+        assert sys.modules['shapes'].SIDES == 4
+
+    def test_uses_bytecode_cache(self, import_folder: Path, monkeypatch):
+        source = import_folder.joinpath('colours.mpy')
+        source.write_text("macro import enum\n\nenum Colour:\n    Red\n")
+        importlib.import_module('colours')
+        forget('colours')
+
+        compiled = []
+        original = MakroParser.compile_bytes
+
+        def compile_bytes(self, *args):
+            compiled.append(args)
+            return original(self, *args)
+
+        monkeypatch.setattr(MakroParser, 'compile_bytes', compile_bytes)
+
+        importlib.import_module('colours')
+        assert compiled == []
+        forget('colours')
+
+        # Changing the source throws away the bytecode
+        source.write_text("macro import enum\n\nenum Colour:\n    Green\n")
+        colours = importlib.import_module('colours')
+
+        assert len(compiled) == 1
+        assert colours.Colour.Green is not None
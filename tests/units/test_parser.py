@@ -1,5 +1,13 @@
+import ast
 from pathlib import Path
+import pytest
+
+from makros.cache import TranslationCache
 from makros.makros import Makros
+from makros.registration.resolver import ResolutionError
+from makros.scope import ExpansionCache
+from makros.tokens import Tokens
+from makros.utils import get_tokens_from_string, tokens_to_list
 
 
 class TestParser:
@@ -55,6 +63,8 @@ class namespace_store:
         def get(key):
             return store_contents[key]
         
+        load_store()
+        
         self.set = set
         self.get = get
 
@@ -63,4 +73,194 @@ del namespace_store
 # End of namespace store
 store.set('test', 'Hello world!')
 print(store.get('test'))
-"""
\ No newline at end of file
+"""
+
+    def test_macros_do_not_leak_between_files(self):
+        parser = Makros.get().get_parser(Path('./internal.mpy'))
+        parser.parse_string("macro import namespace\n")
+
+        assert 'namespace' in parser.scope
+
+        # The namespace macro was never imported here, so the name should be
+        # passed straight through
+        other_parser = Makros.get().get_parser(Path('./other.mpy'))
+        assert other_parser.parse_string("namespace = 5") == "namespace = 5\n"
+        assert len(other_parser.available_macros) == 0
+
+    def test_stream_tokens(self):
+        parser = Makros.get().get_parser(Path('./internal.mpy'))
+        chunks = list(parser.stream_tokens(get_tokens_from_string("a = 1\nb = 2")))
+
+        # Untouched lines are passed through together
+        assert chunks == ["a = 1\nb = 2\n"]
+
+        parser.chunk_lines = 1
+        chunks = list(parser.stream_tokens(get_tokens_from_string("a = 1\nb = 2")))
+
+        assert chunks == ["a = 1\n", "b = 2\n"]
+
+    def test_nested_indentation(self):
+        source = "macro import namespace\n\nclass A:\n    def run(self):\n        namespace test:\n            export def a():\n                return 1\n\n        return test.a()\n\nx = A().run()\n"
+        parser = Makros.get().get_parser(Path('./internal.mpy'))
+
+        scope = {}
+        exec(parser.parse_string(source), scope)
+        assert scope['x'] == 1
+
+    def test_multiline_strings(self):
+        parser = Makros.get().get_parser(Path('./internal.mpy'))
+        source = 'a = 1; b = """x\ny""" + "z"\n'
+
+        assert parser.parse_string(source) == source
+
+    def test_parse_path(self, tmp_path: Path):
+        source = tmp_path.joinpath('example.mpy')
+        source.write_text("macro import namespace\n\nnamespace test:\n    export def a():\n        pass\n\ntest.a()\n")
+
+        Makros.get().get_parser(source).parse()
+
+        output = tmp_path.joinpath('example.py').read_text()
+        assert output.startswith("# Macro imported: namespace\n")
+        assert "class namespace_test:" in output
+
+    def test_parse_path_failure_keeps_output(self, tmp_path: Path):
+        source = tmp_path.joinpath('example.mpy')
+        source.write_text("a = 1\nmacro import not_a_macro\n")
+        tmp_path.joinpath('example.py').write_text("old = True\n")
+
+        with pytest.raises(ResolutionError):
+            Makros.get().get_parser(source).parse()
+
+        # The old output should still be there and no temporary files should
+        # have been left behind
+        assert tmp_path.joinpath('example.py').read_text() == "old = True\n"
+        assert sorted(file.name for file in tmp_path.iterdir()) == ['example.mpy', 'example.py']
+
+    def test_parse_path_import_in_string(self, tmp_path: Path, monkeypatch):
+        monkeypatch.setattr(Makros.get(), 'cache',
+                            TranslationCache(tmp_path.joinpath('cache')))
+
+        # The quick check for imports also finds this one, which isn't real
+        source = tmp_path.joinpath('example.mpy')
+        source.write_text('"""\nmacro import mypkg.thing\n"""\nmacro import namespace\n\nnamespace test:\n    export def a():\n        pass\n')
+
+        Makros.get().get_parser(source).parse()
+
+        parser = Makros.get().get_parser(source)
+        parser.parse()
+
+        assert parser.report.cached == 1
+        assert "class namespace_test:" in tmp_path.joinpath('example.py').read_text()
+
+    def test_lookahead(self):
+        parser = Makros.get().get_parser(Path('./internal.mpy'))
+        parser.lookahead = 4
+
+        output = parser.parse_string("macro import namespace\n\nnamespace test:\n    export def a():\n        pass\n\ntest.a()")
+
+        parser.lookahead = None
+        assert output == parser.parse_string("macro import namespace\n\nnamespace test:\n    export def a():\n        pass\n\ntest.a()")
+
+    def test_compact_tokens(self):
+        source = "macro import namespace\n\nnamespace test:\n    export def a():\n        pass\n\ntest.a()"
+        parser = Makros.get().get_parser(Path('./internal.mpy'))
+        expected = parser.parse_string(source)
+
+        parser.compact_tokens = True
+        assert parser.parse_string(source) == expected
+
+    def test_splice(self):
+        source = "macro import namespace\n\n# A comment\nnamespace test:\n    export def a():\n        pass\n\ntest.a()\n"
+        parser = Makros.get().get_parser(Path('./internal.mpy'))
+        expected = parser.parse_string(source)
+
+        parser.splice = True
+        output = parser.parse_string(source)
+
+        # Only the comment and blank lines, which are copied across untouched,
+        # should be different
+        assert output.startswith("# Macro imported: namespace\n\n# A comment\n")
+        assert [line for line in output.splitlines() if line.strip() and line != '# A comment'] == \
+            [line for line in expected.splitlines() if line.strip()]
+
+    def test_splice_ignores_strings_and_brackets(self):
+        source = 'macro import namespace\ntext = """\nnamespace test:\n"""\nitems = [\n    namespace\n]\nvalue = 1 + \\\n    namespace\n'
+        parser = Makros.get().get_parser(Path('./internal.mpy'))
+        parser.splice = True
+
+        assert parser.parse_string(source) == "# Macro imported: namespace\n" + source.split('\n', 1)[1]
+
+    def test_splice_long_enum_bases(self):
+        source = "macro import enum\nimport abc\nimport collections.abc\n\nenum A(collections.abc.Hashable, collections.abc.Container, abc.ABC, metaclass=abc.ABCMeta):\n    B\n    C\n"
+        parser = Makros.get().get_parser(Path('./internal.mpy'))
+        expected = parser.parse_string(source)
+
+        # The bases are further ahead than the lookahead window reaches
+        parser.splice = True
+        output = parser.parse_string(source)
+
+        assert [line for line in output.splitlines() if line.strip()] == \
+            [line for line in expected.splitlines() if line.strip()]
+
+        scope = {}
+        exec(output, scope)
+        assert issubclass(scope['A'], scope['collections'].abc.Hashable)
+
+    def test_splice_indented(self):
+        source = "macro import namespace\n\ndef run():\n    namespace test:\n        export def a():\n            return 1\n\n    return test.a()\n"
+        parser = Makros.get().get_parser(Path('./internal.mpy'))
+        parser.splice = True
+
+        scope = {}
+        exec(parser.parse_string(source), scope)
+        assert scope['run']() == 1
+
+    def test_compile_string(self):
+        parser = Makros.get().get_parser(Path('./internal.mpy'))
+        code = parser.compile_string("macro import enum\n\nenum Shape:\n    Circle\n    Rect(w: int, h: int)\n\nvalue = str(Shape.Rect(1, 2))\n")
+
+        scope = {}
+        exec(code, scope)
+        assert scope['value'] == 'Rect(w: 1, h: 2)'
+        assert code.co_filename == 'internal.mpy'
+
+    def test_enum_translate_ast(self):
+        parser = Makros.get().get_parser(Path('./internal.mpy'))
+        parser.parse_string("macro import enum\n")
+        enum = parser.scope.get('enum')
+
+        def expand(prefer_ast: bool):
+            tokens = Tokens(tokens_to_list(get_tokens_from_string("enum Shape(Exception):\n    Circle\n    Rect(w: int, h: int)\n    Point(x)\n")), 'enum.mpy')
+            tokens.advance()
+            return enum.expand(tokens, prefer_ast)
+
+        # The ast should be exactly what python would parse from the string
+        # version of the translator
+        assert ast.dump(ast.Module(body=expand(True), type_ignores=[])) == ast.dump(ast.parse(expand(False)))
+
+    def test_expansion_cache(self, monkeypatch):
+        expansions = ExpansionCache()
+        monkeypatch.setattr(Makros.get(), 'expansions', expansions)
+
+        source = "macro import enum\n\nenum Colour:\n    Red\n    Blue\n\ndef f():\n    enum Colour:\n        Red\n        Blue\n    return Colour\n"
+        first = Makros.get().get_parser(Path('./a.mpy')).parse_string(source)
+
+        # The second enum is the same as the first, just indented
+        assert (expansions.hits, expansions.misses) == (1, 1)
+
+        second = Makros.get().get_parser(Path('./b.mpy')).parse_string(source)
+        assert (expansions.hits, expansions.misses) == (3, 1)
+        assert first == second
+
+        scope = {}
+        exec(second, scope)
+        assert str(scope['f']().Red()) == 'Red'
+
+    def test_expansion_cache_size(self):
+        expansions = ExpansionCache(max_size=1)
+        expansions.put('a', 'a = 1', 1)
+        expansions.put('b', 'b = 1', 1)
+
+        assert expansions.get('a') is None
+        assert expansions.get('b') == ('b = 1', 1)
+        assert len(expansions) == 1
@@ -0,0 +1,261 @@
+import json
+import zipfile
+from pathlib import Path
+
+from makros import Makros, build_archive
+import makros.registration.macro_def as macro_def
+import makros.registration.resolver as resolver
+from makros.registration.macro_def import MacroDef
+from makros.registration.resolver import LocalIndex, PackageRegistry, Resolver
+
+
+def make_package(folder: Path) -> Path:
+    folder.mkdir(parents=True)
+    folder.joinpath('macros.json').write_text('{"macros": []}')
+    return folder
+
+
+class TestLocalIndex:
+    def test_finds_packages(self, tmp_path: Path):
+        greet = make_package(tmp_path.joinpath('src', 'greet'))
+        make_package(tmp_path.joinpath('.git', 'hidden'))
+        make_package(tmp_path.joinpath('venv', 'lib', 'installed'))
+        tmp_path.joinpath('venv', 'pyvenv.cfg').write_text('')
+        tmp_path.joinpath('plain').mkdir()
+
+        index = LocalIndex(tmp_path)
+
+        assert index.find('greet') == greet
+        assert index.find('hidden') is None
+        assert index.find('installed') is None
+
+        # Folders without a manifest are not packages
+        assert index.find('plain') is None
+
+    def test_rebuilds_when_folders_change(self, tmp_path: Path, monkeypatch):
+        index = LocalIndex(tmp_path)
+        assert index.find('greet') is None
+
+        walks = []
+        original = resolver.walk
+
+        def walk(*args):
+            walks.append(args)
+            return original(*args)
+
+        monkeypatch.setattr(resolver, 'walk', walk)
+
+        # Misses are remembered until something changes
+        assert index.find('greet') is None
+        assert walks == []
+
+        greet = make_package(tmp_path.joinpath('greet'))
+        assert index.find('greet') == greet
+        assert len(walks) == 1
+
+        assert index.find('greet') == greet
+        assert len(walks) == 1
+
+    def test_resolver_indexes_each_root_once(self, tmp_path: Path,
+                                             monkeypatch):
+        monkeypatch.setattr(Resolver, 'local_indexes', {})
+        monkeypatch.setattr(Resolver, 'cwd', tmp_path)
+        greet = make_package(tmp_path.joinpath('greet'))
+
+        local = Resolver()
+        assert local.find_folder_recursive('greet') == greet
+        assert list(Resolver.local_indexes) == [str(tmp_path)]
+
+        index = Resolver.local_indexes[str(tmp_path)]
+        assert local.find_folder_recursive('greet') == greet
+        assert Resolver.local_indexes[str(tmp_path)] is index
+
+    def test_closest_package_wins(self, tmp_path: Path):
+        deep = make_package(tmp_path.joinpath('a', 'b', 'greet'))
+        close = make_package(tmp_path.joinpath('z', 'greet'))
+
+        index = LocalIndex(tmp_path)
+        assert index.find('greet') == close
+
+        # Only packages within the folder are found
+        assert index.find('greet', tmp_path.joinpath('a')) == deep
+        assert index.find('greet', tmp_path.joinpath('plain')) is None
+
+    def test_resolver_reuses_parent_indexes(self, tmp_path: Path, monkeypatch):
+        monkeypatch.setattr(Resolver, 'local_indexes', {})
+        monkeypatch.setattr(Resolver, 'local_roots', set())
+        deep = make_package(tmp_path.joinpath('a', 'b', 'greet'))
+        make_package(tmp_path.joinpath('z', 'greet'))
+
+        walks = []
+        original = resolver.walk
+
+        def walk(*args):
+            walks.append(args)
+            return original(*args)
+
+        monkeypatch.setattr(resolver, 'walk', walk)
+        local = Resolver()
+
+        # A folder being translated is indexed as a whole, even if a folder
+        # within it looks for a package first
+        local.add_local_root(tmp_path)
+        monkeypatch.setattr(Resolver, 'cwd', tmp_path.joinpath('a'))
+        assert local.find_folder_recursive('greet') == deep
+
+        for folder in [tmp_path, tmp_path.joinpath('a', 'b'), tmp_path.joinpath('z')]:
+            monkeypatch.setattr(Resolver, 'cwd', folder)
+            assert local.find_folder_recursive('greet') is not None
+
+        assert walks == [(str(tmp_path), )]
+
+
+def install(site: Path, distribution: str, module: str, entry_point: str = None):
+    info = site.joinpath(f'{distribution}-0.1.dist-info')
+    info.mkdir(parents=True)
+    info.joinpath('METADATA').write_text(
+        f'Metadata-Version: 2.1\nName: {distribution}\nVersion: 0.1\n')
+
+    if entry_point is not None:
+        info.joinpath('entry_points.txt').write_text(
+            f'[makros.packages]\n{entry_point} = {module}\n')
+
+    return make_package(site.joinpath(module))
+
+
+class TestPackageRegistry:
+    def test_entry_points(self, tmp_path: Path, monkeypatch):
+        monkeypatch.syspath_prepend(str(tmp_path))
+        registry = PackageRegistry()
+
+        folder = install(tmp_path, 'greetings', 'greetings_macros', 'greet')
+        assert registry.find('greet') == folder
+
+        # Packages without an entry point are still found by their name
+        assert registry.find('greetings_macros') == folder
+        assert registry.find('missing') is None
+
+        # Installing a new distribution is noticed
+        other = install(tmp_path, 'farewells', 'farewells_macros', 'farewell')
+        assert registry.find('farewell') == other
+
+
+class TestPackageManifest:
+    def test_cached(self, tmp_path: Path):
+        from makros.registration.manifest import PackageManifest
+
+        path = tmp_path.joinpath('macros.json')
+        path.write_text(
+            '{"name": "Greeter", "package": "greet", "description": "",'
+            ' "macros": [{"name": "Hello", "keyword": "hello", "description": "",'
+            ' "file": "hello.py"}]}')
+
+        manifest = PackageManifest.load(path)
+        assert manifest.macros_by_keyword['hello']['file'] == 'hello.py'
+        assert PackageManifest.load(path) is manifest
+
+        path.write_text(path.read_text().replace('hello.py', 'hi.py'))
+        changed = PackageManifest.load(path)
+
+        assert changed is not manifest
+        assert changed.macros_by_keyword['hello']['file'] == 'hi.py'
+
+
+class TestMacroDef:
+    def test_modules_are_lazy_and_shared(self, tmp_path: Path, monkeypatch):
+        monkeypatch.setattr(macro_def, '_modules', {})
+        path = tmp_path.joinpath('hello.py')
+        path.write_text("VALUE = 1\n")
+
+        loads = []
+        original = macro_def._importlib_util.spec_from_file_location
+
+        def spec_from_file_location(*args):
+            loads.append(args)
+            return original(*args)
+
+        monkeypatch.setattr(macro_def._importlib_util,
+                            'spec_from_file_location', spec_from_file_location)
+
+        first = MacroDef('hello', None, str(path))
+        second = MacroDef('hello', None, str(path))
+        assert loads == []
+
+        assert first.parser_module.VALUE == 1
+        assert second.parser_module is first.parser_module
+        assert len(loads) == 1
+
+        # Changing the file loads it again
+        path.write_text("VALUE = 2\n")
+        assert MacroDef('hello', None, str(path)).parser_module.VALUE == 2
+
+
+class TestArchive:
+    def test_build_and_use(self, tmp_path: Path, monkeypatch):
+        monkeypatch.setattr(Resolver, 'local_indexes', {})
+
+        package = tmp_path.joinpath('source', 'greet')
+        package.mkdir(parents=True)
+
+        local = Path(__file__).parent.parent.joinpath('macros', 'local')
+        for name in ['macros.json', 'hello.mpy']:
+            package.joinpath(name).write_text(local.joinpath(name).read_text())
+
+        project = tmp_path.joinpath('project')
+        project.mkdir()
+        archive = build_archive(package, project.joinpath('greet.makros'))
+
+        with zipfile.ZipFile(archive) as contents:
+            assert sorted(contents.namelist()) == [
+                'hello.py', 'hello.pyc', 'macros.json'
+            ]
+            assert json.loads(contents.read('macros.json'))['bootstrap'] == []
+
+        # The package is never bootstrapped
+        assert not package.joinpath('hello.py').exists()
+
+        entry = project.joinpath('main.mpy')
+        parser = Makros.get().get_parser(entry)
+        output = parser.parse_string("macro import greet.hello\n\nhello\n")
+
+        assert 'print("Hello World")' in output
+        assert parser.available_macros[0].parser_file_location == str(archive)
+        assert sorted(path.name for path in project.iterdir()) == ['greet.makros']
+
+    def test_nested_files_and_rebuilds(self, tmp_path: Path, monkeypatch):
+        monkeypatch.setattr(Resolver, 'local_indexes', {})
+
+        package = tmp_path.joinpath('greet')
+        package.joinpath('sub').mkdir(parents=True)
+        package.joinpath('macros.json').write_text(json.dumps({
+            'name': 'Greeter', 'package': 'greet', 'description': '',
+            'macros': [{'name': 'Bye', 'keyword': 'bye', 'description': '',
+                        'file': 'sub/bye.py'}]
+        }))
+
+        bye = package.joinpath('sub', 'bye.py')
+        bye.write_text(
+            "from makros.macro_creation import MacroParser, MacroTranslator\n\n"
+            "class Parser(MacroParser):\n"
+            "    def parse(self, tokens):\n"
+            "        return None\n\n"
+            "class Translator(MacroTranslator):\n"
+            "    def translate(self, ast):\n"
+            "        return 'print(\"Bye\")'\n")
+
+        project = tmp_path.joinpath('project')
+        project.mkdir()
+        archive = project.joinpath('greet.makros')
+        entry = project.joinpath('main.mpy')
+
+        def expand() -> str:
+            return Makros.get().get_parser(entry).parse_string(
+                "macro import greet.bye\n\nbye\n")
+
+        build_archive(package, archive)
+        assert 'print("Bye")' in expand()
+
+        # Long running processes see a rebuilt archive
+        bye.write_text(bye.read_text().replace('Bye', 'Goodbye'))
+        build_archive(package, archive)
+        assert 'print("Goodbye")' in expand()
@@ -0,0 +1,86 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from makros import Makros, run_file, uninstall_import_hook
+from makros.cache import TranslationCache
+from makros.parser import MakroParser
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    yield
+
+    uninstall_import_hook()
+    sys.modules.pop('colours', None)
+
+
+class TestRunFile:
+    def test_runs_as_main(self, tmp_path: Path):
+        tmp_path.joinpath('colours.mpy').write_text(
+            "macro import enum\n\nenum Colour:\n    Red\n")
+        entry = tmp_path.joinpath('main.mpy')
+        entry.write_text(
+            "import sys\n"
+            "from colours import Colour\n\n"
+            "macro import enum\n\n"
+            "enum Size:\n    Small\n\n"
+            "NAME = __name__\n"
+            "ARGS = sys.argv\n"
+            "COLOUR = str(Colour.Red())\n")
+
+        main = sys.modules['__main__']
+        result = run_file(entry, ['--flag'])
+
+        assert result['NAME'] == '__main__'
+        assert result['ARGS'] == [str(entry), '--flag']
+        assert result['COLOUR'] == 'Red'
+        assert result['Size'].Small is not None
+        assert result['__file__'] == str(entry)
+
+        assert sys.modules['__main__'] is main
+        assert str(tmp_path) not in sys.path
+
+        # Nothing is translated next to the files
+        assert not tmp_path.joinpath('main.py').exists()
+        assert not tmp_path.joinpath('colours.py').exists()
+
+    def test_errors_point_at_the_mpy_file(self, tmp_path: Path):
+        entry = tmp_path.joinpath('main.mpy')
+        entry.write_text("macro import enum\n\nraise ValueError('oops')\n")
+
+        with pytest.raises(ValueError) as error:
+            run_file(entry)
+
+        assert error.traceback[-1].path == entry
+
+    def test_caches_code(self, tmp_path: Path, monkeypatch):
+        monkeypatch.setattr(Makros.get(), 'cache',
+                            TranslationCache(tmp_path.joinpath('cache')))
+
+        entry = tmp_path.joinpath('main.mpy')
+        entry.write_text("macro import enum\n\nenum Size:\n    Small\n")
+        run_file(entry)
+
+        compiled = []
+        original = MakroParser.compile_bytes
+
+        def compile_bytes(self, *args):
+            compiled.append(args)
+            return original(self, *args)
+
+        monkeypatch.setattr(MakroParser, 'compile_bytes', compile_bytes)
+
+        assert run_file(entry)['Size'].Small is not None
+        assert compiled == []
+
+    def test_import_in_docstring(self, tmp_path: Path, monkeypatch):
+        monkeypatch.setattr(Makros.get(), 'cache',
+                            TranslationCache(tmp_path.joinpath('cache')))
+
+        entry = tmp_path.joinpath('main.mpy')
+        entry.write_text('"""Use with:\n\nmacro import mypkg.thing\n"""\n'
+                         "macro import enum\n\nenum Size:\n    Small\n")
+
+        assert run_file(entry)['Size'].Small is not None
@@ -0,0 +1,82 @@
+import json
+import os
+from pathlib import Path
+
+from makros.makros import Makros
+from makros.parser import MakroParser
+from makros.state import BOOTSTRAP_FILE, BootstrapState
+
+
+class TestBootstrapState:
+    def get_files(self, tmp_path: Path):
+        source = tmp_path.joinpath('macro.mpy')
+        output = tmp_path.joinpath('macro.py')
+        source.write_text("a = 1\n")
+        output.write_text("a = 1\n")
+
+        return str(source), str(output), str(tmp_path.joinpath('state.json'))
+
+    def test_is_fresh(self, tmp_path: Path):
+        source, output, path = self.get_files(tmp_path)
+        state = BootstrapState(path)
+
+        assert not state.is_fresh(source, output)
+        state.record(source)
+        assert state.is_fresh(source, output)
+
+        # Touching the file does not change it
+        os.utime(source, ns=(10**9, 10**9))
+        assert state.is_fresh(source, output)
+
+        Path(source).write_text("a = 2\n")
+        assert not state.is_fresh(source, output)
+
+        # Missing outputs always need to be bootstrapped
+        state.record(source)
+        os.unlink(output)
+        assert not state.is_fresh(source, output)
+
+    def test_save(self, tmp_path: Path):
+        source, output, path = self.get_files(tmp_path)
+
+        # Nothing has changed, so nothing should be written
+        BootstrapState(path).save()
+        assert not os.path.exists(path)
+
+        state = BootstrapState(path)
+        state.record(source)
+
+        # Another process writes its own file first
+        Path(path).write_text(json.dumps({'other.mpy': [1, 2, 'hash']}))
+        state.save()
+
+        assert set(json.loads(Path(path).read_text())) == {'other.mpy', source}
+        assert BootstrapState(path).is_fresh(source, output)
+
+    def test_packages_are_bootstrapped_once(self, monkeypatch, tmp_path: Path):
+        local = Path(__file__).parent.parent.joinpath('macros', 'local')
+        package = tmp_path.joinpath('local')
+        package.mkdir()
+
+        for name in ['macros.json', 'hello.mpy']:
+            package.joinpath(name).write_text(local.joinpath(name).read_text())
+
+        resolver = Makros.get()._resolver
+        resolver.cwd = tmp_path
+
+        resolver.resolve('local.hello')
+        assert package.joinpath(BOOTSTRAP_FILE).exists()
+
+        parsed = []
+        monkeypatch.setattr(MakroParser, 'parse', lambda parser: parsed.append(parser.file_path))
+
+        # A new process would not remember that the package was bootstrapped,
+        # but the state stored in the package does
+        resolver.bootstrapped_folders.remove(package)
+        resolver.resolve('local.hello')
+        assert parsed == []
+
+        resolver.bootstrapped_folders.remove(package)
+        package.joinpath('hello.mpy').write_text(local.joinpath('hello.mpy').read_text() + "\n")
+        resolver.resolve('local.hello')
+        assert parsed == [package.joinpath('hello.mpy')]
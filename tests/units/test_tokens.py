@@ -1,10 +1,11 @@
+import gc
 import token
 import tokenize
 from typing import List
 import pytest
 
-from makros.tokens import TokenCase, Tokens
-from makros.utils import get_tokens_from_file, tokens_to_list
+from makros.tokens import BufferedTokens, CompactTokens, TokenCase, TokenException, Tokens
+from makros.utils import get_tokens_from_file, get_tokens_from_string, tokens_to_list
 
 
 class TestTokenCase:
@@ -24,6 +25,41 @@ class TestTokenCase:
         assert not TokenCase().string('NL').check(
             tokenize.TokenInfo(token.NL, 'NEWLINE', (1, 1), (1, 1), ''))
 
+    def test_interned(self):
+        assert TokenCase.op(',') is TokenCase().type(token.OP).string(',')
+        assert TokenCase.name() is TokenCase(token.NAME)
+        assert TokenCase.op(',') is not TokenCase.op('.')
+
+    def test_immutable(self):
+        case = TokenCase.name()
+
+        # Chaining creates a new case rather than changing this one
+        assert case.string('for') is not case
+        assert case.check(
+            tokenize.TokenInfo(token.NAME, 'in', (1, 1), (1, 1), ''))
+
+        with pytest.raises(AttributeError):
+            case._token_string = 'for'
+
+    def test_unchained(self):
+        case = TokenCase()
+        case.type(token.NAME)
+        case.string('for')
+
+        # Ignoring what type and string return still works, with a warning
+        with pytest.warns(DeprecationWarning):
+            assert case.check(
+                tokenize.TokenInfo(token.NAME, 'for', (1, 1), (1, 1), ''))
+
+        assert not case.check(
+            tokenize.TokenInfo(token.NAME, 'in', (1, 1), (1, 1), ''))
+
+    def test_interned_cases_are_released(self):
+        TokenCase(token.NAME, 'not_used_anywhere_else')
+        gc.collect()
+
+        assert (token.NAME, 'not_used_anywhere_else') not in TokenCase._interned
+
 
 def includes_tokens(checker: TokenCase, tokens: List[tokenize.TokenInfo]):
     for individual_token in tokens:
@@ -110,6 +146,27 @@ class TestTokens:
         assert not tokens.match(TokenCase().type(token.NAME).string('for'),
                                 TokenCase().type(token.NAME).string('in'))
 
+    def test_match_seq(self):
+        tokens = Tokens(self.get_example_tokens(), 'example.py')
+
+        assert not tokens.match_seq(TokenCase.name('for'), TokenCase.name('in'))
+        assert tokens._current_token_index == 0
+
+        assert tokens.match_seq(TokenCase.name('for'), TokenCase.name('_'),
+                                TokenCase.name('in'))
+        assert tokens._current_token_index == 3
+
+    def test_consume_seq(self):
+        tokens = Tokens(self.get_example_tokens(), 'example.py')
+
+        consumed = tokens.consume_seq(
+            (TokenCase.name('for'), TokenCase.name()), 'Expected "for _"')
+        assert [token.string for token in consumed] == ['for', '_']
+
+        with pytest.raises(Exception):
+            tokens.consume_seq((TokenCase.name('in'), TokenCase.name('in')),
+                               'Expected "in in"')
+
     def test_iterator(self):
         tokens = Tokens(self.get_example_tokens(), 'example.py')
 
@@ -119,3 +176,162 @@ class TestTokens:
         assert tokens.is_at_end()
         with pytest.raises(StopIteration):
             next(tokens)
+
+
+STRUCTURED_SOURCE = """def a(b, c=(1, 2)):
+    if b:
+        return [c]
+
+    return None
+print(a)
+"""
+
+
+class TestStructure:
+    def get_tokens(self) -> Tokens:
+        return Tokens(tokens_to_list(get_tokens_from_string(STRUCTURED_SOURCE)),
+                      'structured.py')
+
+    def test_bracket_span(self):
+        tokens = self.get_tokens()
+        tokens.consume_seq((TokenCase.name('def'), TokenCase.name()), '')
+
+        start, end = tokens.bracket_span()
+        assert tokens.peek().string == '('
+        assert tokens.peek(end - start).string == ')'
+        assert tokens.peek(end - start + 1).string == ':'
+
+        # Nested brackets have their own span
+        start, end = tokens.bracket_span(start + 5)
+        assert tokens.peek(end - tokens.index).string == ')'
+        assert end - start == 4
+
+    def test_block_span(self):
+        tokens = self.get_tokens()
+        tokens.match_seq(*[TokenCase()] * 15)
+
+        assert tokens.peek().type == token.INDENT
+        start, end = tokens.block_span()
+
+        assert tokens.peek(end - start).type == token.DEDENT
+        assert tokens.peek(end - start + 1).string == 'print'
+
+    def test_statement_span(self):
+        tokens = self.get_tokens()
+
+        # The function definition ends with the DEDENT of its body, which
+        # skips over the brackets and nested block inside of it
+        start, end = tokens.statement_span()
+        assert tokens.peek(end - start).type == token.DEDENT
+        assert tokens.peek(end - start + 1).string == 'print'
+
+        tokens.seek(end + 1)
+        start, end = tokens.statement_span()
+        assert tokens.peek(end - start).type == token.NEWLINE
+        assert tokens.peek(end - start + 1).type == token.ENDMARKER
+
+    def test_skip_block(self):
+        tokens = self.get_tokens()
+        tokens.match_seq(*[TokenCase()] * 15)
+
+        assert tokens.skip_block() == [
+            "    if b:\n", "        return [c]\n", "    return None\n"
+        ]
+        assert tokens.peek().string == 'print'
+
+    def test_other_token_stores(self):
+        expected = self.get_tokens()
+        expected.match_seq(*[TokenCase()] * 15)
+        expected_lines = expected.skip_block()
+
+        for tokens in (BufferedTokens(get_tokens_from_string(STRUCTURED_SOURCE), 'structured.py', lookahead=16),
+                       CompactTokens(get_tokens_from_string(STRUCTURED_SOURCE), 'structured.py')):
+            tokens.match_seq(*[TokenCase()] * 15)
+
+            assert tokens.block_span() == expected.block_span(15)
+            assert tokens.skip_block() == expected_lines
+            assert tokens.peek().string == 'print'
+
+
+class TestBufferedTokens:
+    def get_example_tokens(self) -> BufferedTokens:
+        return BufferedTokens(get_tokens_from_file('./tests/units/example.py'),
+                              'example.py', lookahead=2)
+
+    def test_matches_tokens(self):
+        buffered = [(token.type, token.string)
+                    for token in self.get_example_tokens()]
+        listed = [(token.type, token.string) for token in Tokens(
+            tokens_to_list(get_tokens_from_file('./tests/units/example.py')),
+            'example.py')]
+
+        assert buffered == listed
+
+    def test_peek_offset(self):
+        tokens = self.get_example_tokens()
+
+        assert tokens.peek().string == 'for'
+        assert tokens.peek(2).string == 'in'
+
+        # The lookahead is limited to 2
+        with pytest.raises(TokenException):
+            tokens.peek(3)
+
+    def test_previous(self):
+        tokens = self.get_example_tokens()
+        tokens.advance()
+        tokens.advance()
+
+        assert tokens.previous().string == '_'
+
+    def test_bounded_buffer(self):
+        tokens = self.get_example_tokens()
+
+        for _ in tokens:
+            assert len(tokens._buffer) <= 4
+
+        assert tokens.is_at_end()
+        assert tokens.peek(1).type == token.ENDMARKER
+
+    def test_spans_grow_the_buffer(self):
+        tokens = BufferedTokens(
+            get_tokens_from_string("f(a, b, c, d, e)\nx = 1\n"), 'test.py',
+            lookahead=2)
+        tokens.advance()
+
+        # The brackets are further away than the lookahead, but are still found
+        assert tokens.bracket_span() == (1, 11)
+        assert ''.join(tokens.advance().string for _ in range(11)) == '(a,b,c,d,e)'
+
+        with pytest.raises(TokenException):
+            tokens.peek(6)
+
+
+class TestCompactTokens:
+    def test_matches_tokens(self):
+        tokens = Tokens(
+            tokens_to_list(get_tokens_from_file('./tests/units/example.py')),
+            'example.py')
+        compact = CompactTokens(get_tokens_from_file('./tests/units/example.py'),
+                                'example.py')
+
+        assert len(compact) == len(tokens.internal_token)
+
+        for index, expected in enumerate(tokens.internal_token):
+            assert compact._token_at(index) == expected
+
+    def test_multiline_tokens(self):
+        source = 'x = """a\nb"""; y = (1,\n  2)\nif x:\n    z = 1 \\\n      + 2'
+        tokens = Tokens(tokens_to_list(get_tokens_from_string(source)), 'test')
+        compact = CompactTokens(get_tokens_from_string(source), 'test')
+
+        assert [token for token in compact] == tokens.internal_token[:-1]
+
+    def test_find_names(self):
+        compact = CompactTokens(get_tokens_from_file('./tests/units/example.py'),
+                                'example.py')
+
+        indexes = compact.find_names({'print', 'range'})
+
+        assert [compact._token_at(index).string
+                for index in indexes] == ['range', 'print']